@@ -0,0 +1,289 @@
+# benchmark.py
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import sys
+import time
+from cell import Cell, Genome
+from environment import Environment
+from vectorized import VectorizedEnvironment
+import dna
+
+# Average area per cell, roughly what a busy dish of radius 250 looks like
+AREA_PER_CELL = 400.0
+
+
+# Phases of a SimulationEngine tick, in order: those of Environment.update,
+# then the resolve_collisions the engine runs after it
+TICK_PHASES = ('update_cells', 'resolve_contacts', 'generate_food', 'feed_cells', 'resolve_collisions')
+
+BACKENDS = {'object': Environment, 'numpy': VectorizedEnvironment}
+
+
+def make_environment(cell_count, seed=0, environment_class=Environment, food_count=0):
+    random.seed(seed)
+    radius = math.sqrt(max(cell_count, 1) * AREA_PER_CELL / math.pi)
+    environment = environment_class(radius)
+    for _ in range(cell_count):
+        environment.add_cell(Cell(Genome(), environment.random_position()))
+    for _ in range(food_count):
+        environment.food.add(*environment.random_position())
+    return environment
+
+
+def brute_force_contacts(cells):
+    contacts = 0
+    for i, cell in enumerate(cells):
+        for other_cell in cells[i + 1:]:
+            if cell.check_collision(other_cell):
+                contacts += 1
+    return contacts
+
+
+def time_call(func, repeats):
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run_grid_scaling(sizes, repeats, brute_force_limit):
+    print(f"{'cells':>8} {'contacts':>9} {'grid ms':>9} {'us/cell':>8} {'brute ms':>9}")
+    for cell_count in sizes:
+        environment = make_environment(cell_count)
+
+        def grid_pass():
+            environment.grid.rebuild(environment.cells)
+            return environment.grid.contact_pairs()
+
+        contacts = len(grid_pass())
+        grid_time = time_call(grid_pass, repeats)
+
+        brute = "-"
+        if cell_count <= brute_force_limit:
+            brute_time = time_call(lambda: brute_force_contacts(environment.cells), 1)
+            brute = f"{brute_time * 1000:9.1f}"
+
+        print(f"{cell_count:>8} {contacts:>9} {grid_time * 1000:9.1f} "
+              f"{grid_time / cell_count * 1e6:8.2f} {brute:>9}")
+
+
+def run_feeding(sizes, food_count, repeats):
+    print(f"{'cells':>8} {'food':>6} {'feed ms':>9} {'us/cell':>8}")
+    for cell_count in sizes:
+        environment = make_environment(cell_count)
+        positions = [environment.random_position() for _ in range(food_count)]
+
+        def feeding_pass():
+            environment.food.clear()
+            environment.food.extend(positions)
+            start = time.perf_counter()
+            environment.feed_cells()
+            return time.perf_counter() - start
+
+        feed_time = min(feeding_pass() for _ in range(repeats))
+        print(f"{cell_count:>8} {food_count:>6} {feed_time * 1000:9.1f} {feed_time / cell_count * 1e6:8.2f}")
+
+
+def run_backends(sizes, repeats):
+    # Cell update phase only, per-object path against the NumPy backend
+    print(f"{'cells':>8} {'object ms':>10} {'numpy ms':>9} {'speed-up':>9}")
+    for cell_count in sizes:
+        timings = []
+        for environment_class in (Environment, VectorizedEnvironment):
+            best = float('inf')
+            for _ in range(repeats):
+                environment = make_environment(cell_count, environment_class=environment_class)
+                start = time.perf_counter()
+                environment.update_cells(0.1)
+                best = min(best, time.perf_counter() - start)
+            timings.append(best)
+        print(f"{cell_count:>8} {timings[0] * 1000:10.1f} {timings[1] * 1000:9.1f} {timings[0] / timings[1]:8.1f}x")
+
+
+def time_tick_phases(cell_count, food_count, environment_class, repeats, seed):
+    # Each repeat starts from the same seeded dish and times one tick phase by phase
+    best = dict.fromkeys(TICK_PHASES, float('inf'))
+    for _ in range(repeats):
+        environment = make_environment(cell_count, seed, environment_class, food_count)
+        environment.max_food = max(environment.max_food, food_count)
+        environment.current_time += 0.1
+        for phase in TICK_PHASES:
+            method = getattr(environment, phase)
+            args = (0.1,) if phase in ('update_cells', 'generate_food') else ()
+            start = time.perf_counter()
+            method(*args)
+            best[phase] = min(best[phase], time.perf_counter() - start)
+    return best
+
+
+def time_per_call(func, calls, repeats):
+    return time_call(lambda: [func() for _ in range(calls)], repeats) / calls
+
+
+def time_cell_operations(repeats, seed):
+    random.seed(seed)
+    environment = make_environment(200, seed)
+    cells = environment.cells
+    genomes = [cell.genome for cell in cells]
+    for cell in cells:
+        cell.age = 30
+        cell.energy = 60
+
+    def divide():
+        cell = random.choice(cells)
+        cell.energy = 60
+        cell.nitrogen_reserve = 1.0
+        cell.divide()
+
+    def merge():
+        environment.cells = cells[:2]
+        environment.merge_cells(cells[0], cells[1])
+
+    results = {
+        'Cell.divide': time_per_call(divide, 2000, repeats),
+        'Genome.encode_genes': time_per_call(lambda: random.choice(genomes).encode_genes(), 20000, repeats),
+        'Genome.mutate': time_per_call(lambda: random.choice(genomes).copy().mutate(), 5000, repeats),
+        # Per genome, encoding all 200 at once
+        'dna.genome_dna': time_per_call(lambda: dna.genome_dna(environment), 50, repeats) / len(cells),
+    }
+    results['Environment.merge_cells'] = time_per_call(merge, 2000, repeats)
+    return results
+
+
+def time_render(cell_count, food_count, environment_class, repeats, seed):
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PyQt5.QtWidgets import QApplication
+    from renderer import Renderer
+
+    app = QApplication.instance() or QApplication([])
+    environment = make_environment(cell_count, seed, environment_class, food_count)
+    renderer = Renderer(environment)
+    renderer.resize(800, 800)
+    renderer.render()
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        renderer.render()
+        renderer.viewport().repaint()
+        app.processEvents()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run_suite(sizes, food_counts, backend, repeats, seed, render=True, render_limit=10000):
+    environment_class = BACKENDS[backend]
+    results = {}
+    for cell_count in sizes:
+        for food_count in food_counts:
+            scenario = f"{cell_count}c/{food_count}f"
+            phases = time_tick_phases(cell_count, food_count, environment_class, repeats, seed)
+            for phase, seconds in phases.items():
+                results[f"Environment.{phase}/{scenario}"] = seconds
+            results[f"Environment.update/{scenario}"] = sum(phases.values())
+            if render and cell_count <= render_limit:
+                results[f"Renderer.render/{scenario}"] = time_render(
+                    cell_count, food_count, environment_class, repeats, seed)
+            print(f"  {scenario:<14} tick {sum(phases.values()) * 1000:9.2f} ms", file=sys.stderr)
+    results.update(time_cell_operations(repeats, seed))
+    return results
+
+
+def save_results(results, filename, settings):
+    data = {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            **settings,
+        },
+        'results': results,
+    }
+    with open(filename, 'w') as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+
+
+def compare_results(results, baseline, threshold):
+    # Returns the names of benchmarks slower than baseline by more than threshold
+    regressions = []
+    print(f"{'benchmark':<48} {'baseline':>11} {'current':>11} {'change':>8}")
+    for name, seconds in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            print(f"{name:<48} {'-':>11} {seconds * 1000:9.3f}ms {'new':>8}")
+            continue
+        change = seconds / previous - 1 if previous else 0.0
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<48} {previous * 1000:9.3f}ms {seconds * 1000:9.3f}ms {change:+7.1%}{flag}")
+    return regressions
+
+
+def print_results(results):
+    print(f"{'benchmark':<48} {'time':>11}")
+    for name, seconds in results.items():
+        print(f"{name:<48} {seconds * 1000:9.3f}ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulation performance benchmarks")
+    commands = parser.add_subparsers(dest='command')
+
+    suite = commands.add_parser('suite', help="time every phase of seeded scenarios and compare with a baseline")
+    suite.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000, 50000])
+    suite.add_argument('--food', type=int, nargs='+', default=[0, 250, 1000], help="food particles per scenario")
+    suite.add_argument('--backend', choices=sorted(BACKENDS), default='object')
+    suite.add_argument('--repeats', type=int, default=3)
+    suite.add_argument('--seed', type=int, default=0)
+    suite.add_argument('--no-render', action='store_true', help="skip the offscreen Renderer.render benchmarks")
+    suite.add_argument('--render-limit', type=int, default=10000, help="largest population to render")
+    suite.add_argument('--save', help="write the results to this JSON baseline")
+    suite.add_argument('--compare', help="JSON baseline from an earlier run")
+    suite.add_argument('--threshold', type=float, default=0.25, help="allowed slowdown before flagging, 0.25 = 25%%")
+
+    scaling = commands.add_parser('scaling', help="broad-phase, feeding and backend scaling tables")
+    scaling.add_argument('--sizes', type=int, nargs='+', default=[1000, 2000, 5000, 10000, 20000, 50000])
+    scaling.add_argument('--repeats', type=int, default=3)
+    scaling.add_argument('--brute-force-limit', type=int, default=2000)
+    scaling.add_argument('--food', type=int, default=1000)
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'scaling':
+        run_grid_scaling(args.sizes, args.repeats, args.brute_force_limit)
+        print()
+        run_feeding(args.sizes, args.food, args.repeats)
+        print()
+        run_backends(args.sizes, args.repeats)
+        return 0
+
+    if args.command != 'suite':
+        parser.print_help()
+        return 0
+
+    results = run_suite(args.sizes, args.food, args.backend, args.repeats, args.seed,
+                        not args.no_render, args.render_limit)
+    if args.save:
+        save_results(results, args.save, {'backend': args.backend, 'repeats': args.repeats, 'seed': args.seed})
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)['results']
+        regressions = compare_results(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} benchmark(s) regressed by more than {args.threshold:.0%}")
+            return 1
+    else:
+        print_results(results)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,10 +1,59 @@
 import random
 import math
 import uuid
+from collections import namedtuple
+from collections.abc import MutableMapping
+
+# Every gene except size, which changes every tick and is kept per cell. A
+# Traits tuple is immutable, so a genome copied on division shares its
+# parent's until one of them changes a gene (copy on write).
+Traits = namedtuple('Traits', ('speed', 'energy_efficiency', 'division_threshold', 'color', 'has_tail',
+                               'can_consume', 'consumption_size_ratio', 'nitrogen_reserve', 'adhesin',
+                               'radiation_sensitivity'))
+GENE_ORDER = ('size',) + Traits._fields
+MAX_SIZE = 128  # Cell.update keeps size at most this
+
+
+class GenesView(MutableMapping):
+    # The genes of a Genome as a dict, for the editor and the file formats
+    __slots__ = ('genome',)
+
+    def __init__(self, genome):
+        self.genome = genome
+
+    def __getitem__(self, gene):
+        if gene == 'size':
+            return self.genome.size
+        if gene not in Traits._fields:
+            raise KeyError(gene)
+        return getattr(self.genome.traits, gene)
+
+    def __setitem__(self, gene, value):
+        if gene == 'size':
+            self.genome.size = value
+        elif gene in Traits._fields:
+            self.genome.traits = self.genome.traits._replace(**{gene: value})
+        else:
+            raise KeyError(gene)
+
+    def __delitem__(self, gene):
+        raise TypeError("genes cannot be deleted")
+
+    def __iter__(self):
+        return iter(GENE_ORDER)
+
+    def __len__(self):
+        return len(GENE_ORDER)
+
+    def copy(self):
+        return dict(zip(GENE_ORDER, (self.genome.size,) + self.genome.traits))
+
 
 class Genome:
+    __slots__ = ('size', 'traits', 'never_consume')
+
     def __init__(self, genes=None, never_consume=False):
-        self.genes = genes or {
+        genes = genes or {
             'size': random.uniform(5, 20),
             'speed': random.uniform(0.5, 2.0),
             'energy_efficiency': random.uniform(0.5, 1.5),
@@ -17,24 +66,35 @@ class Genome:
             'adhesin': random.choice([True, False]),
             'radiation_sensitivity': random.uniform(0.1, 0.5)
         }
-        self.dna = self.encode_genes()
+        self.size = genes['size']
+        self.traits = Traits(*(genes[gene] for gene in Traits._fields))
         self.never_consume = never_consume
 
+    @property
+    def genes(self):
+        return GenesView(self)
+
+    @property
+    def dna(self):
+        return self.encode_genes()
+
     def encode_genes(self):
+        traits = self.traits
+        color = traits.color
         dna = 0
-        dna |= (int(self.genes['size'] * 10) & 0xFF) << 24
-        dna |= (int(self.genes['speed'] * 10) & 0xFF) << 16
-        dna |= (int(self.genes['energy_efficiency'] * 10) & 0xFF) << 8
-        dna |= (int(self.genes['division_threshold'] * 10) & 0xFF)
-        dna |= (int(self.genes['consumption_size_ratio'] * 10) & 0xFF) << 32
-        dna |= (int(self.genes['color'][0] * 255) & 0xFF) << 40
-        dna |= (int(self.genes['color'][1] * 255) & 0xFF) << 48
-        dna |= (int(self.genes['color'][2] * 255) & 0xFF) << 56
-        dna |= (int(self.genes['has_tail']) & 0x1) << 64
-        dna |= (int(self.genes['can_consume']) & 0x1) << 65
-        dna |= (int(self.genes['nitrogen_reserve'] * 10) & 0xFF) << 72
-        dna |= (int(self.genes['adhesin']) & 0x1) << 80
-        dna |= (int(self.genes['radiation_sensitivity'] * 10) & 0xFF) << 88
+        dna |= (int(self.size * 10) & 0xFF) << 24
+        dna |= (int(traits.speed * 10) & 0xFF) << 16
+        dna |= (int(traits.energy_efficiency * 10) & 0xFF) << 8
+        dna |= (int(traits.division_threshold * 10) & 0xFF)
+        dna |= (int(traits.consumption_size_ratio * 10) & 0xFF) << 32
+        dna |= (int(color[0] * 255) & 0xFF) << 40
+        dna |= (int(color[1] * 255) & 0xFF) << 48
+        dna |= (int(color[2] * 255) & 0xFF) << 56
+        dna |= (int(traits.has_tail) & 0x1) << 64
+        dna |= (int(traits.can_consume) & 0x1) << 65
+        dna |= (int(traits.nitrogen_reserve * 10) & 0xFF) << 72
+        dna |= (int(traits.adhesin) & 0x1) << 80
+        dna |= (int(traits.radiation_sensitivity * 10) & 0xFF) << 88
         return dna
 
     def decode_genes(self, dna):
@@ -55,22 +115,37 @@ class Genome:
         self.genes['radiation_sensitivity'] = ((dna >> 88) & 0xFF) / 10.0
 
     def mutate(self, mutation_rate=0.1):
-        for gene in self.genes:
+        # All changes go into one new Traits tuple; an unmutated genome keeps sharing
+        changes = {}
+        for gene in GENE_ORDER:
             if random.random() < mutation_rate:
-                if isinstance(self.genes[gene], bool):
+                value = self.size if gene == 'size' else getattr(self.traits, gene)
+                if isinstance(value, bool):
                     if gene == 'can_consume' and self.never_consume:
                         continue  # Skip mutation if never_consume is enabled
-                    self.genes[gene] = not self.genes[gene]
-                elif isinstance(self.genes[gene], tuple):
-                    self.genes[gene] = tuple(min(1, max(0, x + random.uniform(-0.1, 0.1))) for x in self.genes[gene])
+                    changes[gene] = not value
+                elif isinstance(value, tuple):
+                    changes[gene] = tuple(min(1, max(0, x + random.uniform(-0.1, 0.1))) for x in value)
                 else:
-                    self.genes[gene] *= random.uniform(0.8, 1.2)
+                    changes[gene] = value * random.uniform(0.8, 1.2)
+        if 'size' in changes:
+            self.size = changes.pop('size')
+        if changes:
+            self.traits = self.traits._replace(**changes)
 
     def copy(self):
-        return Genome(self.genes.copy(), self.never_consume)
+        copied = Genome.__new__(Genome)
+        copied.size = self.size
+        copied.traits = self.traits
+        copied.never_consume = self.never_consume
+        return copied
 
 class Cell:
+    __slots__ = ('id', 'genome', 'position', 'energy', 'age', 'dna', 'angle', 'type', 'nitrogen_reserve', 'adhesin',
+                 'radiation_sensitivity', 'last_eaten', 'adhered_cells', 'colony', 'alive')
+
     def __init__(self, genome, position, dna=None):
+        self.id = uuid.uuid4().int  # Stable identity across snapshots
         self.genome = genome
         self.position = position
         self.energy = 20
@@ -78,31 +153,40 @@ class Cell:
         self.dna = dna or self.genome.encode_genes()
         self.angle = random.uniform(0, 2 * math.pi)
         self.type = "Phagocyte"
-        self.nitrogen_reserve = self.genome.genes['nitrogen_reserve']
-        self.adhesin = self.genome.genes['adhesin']
-        self.radiation_sensitivity = self.genome.genes['radiation_sensitivity']
+        self.nitrogen_reserve = genome.traits.nitrogen_reserve
+        self.adhesin = genome.traits.adhesin
+        self.radiation_sensitivity = genome.traits.radiation_sensitivity
         self.last_eaten = 0  # Track the last time the cell ate
-        self.adhered_cells = []  # List to store adhered cells
+        self.adhered_cells = {}  # Linked cells, as a dict used for an ordered set
+        self.colony = None  # The Colony these links belong to, kept by Environment.colonies
+        self.alive = True  # Cleared on death; the environment sweeps dead cells once per tick
+
+    @property
+    def cell_class(self):
+        # The class that defines this cell's behaviour
+        return type(self)
 
     def update(self, environment, dt):
+        genome = self.genome
+        traits = genome.traits
         self.age += dt
-        self.energy += self.genome.genes['energy_efficiency'] * dt
+        self.energy += traits.energy_efficiency * dt
 
         # Energy consumption based on size
-        energy_consumption = self.genome.genes['size'] * 0.01 * dt
+        energy_consumption = genome.size * 0.01 * dt
         self.energy -= energy_consumption
 
         self.nitrogen_reserve += 0.01 * dt
 
         self.energy -= self.radiation_sensitivity * dt
 
-        if self.genome.genes['has_tail']:
-            speed = self.genome.genes['speed']
+        if traits.has_tail:
+            speed = traits.speed
             dx = math.cos(self.angle) * speed * dt
             dy = math.sin(self.angle) * speed * dt
         else:
-            dx = random.uniform(-1, 1) * self.genome.genes['speed'] * dt
-            dy = random.uniform(-1, 1) * self.genome.genes['speed'] * dt
+            dx = random.uniform(-1, 1) * traits.speed * dt
+            dy = random.uniform(-1, 1) * traits.speed * dt
 
         new_x = self.position[0] + dx
         new_y = self.position[1] + dy
@@ -112,12 +196,12 @@ class Cell:
         energy_loss = distance_moved * 0.1  # Adjust the multiplier as needed
         self.energy -= energy_loss
 
-        self.resolve_boundary_collision(environment)
-
         self.position = (new_x, new_y)
 
+        self.resolve_boundary_collision(environment)
+
         if self.energy <= 0:
-            self.genome.genes['color'] = (0.5, 0.5, 0.5)  # Turn grey
+            genome.genes['color'] = (0.5, 0.5, 0.5)  # Turn grey
             self.die(environment)
 
         # Check for starvation
@@ -125,21 +209,13 @@ class Cell:
             self.die(environment)
 
         # Scale size based on energy
-        self.genome.genes['size'] = max(5, min(128, self.energy * 0.5))
+        genome.size = max(5, min(MAX_SIZE, self.energy * 0.5))
 
         # Cap energy at 100
         self.energy = min(100, self.energy)
 
-        # Energy sharing with adhered cells
-        if self.adhesin and self.adhered_cells:
-            total_energy = self.energy + sum(cell.energy for cell in self.adhered_cells)
-            avg_energy = total_energy / (len(self.adhered_cells) + 1)
-            self.energy = avg_energy
-            for cell in self.adhered_cells:
-                cell.energy = avg_energy
-
     def can_divide(self):
-        return self.age >= 20 and self.energy > self.genome.genes['division_threshold'] and self.nitrogen_reserve >= 0.2
+        return self.age >= 20 and self.energy > self.genome.traits.division_threshold and self.nitrogen_reserve >= 0.2
 
     def divide(self):
         child_genome = self.genome.copy()
@@ -158,43 +234,50 @@ class Cell:
         return child
 
     def can_consume(self, other_cell):
-        if not self.genome.genes['can_consume']:
+        traits = self.genome.traits
+        if not traits.can_consume:
             return False
-        size_ratio = self.genome.genes['size'] / other_cell.genome.genes['size']
-        return size_ratio > self.genome.genes['consumption_size_ratio']
+        size_ratio = self.genome.size / other_cell.genome.size
+        return size_ratio > traits.consumption_size_ratio
 
     def consume(self, other_cell, environment):
         self.energy += other_cell.energy
         self.nitrogen_reserve += other_cell.nitrogen_reserve
-        self.genome.genes['size'] = min(self.genome.genes['size'] + 0.5, 32)  # Increase size slightly, but limit to 32
+        self.genome.size = min(self.genome.size + 0.5, 32)  # Increase size slightly, but limit to 32
         self.last_eaten = environment.current_time  # Update the last eaten time
 
         # Cap energy at 100
         self.energy = min(100, self.energy)
 
     def die(self, environment):
+        if not self.alive:
+            return
         distance = math.sqrt((self.position[0] - environment.center[0]) ** 2 + (self.position[1] - environment.center[1]) ** 2)
         if distance <= environment.radius:
-            environment.food.append((self.position[0], self.position[1]))
+            if environment.nutrients is not None:
+                environment.nutrients.deposit([self.position[0]], [self.position[1]])
+            else:
+                environment.food.add(self.position[0], self.position[1])
         environment.remove_cell(self)
 
+    # The link itself only; Environment.colonies.join/separate keep colonies in step
     def adhere_to(self, other_cell):
         if self.adhesin and other_cell.adhesin and other_cell not in self.adhered_cells:
-            self.adhered_cells.append(other_cell)
-            other_cell.adhered_cells.append(self)
+            self.adhered_cells[other_cell] = None
+            other_cell.adhered_cells[self] = None
 
     def separate_from(self, other_cell):
         if other_cell in self.adhered_cells:
-            self.adhered_cells.remove(other_cell)
-            other_cell.adhered_cells.remove(self)
+            del self.adhered_cells[other_cell]
+            del other_cell.adhered_cells[self]
 
     def check_collision(self, other_cell):
         distance = math.sqrt((self.position[0] - other_cell.position[0]) ** 2 + (self.position[1] - other_cell.position[1]) ** 2)
-        return distance < (self.genome.genes['size'] + other_cell.genome.genes['size']) / 2
+        return distance < (self.genome.size + other_cell.genome.size) / 2
 
     def resolve_collision(self, other_cell):
         distance = math.sqrt((self.position[0] - other_cell.position[0]) ** 2 + (self.position[1] - other_cell.position[1]) ** 2)
-        overlap = (self.genome.genes['size'] + other_cell.genome.genes['size']) / 2 - distance
+        overlap = (self.genome.size + other_cell.genome.size) / 2 - distance
         if overlap > 0:
             angle = math.atan2(other_cell.position[1] - self.position[1], other_cell.position[0] - self.position[0])
             self.position = (
@@ -207,14 +290,17 @@ class Cell:
             )
 
     def resolve_boundary_collision(self, environment):
+        size = self.genome.size
         distance = math.sqrt((self.position[0] - environment.center[0]) ** 2 + (self.position[1] - environment.center[1]) ** 2)
-        if distance > environment.radius - self.genome.genes['size'] / 2:
+        if distance > environment.radius - size / 2:
             angle = math.atan2(environment.center[1] - self.position[1], environment.center[0] - self.position[0])
-            new_x = environment.center[0] + math.cos(angle) * (environment.radius - self.genome.genes['size'] / 2)
-            new_y = environment.center[1] + math.sin(angle) * (environment.radius - self.genome.genes['size'] / 2)
+            new_x = environment.center[0] + math.cos(angle) * (environment.radius - size / 2)
+            new_y = environment.center[1] + math.sin(angle) * (environment.radius - size / 2)
             self.position = (new_x, new_y)
 
 class Bacteria(Cell):
+    __slots__ = ()
+
     def __init__(self, genome, position, dna=None):
         super().__init__(genome, position, dna)
         self.type = "Bacteria"
@@ -231,6 +317,8 @@ class Bacteria(Cell):
         self.energy = min(100, self.energy)
 
 class Phagocyte(Cell):
+    __slots__ = ()
+
     def __init__(self, genome, position, dna=None):
         super().__init__(genome, position, dna)
         self.type = "Phagocyte"
@@ -239,6 +327,8 @@ class Phagocyte(Cell):
         super().update(environment, dt)
 
 class Photocyte(Cell):
+    __slots__ = ()
+
     def __init__(self, genome, position, dna=None):
         super().__init__(genome, position, dna)
         self.type = "Photocyte"
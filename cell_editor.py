@@ -4,7 +4,9 @@ from PyQt5.QtGui import QColor
 from PyQt5.QtCore import pyqtSignal, QTimer
 
 class CellEditor(QWidget):
-    cell_updated = pyqtSignal(object)
+    # The editor shows a snapshot of a cell and never changes it: edits go out as
+    # (cell, changed genes, never_consume or None) for the simulation to apply
+    cell_updated = pyqtSignal(object, dict, object)
 
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -95,45 +97,42 @@ class CellEditor(QWidget):
             self.energy_label.clear()
             self.apply_button.setEnabled(False)
 
+    def refresh(self, cell):
+        # A newer snapshot of the cell being shown; only the live readouts follow it
+        self.cell = cell
+
     def apply_changes(self):
         if self.cell:
-            for gene, input_field in self.gene_inputs.items():
-                self.cell.genome.genes[gene] = float(input_field.text())
-            self.cell.genome.never_consume = self.never_consume_checkbox.isChecked()
-            self.cell_updated.emit(self.cell)
+            genes = {gene: float(input_field.text()) for gene, input_field in self.gene_inputs.items()}
+            self.cell_updated.emit(self.cell, genes, self.never_consume_checkbox.isChecked())
 
     def change_color(self):
         if self.cell:
             color = QColorDialog.getColor()
             if color.isValid():
-                self.cell.genome.genes['color'] = (color.redF(), color.greenF(), color.blueF())
                 self.color_button.setStyleSheet(f"background-color: {color.name()}")
-                self.cell_updated.emit(self.cell)
+                self.cell_updated.emit(self.cell, {'color': (color.redF(), color.greenF(), color.blueF())}, None)
 
     def update_has_tail(self, state):
         if self.cell:
-            self.cell.genome.genes['has_tail'] = bool(state)
-            self.cell_updated.emit(self.cell)
+            self.cell_updated.emit(self.cell, {'has_tail': bool(state)}, None)
 
     def update_can_consume(self, state):
         if self.cell:
-            self.cell.genome.genes['can_consume'] = bool(state)
-            self.cell_updated.emit(self.cell)
+            self.cell_updated.emit(self.cell, {'can_consume': bool(state)}, None)
 
     def update_adhesin(self, state):
         if self.cell:
-            self.cell.genome.genes['adhesin'] = bool(state)
-            self.cell_updated.emit(self.cell)
+            self.cell_updated.emit(self.cell, {'adhesin': bool(state)}, None)
 
     def update_never_consume(self, state):
         if self.cell:
             if state == 2:  # Checked
                 self.can_consume_checkbox.setEnabled(False)
-                self.cell.genome.never_consume = True
+                self.cell_updated.emit(self.cell, {}, True)
             else:
                 self.can_consume_checkbox.setEnabled(True)
-                self.cell.genome.never_consume = False
-            self.cell_updated.emit(self.cell)
+                self.cell_updated.emit(self.cell, {}, False)
 
     def update_energy_label(self):
         if self.cell:
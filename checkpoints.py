@@ -0,0 +1,84 @@
+# checkpoints.py
+import random
+
+CELL_BYTES = 700  # Rough size of one checkpointed cell of the object backend
+VIEW_BYTES = 150  # The same for the Python side of a numpy backend cell
+FOOD_BYTES = 80
+
+
+class Checkpoint:
+    # The state of an engine after some tick: the environment's own checkpoint
+    # plus the state of `random`, so a restored run continues exactly as before,
+    # and a copy of the nutrient field if the environment has one
+    def __init__(self, tick, state, random_state, nbytes, nutrients=None):
+        self.tick = tick
+        self.state = state
+        self.random_state = random_state
+        self.nbytes = nbytes
+        self.nutrients = nutrients
+
+
+class CheckpointRing:
+    # Checkpoints taken every `interval` ticks, newest last. When they outgrow
+    # `budget` bytes, older ones are thinned out: the one removed is where the
+    # gap it leaves is smallest compared to its age, so spacing grows with age
+    # and a long run keeps a few far-back checkpoints as well as dense recent ones.
+    def __init__(self, interval=10, budget=64 * 2 ** 20):
+        self.interval = interval
+        self.budget = budget
+        self.checkpoints = []
+        self.nbytes = 0
+
+    def __len__(self):
+        return len(self.checkpoints)
+
+    def ticks(self):
+        return [checkpoint.tick for checkpoint in self.checkpoints]
+
+    def due(self, tick):
+        return tick % self.interval == 0
+
+    def take(self, tick, environment):
+        state = environment.checkpoint()
+        nbytes = environment.checkpoint_size(state)
+        nutrients = environment.nutrients
+        if nutrients is not None:
+            nutrients = nutrients.copy()
+            nbytes += nutrients.grid.nbytes
+        self.add(Checkpoint(tick, state, random.getstate(), nbytes, nutrients))
+
+    def add(self, checkpoint):
+        self.discard_after(checkpoint.tick - 1)
+        self.checkpoints.append(checkpoint)
+        self.nbytes += checkpoint.nbytes
+        while self.nbytes > self.budget and len(self.checkpoints) > 1:
+            self.remove(self.thinning_candidate(checkpoint.tick))
+
+    def thinning_candidate(self, now):
+        checkpoints = self.checkpoints
+        if len(checkpoints) < 3:
+            return 0
+        best = None
+        best_score = None
+        for index in range(1, len(checkpoints) - 1):
+            gap = checkpoints[index + 1].tick - checkpoints[index - 1].tick
+            score = gap / (now - checkpoints[index].tick)
+            if best_score is None or score < best_score:
+                best = index
+                best_score = score
+        return best
+
+    def remove(self, index):
+        self.nbytes -= self.checkpoints.pop(index).nbytes
+
+    def discard_after(self, tick):
+        # Checkpoints of a future that was rewound away
+        while self.checkpoints and self.checkpoints[-1].tick > tick:
+            self.remove(len(self.checkpoints) - 1)
+
+    def latest(self, tick):
+        # The newest checkpoint taken at or before tick
+        for checkpoint in reversed(self.checkpoints):
+            if checkpoint.tick <= tick:
+                return checkpoint
+        return None
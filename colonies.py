@@ -0,0 +1,178 @@
+# colonies.py
+import math
+
+
+class Colony:
+    # Cells held together by adhesion links, directly or through each other.
+    # Members share their energy equally; energy is the pooled total as of the
+    # last pool or change of membership.
+    __slots__ = ('members', 'energy')
+
+    def __init__(self):
+        self.members = {}  # Cell -> None, a set that keeps its order
+        self.energy = 0.0
+
+    def __len__(self):
+        return len(self.members)
+
+    def add(self, cell):
+        self.members[cell] = None
+        cell.colony = self
+        self.energy += cell.energy
+
+
+class Colonies:
+    # Every colony of one environment, a disjoint-set of its linked cells. A
+    # cell's colony is cell.colony, None while it has no links, so finding it
+    # is O(1). Joining two colonies moves the members of the smaller into the
+    # larger one. Cutting a link or detaching a cell only searches the colony
+    # it belonged to for the parts that fell apart.
+    def __init__(self):
+        self.colonies = {}  # Colony -> None
+
+    def __len__(self):
+        return len(self.colonies)
+
+    def __iter__(self):
+        return iter(self.colonies)
+
+    def register(self, cell):
+        # A cell that arrived with its colony, e.g. moved in from another environment
+        if cell.colony is not None:
+            self.colonies[cell.colony] = None
+
+    def join(self, cell, other_cell):
+        # Links two adhesin cells. Returns False if they cannot or already are.
+        if cell is other_cell or not (cell.adhesin and other_cell.adhesin) or other_cell in cell.adhered_cells:
+            return False
+        cell.adhere_to(other_cell)
+        colony = cell.colony
+        other = other_cell.colony
+        if colony is None and other is None:
+            colony = Colony()
+            self.colonies[colony] = None
+            colony.add(cell)
+            colony.add(other_cell)
+        elif colony is None:
+            other.add(cell)
+        elif other is None:
+            colony.add(other_cell)
+        elif colony is not other:
+            if len(colony) < len(other):
+                colony, other = other, colony
+            for member in other.members:
+                colony.members[member] = None
+                member.colony = colony
+            colony.energy += other.energy
+            del self.colonies[other]
+        return True
+
+    def separate(self, cell, other_cell):
+        if other_cell not in cell.adhered_cells:
+            return False
+        cell.separate_from(other_cell)
+        self._split(cell.colony, (cell, other_cell))
+        return True
+
+    def detach(self, cell):
+        # Cuts all of a cell's links and takes it out of its colony, e.g. when it
+        # dies, so no energy is pooled with it any more
+        colony = cell.colony
+        if colony is None:
+            return
+        partners = list(cell.adhered_cells)
+        for other_cell in partners:
+            cell.separate_from(other_cell)
+        del colony.members[cell]
+        cell.colony = None
+        colony.energy -= cell.energy
+        self._split(colony, partners)
+
+    def _split(self, colony, cells):
+        # Some links inside colony were cut next to cells: find the connected
+        # parts. The largest keeps the colony; the others become new colonies
+        # and cells left without links leave.
+        label = {}
+        parts = []
+        for start in cells:
+            if start in label or start.colony is not colony:
+                continue
+            label[start] = len(parts)
+            stack = [start]
+            size = 0
+            while stack:
+                member = stack.pop()
+                size += 1
+                for other_cell in member.adhered_cells:
+                    if other_cell not in label:
+                        label[other_cell] = len(parts)
+                        stack.append(other_cell)
+            parts.append(size)
+            if size == len(colony) and size > 1:
+                return  # Still in one piece
+
+        largest = max(range(len(parts)), key=parts.__getitem__, default=None)
+        split = [Colony() if size > 1 and part != largest else None for part, size in enumerate(parts)]
+        members = colony.members
+        colony.members = {}
+        colony.energy = 0.0
+        for member in members:
+            part = label.get(member)
+            if part == largest and parts[part] > 1:
+                colony.add(member)
+            elif part is not None and split[part] is not None:
+                split[part].add(member)
+            else:
+                member.colony = None
+        for new_colony in split:
+            if new_colony is not None:
+                self.colonies[new_colony] = None
+        if not colony.members:
+            del self.colonies[colony]
+
+    def rebuild(self, cells):
+        # Colonies from the links of cells, e.g. after restoring a checkpoint
+        self.colonies = {}
+        for cell in cells:
+            cell.colony = None
+        for cell in cells:
+            if cell.colony is not None or not cell.adhered_cells:
+                continue
+            colony = Colony()
+            self.colonies[colony] = None
+            stack = [cell]
+            colony.add(cell)
+            while stack:
+                member = stack.pop()
+                for other_cell in member.adhered_cells:
+                    if other_cell.colony is not colony:
+                        colony.add(other_cell)
+                        stack.append(other_cell)
+
+    def pool(self):
+        # Every member ends up with an equal share of its colony's energy. fsum
+        # is exact, so the share does not depend on the order of the members,
+        # which restoring a checkpoint does not keep
+        for colony in self.colonies:
+            members = colony.members
+            total = math.fsum(cell.energy for cell in members)
+            share = total / len(members)
+            for cell in members:
+                cell.energy = share
+            colony.energy = total
+
+    def pool_column(self, energy):
+        # The same for cells whose energy lives in a column indexed by _slot
+        for colony in self.colonies:
+            slots = [cell._slot for cell in colony.members]
+            total = math.fsum(energy[slots].tolist())
+            energy[slots] = total / len(slots)
+            colony.energy = total
+
+    def summary(self):
+        sizes = [len(colony) for colony in self.colonies]
+        return {
+            'colonies': len(sizes),
+            'colonised_cells': sum(sizes),
+            'largest_colony': max(sizes, default=0),
+        }
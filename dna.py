@@ -0,0 +1,189 @@
+# dna.py
+import numpy as np
+from vectorized import VectorizedEnvironment
+
+# Population-wide version of Genome.encode_genes/decode_genes. A DNA value is 96
+# bits; as an array it is a DNA_DTYPE record holding bits 0-63 in lo and 64-95
+# in hi. Every field is (name, first bit, width, scale) and stores
+# int(value * scale), exactly as encode_genes does.
+FIELDS = (
+    ('division_threshold', 0, 8, 10),
+    ('energy_efficiency', 8, 8, 10),
+    ('speed', 16, 8, 10),
+    ('size', 24, 8, 10),
+    ('consumption_size_ratio', 32, 8, 10),
+    ('color_r', 40, 8, 255),
+    ('color_g', 48, 8, 255),
+    ('color_b', 56, 8, 255),
+    ('has_tail', 64, 1, 1),
+    ('can_consume', 65, 1, 1),
+    ('nitrogen_reserve', 72, 8, 10),
+    ('adhesin', 80, 1, 1),
+    ('radiation_sensitivity', 88, 8, 10),
+)
+DNA_DTYPE = np.dtype([('lo', '<u8'), ('hi', '<u4')])
+GENE_DTYPE = np.dtype([(name, np.uint8 if width == 1 else np.float64) for name, _, width, _ in FIELDS])
+LOW_BITS = (1 << 64) - 1
+FLAGS = ('has_tail', 'can_consume', 'adhesin')
+COLOR_CHANNELS = ('color_r', 'color_g', 'color_b')
+
+
+def _popcount(words):
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(words)
+    # NumPy before 2.0: count the bits of every byte with a table
+    table = np.array([bin(byte).count('1') for byte in range(256)], np.uint8)
+    return table[words.view(np.uint8).reshape(words.shape + (words.itemsize,))].sum(axis=-1)
+
+
+def encode(genes):
+    # genes maps every gene name of FIELDS (color as a (n, 3) 'color' array) to
+    # an array of values; returns one DNA record per row
+    count = len(genes['size'])
+    dna = np.zeros(count, DNA_DTYPE)
+    color = np.asarray(genes['color'], np.float64).reshape(count, 3)
+    for name, shift, width, scale in FIELDS:
+        if name in COLOR_CHANNELS:
+            values = color[:, COLOR_CHANNELS.index(name)]
+        else:
+            values = np.asarray(genes[name], np.float64)
+        code = (values * scale).astype(np.int64) & ((1 << width) - 1)
+        if shift < 64:
+            dna['lo'] |= code.astype(np.uint64) << np.uint64(shift)
+        else:
+            dna['hi'] |= code.astype(np.uint32) << np.uint32(shift - 64)
+    return dna
+
+
+def decode(dna):
+    # Gene values as decode_genes reads them back, one GENE_DTYPE record per DNA
+    genes = np.zeros(len(dna), GENE_DTYPE)
+    for name, shift, width, scale in FIELDS:
+        if shift < 64:
+            code = (dna['lo'] >> np.uint64(shift)) & np.uint64((1 << width) - 1)
+        else:
+            code = (dna['hi'] >> np.uint32(shift - 64)) & np.uint32((1 << width) - 1)
+        genes[name] = code if width == 1 else code / float(scale)
+    return genes
+
+
+def from_ints(values):
+    values = list(values)
+    dna = np.zeros(len(values), DNA_DTYPE)
+    dna['lo'] = np.fromiter((value & LOW_BITS for value in values), np.uint64, len(values))
+    dna['hi'] = np.fromiter((value >> 64 for value in values), np.uint32, len(values))
+    return dna
+
+
+def to_ints(dna):
+    return [low | high << 64 for low, high in zip(dna['lo'].tolist(), dna['hi'].tolist())]
+
+
+def field_mask(*names):
+    # A DNA record with the bits of the named fields set
+    mask = np.zeros((), DNA_DTYPE)
+    for name, shift, width, _ in FIELDS:
+        if name in names:
+            bits = (1 << width) - 1
+            if shift < 64:
+                mask['lo'] |= np.uint64(bits << shift)
+            else:
+                mask['hi'] |= np.uint32(bits << (shift - 64))
+    return mask
+
+
+def without(dna, *names):
+    # Clears the named fields, e.g. without(dna, 'size') to compare genotypes
+    # regardless of size, which follows a cell's energy every tick
+    mask = field_mask(*names)
+    cleared = dna.copy()
+    cleared['lo'] &= ~mask['lo']
+    cleared['hi'] &= ~mask['hi']
+    return cleared
+
+
+def gene_columns(environment):
+    # Every living cell's genes as arrays, read from the columns of the numpy backend
+    if isinstance(environment, VectorizedEnvironment):
+        v = environment.store.view
+        genes = {name: v('gene_' + name) for name, _, _, _ in FIELDS if name not in COLOR_CHANNELS}
+        genes['color'] = v('gene_color')
+        return genes
+    genomes = [cell.genome for cell in environment.cells]
+    count = len(genomes)
+    traits = list(zip(*(genome.traits for genome in genomes))) or [()] * 10
+    genes = dict(zip(('speed', 'energy_efficiency', 'division_threshold', 'color', 'has_tail', 'can_consume',
+                      'consumption_size_ratio', 'nitrogen_reserve', 'adhesin', 'radiation_sensitivity'), traits))
+    genes['size'] = np.fromiter((genome.size for genome in genomes), np.float64, count)
+    genes['color'] = np.array(genes['color'], np.float64).reshape(count, 3)
+    return genes
+
+
+def genome_dna(environment):
+    # Genome.encode_genes of every living cell, in environment.cells order
+    return encode(gene_columns(environment))
+
+
+def cell_dna(environment):
+    # The dna attribute of every living cell (what the DNA viewer shows)
+    return from_ints(cell.dna for cell in environment.cells)
+
+
+def popcount(dna):
+    return _popcount(dna['lo']).astype(np.int64) + _popcount(dna['hi'])
+
+
+def hamming(dna, other):
+    # Bits that differ, elementwise; other may be a single record
+    return _popcount(dna['lo'] ^ other['lo']).astype(np.int64) + _popcount(dna['hi'] ^ other['hi'])
+
+
+def distance_matrix(dna, other=None, block=4096):
+    # Pairwise Hamming distances, computed in blocks of rows to bound memory
+    other = dna if other is None else other
+    distances = np.empty((len(dna), len(other)), np.uint8)
+    for start in range(0, len(dna), block):
+        rows = dna[start:start + block, None]
+        distances[start:start + block] = hamming(rows, other[None, :])
+    return distances
+
+
+class GenotypeTable:
+    # Intern table of a population's DNA: every distinct value once, with the
+    # number of living carriers, and the index of each cell's value
+    def __init__(self, dna):
+        self.dna, self.ids, self.counts = np.unique(dna, return_inverse=True, return_counts=True)
+        self.ids = self.ids.reshape(-1)
+        self.index = None
+
+    def __len__(self):
+        return len(self.dna)
+
+    def count(self, value):
+        # Carriers of one DNA value, given as an int
+        if self.index is None:
+            self.index = {value: i for i, value in enumerate(to_ints(self.dna))}
+        i = self.index.get(value)
+        return 0 if i is None else int(self.counts[i])
+
+    def most_common(self, n=None):
+        order = np.argsort(-self.counts, kind='stable')[:n]
+        return [(value, int(count)) for value, count in zip(to_ints(self.dna[order]), self.counts[order])]
+
+    def within(self, value, max_distance):
+        # Indices of the distinct values at most max_distance bits from value
+        reference = from_ints([value])[0]
+        return np.flatnonzero(hamming(self.dna, reference) <= max_distance)
+
+    def clusters(self, max_distance):
+        # Leader clustering: the most common unassigned genotype claims every
+        # unassigned one within max_distance bits. Returns a cluster label per
+        # distinct value; table.clusters(d)[table.ids] labels every cell.
+        labels = np.full(len(self.dna), -1, np.int64)
+        for leader in np.argsort(-self.counts, kind='stable'):
+            if labels[leader] >= 0:
+                continue
+            unassigned = np.flatnonzero(labels < 0)
+            close = unassigned[hamming(self.dna[unassigned], self.dna[leader]) <= max_distance]
+            labels[close] = labels.max() + 1
+        return labels
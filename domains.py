@@ -0,0 +1,309 @@
+# domains.py
+import bisect
+import copy
+import math
+import multiprocessing
+import random
+from cell import MAX_SIZE
+from environment import Environment
+import food_sources
+from spatial_grid import SpatialGrid
+
+# Strips must be at least twice the halo wide, or a cell could lie both in a
+# strip's right-edge band and in its left-edge halo and be resolved twice in a
+# tick. The halo is the largest cell size, at most MAX_SIZE. A cell is only
+# larger between merging (or being loaded that large) and its next update;
+# until then it may miss a contact across a boundary.
+MIN_SECTOR_WIDTH = 2 * MAX_SIZE
+
+# One tick of a partitioned dish, using the phases of Environment.update:
+#   advance   every sector adds the food the coordinator generated for it, runs
+#             Environment.update (movement, contacts, feeding) and
+#             resolve_collisions on its own cells, and hands over cells that
+#             left its strip
+#   exchange  sectors take in their immigrants and send the cells close to
+#             their left edge (the halo) to the left neighbour
+#   interact  each sector resolves contacts and collisions between its own
+#             cells and the halo of its right neighbour, so every pair across
+#             a boundary is handled exactly once, in grid order
+#   apply     the right neighbour takes over the results for its halo cells
+#
+# Each sector draws from `random` seeded by (seed, sector, tick, phase), so a run
+# only depends on the seed and the number of sectors. It is not identical to a
+# single-process run: contacts across a boundary are resolved after those inside
+# the strips, cells only eat food in their own strip, adhesion does not reach
+# across strips, and food is generated by the coordinator.
+
+
+class Sector:
+    # The part of the dish owned by one worker process: the cells and food whose
+    # x coordinate lies in [left, right)
+    def __init__(self, index, left, right, environment, seed):
+        self.index = index
+        self.left = left
+        self.right = right
+        self.seed = seed
+        self.tick = 0
+        self.environment = Environment(environment.radius)
+        self.environment.current_time = environment.current_time
+        self.environment.max_food = environment.max_food
+        self.environment.starvation_threshold = environment.starvation_threshold
+
+    def seed_random(self, phase):
+        random.seed(f"{self.seed}:{self.index}:{self.tick}:{phase}")
+
+    def owns(self, x):
+        return self.left <= x < self.right
+
+    def advance(self, dt, food, allow_merge):
+        environment = self.environment
+        self.tick += 1
+        self.seed_random('advance')
+        for x, y in food:
+            environment.food.add(x, y)
+        environment.update(dt, False, allow_merge)
+        environment.resolve_collisions()
+
+        emigrants = [cell for cell in environment.cells if not self.owns(cell.position[0])]
+        if emigrants:
+            environment.cells = [cell for cell in environment.cells if self.owns(cell.position[0])]
+            for cell in emigrants:
+                environment.colonies.detach(cell)
+                environment.stats.remove(cell.id)
+        largest = max((cell.genome.genes['size'] for cell in environment.cells), default=0)
+        return emigrants, largest
+
+    def exchange(self, immigrants, halo):
+        for cell in immigrants:
+            self.environment.add_cell(cell)
+        edge = self.left + halo
+        return [ghost(cell) for cell in self.environment.cells if cell.position[0] < edge]
+
+    def interact(self, ghosts, halo, allow_merge):
+        # ghosts are copies of the right neighbour's cells within halo of our edge
+        environment = self.environment
+        edge = self.right - halo
+        band = [cell for cell in environment.cells if cell.position[0] >= edge]
+        if not (band and ghosts):
+            return []
+        self.seed_random('interact')
+
+        grid = SpatialGrid()
+        grid.rebuild(band + ghosts)
+        cells = grid.items
+        owned = len(band)
+        crossing = [(i, j) for i, j in grid.contact_pairs() if i < owned <= j]
+        if not crossing:
+            return []
+
+        stats = environment.stats
+        eaten = set()
+        environment.updating = True
+        try:
+            for i, j in crossing:
+                consumed = stats.consumed
+                environment.resolve_contact(cells[i], cells[j], allow_merge)
+                if not cells[j].alive and stats.consumed > consumed:
+                    eaten.add(cells[j].id)
+        finally:
+            environment.updating = False
+            environment.sweep()
+        # A ghost's death is counted by the neighbour that owns it, in apply
+        stats.deaths -= sum(not cell.alive for cell in ghosts)
+        stats.consumed -= len(eaten)
+        for i, j in crossing:
+            if cells[i].alive and cells[j].alive:
+                cells[i].resolve_collision(cells[j])
+
+        return [(cell.id, cell.alive, cell.id in eaten, cell.position, cell.energy, cell.nitrogen_reserve,
+                 cell.last_eaten, cell.genome.genes['size']) for cell in ghosts]
+
+    def apply(self, updates):
+        environment = self.environment
+        if updates:
+            cells = {cell.id: cell for cell in environment.cells}
+            environment.updating = True
+            try:
+                for cell_id, alive, eaten, position, energy, nitrogen_reserve, last_eaten, size in updates:
+                    cell = cells.get(cell_id)
+                    if cell is None:
+                        continue  # Died or left since the neighbour copied it
+                    if not alive:
+                        environment.remove_cell(cell)
+                        environment.stats.consumed += eaten
+                        continue
+                    cell.position = position
+                    cell.energy = energy
+                    cell.nitrogen_reserve = nitrogen_reserve
+                    cell.last_eaten = last_eaten
+                    cell.genome.genes['size'] = size
+                    cell.resolve_boundary_collision(environment)
+            finally:
+                environment.updating = False
+                environment.sweep()
+        return len(environment.cells), len(environment.food)
+
+    def state(self):
+        environment = self.environment
+        stats = environment.stats
+        return environment.cells, list(environment.food), (stats.births, stats.deaths, stats.consumed, stats.merges)
+
+
+def ghost(cell):
+    # A copy that can be sent to another process without its adhesion network;
+    # it cannot adhere either, as links do not reach across strips
+    copied = copy.copy(cell)
+    copied.adhered_cells = {}
+    copied.colony = None
+    copied.adhesin = False
+    return copied
+
+
+def _serve(connection, sector):
+    while True:
+        command, args = connection.recv()
+        if command == 'close':
+            break
+        connection.send(getattr(sector, command)(*args))
+    connection.close()
+
+
+class PartitionedSimulation:
+    # Steps one environment split into vertical strips, one worker process per
+    # strip. It takes the place of SimulationEngine for headless runs; the
+    # environment it was built from is not updated, use gather() for the result.
+    def __init__(self, environment, sectors, seed=0, time_step=0.1):
+        width = 2 * environment.radius / sectors
+        if sectors < 1 or width < MIN_SECTOR_WIDTH:
+            raise ValueError(f"a dish of radius {environment.radius} can be split into at most "
+                             f"{max(1, int(2 * environment.radius // MIN_SECTOR_WIDTH))} sectors")
+        if environment.nutrients is not None:
+            raise ValueError("a nutrient field cannot be split into sectors")
+        self.time_step = time_step
+        self.width = width
+        self.radius = environment.radius
+        self.center = environment.center
+        self.current_time = environment.current_time
+        self.food_generation_rate = environment.food_generation_rate
+        self.max_food = environment.max_food
+        self.food_sources = environment.food_sources
+        self.starvation_threshold = environment.starvation_threshold
+        self.rng = random.Random(seed)  # Food generation
+        left = self.center[0] - self.radius
+        self.edges = [left + k * width for k in range(1, sectors)]
+        bounds = list(zip([-math.inf] + self.edges, self.edges + [math.inf]))
+
+        parts = [Sector(index, low, high, environment, seed) for index, (low, high) in enumerate(bounds)]
+        for cell in environment.cells:
+            for other_cell in list(cell.adhered_cells):
+                if self.sector_of(other_cell.position[0]) != self.sector_of(cell.position[0]):
+                    environment.colonies.separate(cell, other_cell)
+        for cell in environment.cells:
+            parts[self.sector_of(cell.position[0])].environment.add_cell(cell)
+        for x, y in environment.food:
+            parts[self.sector_of(x)].environment.food.add(x, y)
+        self.cell_total = len(environment.cells)
+        self.food_total = len(environment.food)
+
+        context = multiprocessing.get_context()
+        self.connections = []
+        self.processes = []
+        for sector in parts:
+            connection, child = context.Pipe()
+            process = context.Process(target=_serve, args=(child, sector), daemon=True)
+            process.start()
+            child.close()
+            self.connections.append(connection)
+            self.processes.append(process)
+
+    def sector_of(self, x):
+        return bisect.bisect_right(self.edges, x)
+
+    def call(self, command, args):
+        # Sends one command to every sector with its own arguments, then waits for all replies
+        for connection, sector_args in zip(self.connections, args):
+            connection.send((command, sector_args))
+        return [connection.recv() for connection in self.connections]
+
+    def generate_food(self, dt):
+        # Same sources as Environment.generate_food, drawn from the coordinator's generator
+        xs, ys = food_sources.generate(self.food_sources, self.rng, self, dt, self.max_food - self.food_total)
+        return list(zip(xs, ys))
+
+    def update(self, generate_food=True, allow_merge=False):
+        dt = self.time_step
+        self.current_time += dt
+        count = len(self.connections)
+
+        food = [[] for _ in range(count)]
+        if generate_food:
+            for x, y in self.generate_food(dt):
+                food[self.sector_of(x)].append((x, y))
+
+        advanced = self.call('advance', [(dt, food[k], allow_merge) for k in range(count)])
+        immigrants = [[] for _ in range(count)]
+        halo = 0
+        for emigrants, largest in advanced:
+            halo = max(halo, largest)
+            for cell in emigrants:
+                immigrants[self.sector_of(cell.position[0])].append(cell)
+                halo = max(halo, cell.genome.genes['size'])
+
+        # Two cells touch when they are closer than the mean of their sizes, so
+        # the largest size is a wide enough halo
+        halo = min(halo, MAX_SIZE)
+        ghosts = self.call('exchange', [(immigrants[k], halo) for k in range(count)])
+        updates = self.call('interact', [(ghosts[k + 1] if k + 1 < count else [], halo, allow_merge)
+                                         for k in range(count)])
+        counts = self.call('apply', [(updates[k - 1] if k else [],) for k in range(count)])
+        self.cell_total = sum(cells for cells, _ in counts)
+        self.food_total = sum(food for _, food in counts)
+
+    def run_ticks(self, ticks, generate_food=True, allow_merge=False, callback=None):
+        # Same contract as SimulationEngine.run_ticks
+        cell_updates = 0
+        tick = 0
+        while tick < ticks:
+            cell_updates += self.cell_total
+            self.update(generate_food, allow_merge)
+            tick += 1
+            if callback and callback(tick, cell_updates) is False:
+                break
+        return tick, cell_updates
+
+    def counts(self):
+        return self.cell_total, self.food_total
+
+    def gather(self):
+        # A single Environment holding the current state of every sector
+        environment = Environment(self.radius)
+        environment.current_time = self.current_time
+        environment.food_generation_rate = self.food_generation_rate
+        environment.max_food = self.max_food
+        environment.food_sources = self.food_sources
+        environment.starvation_threshold = self.starvation_threshold
+        stats = environment.stats
+        for cells, food, (births, deaths, consumed, merges) in self.call('state', [()] * len(self.connections)):
+            for cell in cells:
+                environment.add_cell(cell)
+            environment.food.extend(food)
+            stats.births += births
+            stats.deaths += deaths
+            stats.consumed += consumed
+            stats.merges += merges
+        return environment
+
+    def close(self):
+        for connection in self.connections:
+            connection.send(('close', ()))
+            connection.close()
+        for process in self.processes:
+            process.join()
+        self.connections = []
+        self.processes = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,160 @@
+# ensemble.py
+import argparse
+import json
+import multiprocessing
+import queue
+import random
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from simulation import SimulationEngine
+import headless
+
+SUMMARY_GENES = ('size', 'speed', 'energy_efficiency', 'division_threshold', 'consumption_size_ratio',
+                 'nitrogen_reserve', 'radiation_sensitivity')
+FLUSH_INTERVAL = 0.2  # Seconds a worker may hold statistics before sending them to the parent
+
+_stats_queue = None  # Set in every pool process by _init_worker
+
+
+def summarize(environment, tick):
+    cells = environment.cells
+    genes = {gene: 0.0 for gene in SUMMARY_GENES}
+    for cell in cells:
+        cell_genes = cell.genome.genes
+        for gene in SUMMARY_GENES:
+            genes[gene] += cell_genes[gene]
+    count = len(cells)
+    return {
+        'tick': tick,
+        'time': environment.current_time,
+        'cells': count,
+        'types': dict(Counter(cell.type for cell in cells)),
+        'mean_genes': {gene: total / count for gene, total in genes.items()} if count else {},
+        'food': len(environment.food),
+    }
+
+
+def _init_worker(stats_queue):
+    global _stats_queue
+    _stats_queue = stats_queue
+
+
+def run_member(config, seed, ticks, stats_every=1, max_cells=None, stop_on_extinction=True):
+    # One replicate, run inside a pool process. Statistics are batched and sent
+    # through the shared queue as ('stats', seed, [summary, ...]); the last
+    # message of every run is ('done', seed, result).
+    random.seed(seed)
+    environment = headless.build_environment(config)
+    engine = SimulationEngine(environment)
+    engine.time_step = config['time_step']
+
+    batch = []
+    flushed = [time.perf_counter()]
+    outcome = ['completed']
+    start = time.perf_counter()
+
+    def flush():
+        if batch:
+            _stats_queue.put(('stats', seed, list(batch)))
+            batch.clear()
+        flushed[0] = time.perf_counter()
+
+    def progress(tick, cell_updates):
+        if stats_every and tick % stats_every == 0:
+            batch.append(summarize(environment, tick))
+            if time.perf_counter() - flushed[0] >= FLUSH_INTERVAL:
+                flush()
+        count = len(environment.cells)
+        if stop_on_extinction and not count:
+            outcome[0] = 'extinct'
+            return False
+        if max_cells is not None and count > max_cells:
+            outcome[0] = 'explosion'
+            return False
+        return True
+
+    if stats_every:
+        batch.append(summarize(environment, 0))
+    ticks_run, cell_updates = engine.run_ticks(ticks, config['generate_food'], config['allow_merge'], progress)
+    flush()
+    result = {
+        'seed': seed,
+        'ticks': ticks_run,
+        'outcome': outcome[0],
+        'seconds': time.perf_counter() - start,
+        'cell_updates': cell_updates,
+        'final': summarize(environment, ticks_run),
+    }
+    _stats_queue.put(('done', seed, result))
+    return seed
+
+
+def run_ensemble(config, seeds, ticks, processes=None, stats_every=1, max_cells=None, stop_on_extinction=True):
+    # Runs one replicate per seed on a process pool. Yields ('stats', seed, summary)
+    # as replicates progress and ('done', seed, result) as each one finishes.
+    seeds = list(seeds)
+    context = multiprocessing.get_context()
+    stats_queue = context.Queue()
+    with ProcessPoolExecutor(processes, context, _init_worker, (stats_queue,)) as pool:
+        futures = [pool.submit(run_member, config, seed, ticks, stats_every, max_cells, stop_on_extinction)
+                   for seed in seeds]
+        remaining = len(seeds)
+        while remaining:
+            try:
+                kind, seed, payload = stats_queue.get(timeout=0.5)
+            except queue.Empty:
+                # Surface a replicate that crashed instead of waiting for it forever
+                for future in futures:
+                    if future.done() and future.exception() is not None:
+                        raise future.exception()
+                continue
+            if kind == 'stats':
+                for summary in payload:
+                    yield 'stats', seed, summary
+            else:
+                remaining -= 1
+                yield 'done', seed, payload
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run many seeded replicates of one configuration in parallel")
+    parser.add_argument('--config', help="JSON file overriding the default configuration")
+    parser.add_argument('--runs', type=int, default=8)
+    parser.add_argument('--seed', type=int, default=0, help="seed of the first replicate; the others follow on")
+    parser.add_argument('--ticks', type=int, default=1000)
+    parser.add_argument('--processes', type=int, help="pool size (default: one per core)")
+    parser.add_argument('--backend', choices=['object', 'numpy'])
+    parser.add_argument('--stats-every', type=int, default=10, help="summarise every N ticks, 0 for none")
+    parser.add_argument('--max-cells', type=int, help="stop a replicate once it has more cells than this")
+    parser.add_argument('--keep-extinct', action='store_true', help="keep running replicates with no cells")
+    parser.add_argument('--out', help="write every summary and result to this file as JSON lines")
+    args = parser.parse_args(argv)
+
+    config = headless.load_config(args.config, {'backend': args.backend})
+    seeds = range(args.seed, args.seed + args.runs)
+    out = open(args.out, 'w') if args.out else None
+    outcomes = Counter()
+    ticks = 0
+    start = time.perf_counter()
+    try:
+        for kind, seed, payload in run_ensemble(config, seeds, args.ticks, args.processes, args.stats_every,
+                                                args.max_cells, not args.keep_extinct):
+            if out:
+                out.write(json.dumps({'kind': kind, 'seed': seed, **payload}) + '\n')
+            if kind == 'done':
+                outcomes[payload['outcome']] += 1
+                ticks += payload['ticks']
+                print(f"seed {seed:>6}  {payload['outcome']:<10} after {payload['ticks']:>7} ticks  "
+                      f"cells {payload['final']['cells']:>7}  food {payload['final']['food']:>6}")
+    finally:
+        if out:
+            out.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"{args.runs} runs, {ticks} ticks in {elapsed:.2f}s ({ticks / elapsed:.1f} ticks/s): "
+          + ", ".join(f"{count} {outcome}" for outcome, count in sorted(outcomes.items())))
+
+
+if __name__ == '__main__':
+    main()
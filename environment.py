@@ -1,70 +1,220 @@
 import random
 import math
+from operator import attrgetter
 from cell import Cell, Genome
+from spatial_grid import SpatialGrid, SpatialQueries
+from food_store import FoodStore
+from snapshot import CellState
+from checkpoints import CELL_BYTES, FOOD_BYTES
+from population_stats import PopulationStats
+from profiler import perf_counter
+from colonies import Colonies
+import food_sources
 
-class Environment:
+class Environment(SpatialQueries):
     def __init__(self, radius):
         self.radius = radius
         self.center = (radius, radius)
         self.cells = []
-        self.food = []
+        self.food = FoodStore()
         self.food_generation_rate = 5
         self.max_food = 1000
         self.current_time = 0  # Track the current time
         self.starvation_threshold = 1000  # Default value 1000
+        self.grid = SpatialGrid()  # Broad phase for cell-cell contacts
+        self.updating = False  # Removals are deferred to the end of a running tick
+        self.pending_removals = 0
+        self.lineage = None  # Optional LineageTracker, told of every birth and death
+        self.stats = PopulationStats()  # Kept up to date by add_cell and remove_cell
+        self.profiler = None  # Optional PhaseProfiler timing every phase of update
+        self.colonies = Colonies()  # Cells linked by adhesion, which pool their energy
+        self.food_sources = [food_sources.Dish()]  # Where new food appears, see food_sources.py
+        self.rng = None  # NumPy Generator for batched draws; None draws from the random module
+        self.nutrients = None  # Optional NutrientField that cells absorb from and dead cells enrich
+
+    def random_position(self):
+        angle = random.uniform(0, 2 * math.pi)
+        distance = self.radius * math.sqrt(random.random())  # Even over the area, not bunched in the middle
+        return (self.center[0] + math.cos(angle) * distance,
+                self.center[1] + math.sin(angle) * distance)
+
+    def enable_nutrients(self, **settings):
+        # settings are NutrientField's keyword arguments; needs numpy
+        from nutrients import NutrientField
+        self.nutrients = NutrientField(self.radius, self.center, **settings)
+        return self.nutrients
 
     def add_cell(self, cell):
         self.cells.append(cell)
+        self.stats.add(cell)
+        self.colonies.register(cell)
+
+    def add_offspring(self, parent, cell):
+        if self.lineage is not None:
+            self.lineage.birth(parent, cell)
+        self.stats.births += 1
+        return self.add_cell(cell)
+
+    def find_cell(self, cell_id):
+        for cell in self.cells:
+            if cell.id == cell_id:
+                return cell
+        return None
 
     def remove_cell(self, cell):
-        if cell in self.cells:
-            self.cells.remove(cell)
-        else:
-            print(f"Attempted to remove a cell that is not in the list: {cell}")
+        # Dead cells are only flagged here and dropped from the list by sweep()
+        if not cell.alive:
+            return
+        cell.alive = False
+        self.colonies.detach(cell)
+        self.stats.remove(cell.id)
+        self.stats.deaths += 1
+        self.pending_removals += 1
+        if not self.updating:
+            self.sweep()
+
+    def sweep(self):
+        if self.pending_removals:
+            if self.lineage is not None:
+                self.lineage.deaths(cell.id for cell in self.cells if not cell.alive)
+            self.cells = [cell for cell in self.cells if cell.alive]
+            self.pending_removals = 0
 
     def update(self, dt, generate_food=True, allow_merge=False):
         self.current_time += dt
 
-        for cell in self.cells[:]:
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.count('cells', len(self.cells))
+            births, deaths = self.stats.births, self.stats.deaths
+            start = perf_counter()
+
+        self.updating = True
+        try:
+            self.update_cells(dt)
+            if profiler is not None:
+                start = profiler.lap('update_cells', start)
+            self.resolve_contacts(allow_merge)
+            if profiler is not None:
+                start = profiler.lap('resolve_contacts', start)
+
+            food = len(self.food)
+            if generate_food:
+                self.generate_food(dt)
+                if profiler is not None:
+                    profiler.count('food_added', len(self.food) - food)
+                    food = len(self.food)
+                    start = profiler.lap('generate_food', start)
+
+            self.feed_cells()
+            if profiler is not None:
+                profiler.count('food_eaten', food - len(self.food))
+                start = profiler.lap('feed_cells', start)
+
+            if self.nutrients is not None:
+                self.nutrients.step(dt)
+                self.absorb_nutrients(dt)
+                if profiler is not None:
+                    start = profiler.lap('nutrients', start)
+        finally:
+            self.updating = False
+            self.sweep()
+            if profiler is not None:
+                profiler.lap('sweep', start)
+                profiler.count('births', self.stats.births - births)
+                profiler.count('deaths', self.stats.deaths - deaths)
+
+    def generate_food(self, dt):
+        room = self.max_food - len(self.food)
+        if room > 0:
+            rng = random if self.rng is None else self.rng
+            self.food.add_many(*food_sources.generate(self.food_sources, rng, self, dt, room))
+
+    def update_cells(self, dt):
+        # Every cell is updated before any of them dies or divides, so the order
+        # of random draws does not depend on which cells reproduce
+        cells = self.cells[:]
+        for cell in cells:
             cell.update(self, dt)
+        self.colonies.pool()
+
+        for cell in cells:
+            if not cell.alive:
+                continue
             if cell.energy <= 0.72 or cell.nitrogen_reserve <= 0.1 or cell.age >= 240:
                 cell.die(self)
             elif cell.can_divide():
                 new_cell = cell.divide()
-                self.add_cell(new_cell)
-
-        for i, cell in enumerate(self.cells):
-            for other_cell in self.cells[i + 1:]:
-                distance = math.sqrt((cell.position[0] - other_cell.position[0]) ** 2 +
-                                     (cell.position[1] - other_cell.position[1]) ** 2)
-                if distance < (cell.genome.genes['size'] + other_cell.genome.genes['size']) / 2:
-                    if allow_merge and cell.type == other_cell.type:
-                        self.merge_cells(cell, other_cell)
-                    elif cell.can_consume(other_cell):
-                        cell.consume(other_cell, self)
-                        self.remove_cell(other_cell)
-                    elif other_cell.can_consume(cell):
-                        other_cell.consume(cell, self)
-                        self.remove_cell(cell)
-
-        if generate_food:
-            food_to_generate = self.food_generation_rate * dt
-            while food_to_generate > 0 and len(self.food) < self.max_food:
-                if random.random() < food_to_generate:
-                    angle = random.uniform(0, 2 * math.pi)
-                    distance = random.uniform(0, self.radius)
-                    x = self.center[0] + math.cos(angle) * distance
-                    y = self.center[1] + math.sin(angle) * distance
-                    self.food.append((x, y))
-                food_to_generate -= 1
+                self.add_offspring(cell, new_cell)
+
+    def feed_cells(self):
+        # Every cell eats the food particles under it
+        if not len(self.food):
+            return
+        for cell in self.cells:
+            if not cell.alive:
+                continue
+            eaten = self.food.query_radius(cell.position[0], cell.position[1], cell.genome.size)
+            if eaten:
+                cell.energy += 5 * len(eaten)
+                cell.last_eaten = self.current_time  # Update the last eaten time
+                self.food.remove_many(eaten)
 
+    def absorb_nutrients(self, dt):
+        cells = [cell for cell in self.cells if cell.alive]
+        if not cells:
+            return
+        taken = self.nutrients.absorb([cell.position[0] for cell in cells], [cell.position[1] for cell in cells],
+                                      [cell.genome.size for cell in cells], dt)
+        for cell, amount in zip(cells, taken.tolist()):
+            if amount > 0:
+                cell.energy += amount
+                cell.last_eaten = self.current_time
+
+    def resolve_contacts(self, allow_merge=False):
+        # Consumption and merging only look at pairs the grid reports as touching
+        self.rebuild_grid()
+        cells = self.grid.items
+        contacts = self.grid.contact_pairs()
+        if self.profiler is not None:
+            self.profiler.count('pairs_tested', self.grid.pair_count())
+            self.profiler.count('contacts', len(contacts))
+        for i, j in contacts:
+            self.resolve_contact(cells[i], cells[j], allow_merge)
+
+    def resolve_contact(self, cell, other_cell, allow_merge=False):
+        if not (cell.alive and other_cell.alive):
+            return
+        if allow_merge and cell.type == other_cell.type:
+            self.merge_cells(cell, other_cell)
+        elif cell.can_consume(other_cell):
+            cell.consume(other_cell, self)
+            self.remove_cell(other_cell)
+            self.stats.consumed += 1
+        elif other_cell.can_consume(cell):
+            other_cell.consume(cell, self)
+            self.remove_cell(cell)
+            self.stats.consumed += 1
+        elif cell.adhesin and other_cell.adhesin:
+            self.colonies.join(cell, other_cell)
+
+    def resolve_collisions(self):
+        # Push overlapping cells apart, then keep everything inside the dish
+        self.rebuild_grid()
+        cells = self.grid.items
+        for i, j in self.grid.contact_pairs():
+            if cells[i].alive and cells[j].alive:
+                cells[i].resolve_collision(cells[j])
+
+        self.resolve_boundary_collisions()
+
+    def resolve_boundary_collisions(self):
         for cell in self.cells:
-            for food in self.food[:]:
-                distance = math.sqrt((cell.position[0] - food[0]) ** 2 + (cell.position[1] - food[1]) ** 2)
-                if distance < cell.genome.genes['size']:
-                    cell.energy += 5
-                    cell.last_eaten = self.current_time  # Update the last eaten time
-                    self.food.remove(food)
+            if cell.alive:
+                cell.resolve_boundary_collision(self)
+
+    def rebuild_grid(self):
+        self.grid.rebuild(self.cells)
 
     def merge_cells(self, cell1, cell2):
         # Create a new cell with combined properties
@@ -93,11 +243,70 @@ class Environment:
         # Remove the original cells and add the new merged cell
         self.remove_cell(cell1)
         self.remove_cell(cell2)
-        self.add_cell(new_cell)
+        self.add_offspring(cell1, new_cell)
+        self.stats.merges += 1
 
     def get_state(self):
+        # Detached copies only, so the state stays valid while the simulation runs on
         return {
-            'cells': [(cell.position, cell.genome.genes['size'], cell.genome.genes['color'],
-                       cell.genome.genes['has_tail'], cell.angle) for cell in self.cells],
-            'food': self.food
-        }
\ No newline at end of file
+            'cells': self.cell_states(),
+            'food': self.food.copy(),
+            'current_time': self.current_time,
+            'radius': self.radius,
+            'center': self.center,
+            'stats': dict(self.stats.summary(), **self.colonies.summary()),
+            'profile': self.profiler.summary() if self.profiler is not None else None,
+            'nutrients': self.nutrients.copy() if self.nutrients is not None else None,
+        }
+
+    def energies(self):
+        return [cell.energy for cell in self.cells]
+
+    def motion_bounds(self):
+        # Fastest speed and smallest size among the cells, (0, 0) without any
+        if not self.cells:
+            return 0.0, 0.0
+        return (max(cell.genome.traits.speed for cell in self.cells),
+                min(cell.genome.size for cell in self.cells))
+
+    def cell_states(self):
+        return [CellState.from_cell(cell) for cell in self.cells]
+
+    def checkpoint(self):
+        # A detached copy of everything a tick changes. Adhesion is kept as
+        # indices; genome traits and other immutable values are shared.
+        index = {id(cell): i for i, cell in enumerate(self.cells)}
+        cells = []
+        for cell in self.cells:
+            state = dict(zip(Cell.__slots__, cell_state(cell)))
+            state['genome'] = cell.genome.copy()
+            state['adhered_cells'] = [index[id(other)] for other in cell.adhered_cells if id(other) in index]
+            state['colony'] = None
+            cells.append((type(cell), state))
+        return cells, self.food.copy(), self.current_time
+
+    def checkpoint_size(self, state):
+        cells, food, _ = state
+        return len(cells) * CELL_BYTES + len(food) * FOOD_BYTES
+
+    def restore(self, state):
+        # Replaces the cells, food and time with a checkpoint, which stays usable
+        cells, food, current_time = state
+        restored = []
+        for cell_class, cell_state in cells:
+            cell = cell_class.__new__(cell_class)
+            for name, value in cell_state.items():
+                setattr(cell, name, value)
+            cell.genome = cell.genome.copy()
+            restored.append(cell)
+        for cell in restored:
+            cell.adhered_cells = {restored[i]: None for i in cell.adhered_cells}
+        self.colonies.rebuild(restored)
+        self.cells = restored
+        self.food = food.copy()
+        self.current_time = current_time
+        self.pending_removals = 0
+        self.stats.rebuild(restored)
+
+
+cell_state = attrgetter(*Cell.__slots__)
@@ -1,46 +1,333 @@
 # file_io.py
+import gc
 import json
-from cell import Cell, Genome
+import mmap
+import random
+import struct
+import sys
+from array import array
+from contextlib import contextmanager
+from operator import attrgetter, itemgetter
+from cell import Cell, Genome, Bacteria, Phagocyte, Photocyte, Traits
+from environment import Environment
+import food_sources
+
+CELL_CLASSES = {'Cell': Cell, 'Bacteria': Bacteria, 'Phagocyte': Phagocyte, 'Photocyte': Photocyte}
+
+# Binary snapshots start with MAGIC, the format version and the length of a JSON
+# header. The header holds the environment settings, the random state and the
+# layout of the columns that follow: one typed array per cell field, gene and
+# food coordinate, each starting on an 8-byte boundary so a memory-mapped file
+# can be read in place. Integers wider than 64 bits (ids, DNA) are split into
+# _lo and _hi columns.
+MAGIC = b'CELLSNAP'
+VERSION = 1
+PREAMBLE = struct.Struct('<8sII')  # Magic, version, header length
+ALIGNMENT = 8
+LOW_BITS = (1 << 64) - 1
+
+GENE_ORDER = ('size', 'speed', 'energy_efficiency', 'division_threshold', 'color', 'has_tail',
+              'can_consume', 'consumption_size_ratio', 'nitrogen_reserve', 'adhesin',
+              'radiation_sensitivity')
+NUMERIC_GENES = ('size', 'speed', 'energy_efficiency', 'division_threshold',
+                 'consumption_size_ratio', 'nitrogen_reserve', 'radiation_sensitivity')
+FLAG_GENES = ('has_tail', 'can_consume', 'adhesin')
+CELL_FLOATS = ('energy', 'age', 'nitrogen_reserve', 'angle', 'last_eaten', 'radiation_sensitivity')
+CELL_FIELDS = attrgetter(*CELL_FLOATS, 'position', 'adhesin', 'alive', 'id', 'dna', 'type', 'genome')
+GENE_FIELDS = itemgetter(*NUMERIC_GENES, *FLAG_GENES, 'color')
+
+
+def _align(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def _split(name, values, columns):
+    columns[name + '_lo'] = array('Q', [value & LOW_BITS for value in values])
+    columns[name + '_hi'] = array('Q', [value >> 64 for value in values])
+
+
+def _join(name, columns):
+    return [low | high << 64 for low, high in zip(columns[name + '_lo'], columns[name + '_hi'])]
+
+
+@contextmanager
+def _collector_paused():
+    # Bulk saves and loads allocate several objects per cell without creating
+    # garbage; a cyclic collection every few hundred of them would dominate
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
 
 def save_environment(environment, filename):
+    cells = environment.cells
+    # Read every field in one pass over the cells, then transpose into columns
+    with _collector_paused():
+        fields = list(zip(*map(CELL_FIELDS, cells))) or [()] * (len(CELL_FLOATS) + 7)
+        positions, adhesins, alives, ids, dnas, cell_types, genomes = fields[len(CELL_FLOATS):]
+        gene_fields = list(zip(*(GENE_FIELDS(genome.genes.copy()) for genome in genomes))) or [()] * len(GENE_ORDER)
+    class_names = [cell.cell_class.__name__ for cell in cells]
+    classes = sorted(set(class_names))
+    types = sorted(set(cell_types))
+    class_codes = {name: code for code, name in enumerate(classes)}
+    type_codes = {name: code for code, name in enumerate(types)}
+
+    columns = {
+        'class': array('B', [class_codes[name] for name in class_names]),
+        'type': array('B', [type_codes[cell_type] for cell_type in cell_types]),
+        'x': array('d', [position[0] for position in positions]),
+        'y': array('d', [position[1] for position in positions]),
+        'adhesin': array('B', map(bool, adhesins)),
+        'alive': array('B', map(bool, alives)),
+        'never_consume': array('B', [bool(genome.never_consume) for genome in genomes]),
+    }
+    for field, values in zip(CELL_FLOATS, fields):
+        columns[field] = array('d', values)
+    _split('id', ids, columns)
+    _split('dna', dnas, columns)
+    for gene, values in zip(NUMERIC_GENES, gene_fields):
+        columns['gene_' + gene] = array('d', values)
+    for gene, values in zip(FLAG_GENES, gene_fields[len(NUMERIC_GENES):]):
+        columns['gene_' + gene] = array('B', map(bool, values))
+    colors = gene_fields[-1]
+    for channel in range(3):
+        columns[f'gene_color_{channel}'] = array('d', [color[channel] for color in colors])
+
+    # Adhesion links as flattened (i, j) index pairs with i < j
+    index = {id(cell): i for i, cell in enumerate(cells) if cell.adhered_cells}
+    adhesion = array('q')
+    for i, cell in enumerate(cells):
+        for other_cell in cell.adhered_cells:
+            j = index.get(id(other_cell))
+            if j is not None and i < j:
+                adhesion.extend((i, j))
+    columns['adhesion'] = adhesion
+    columns['food_x'] = array('d', environment.food.xs)
+    columns['food_y'] = array('d', environment.food.ys)
+    if environment.nutrients is not None:
+        columns['nutrients'] = array('d', environment.nutrients.grid.tobytes())
+
+    layout = []
+    offset = 0
+    for name, column in columns.items():
+        offset = _align(offset)
+        layout.append((name, column.typecode, offset, len(column)))
+        offset += len(column) * column.itemsize
+
+    header = json.dumps({
+        'radius': environment.radius,
+        'current_time': environment.current_time,
+        'food_generation_rate': environment.food_generation_rate,
+        'max_food': environment.max_food,
+        'food_sources': [source.config() for source in environment.food_sources],
+        'nutrients': environment.nutrients.settings() if environment.nutrients is not None else None,
+        'starvation_threshold': environment.starvation_threshold,
+        'cells': len(cells),
+        'food': len(environment.food),
+        'classes': classes,
+        'types': types,
+        'random_state': random.getstate(),
+        'byteorder': sys.byteorder,
+        'columns': layout,
+    }).encode()
+
+    with open(filename, 'wb') as f:
+        f.write(PREAMBLE.pack(MAGIC, VERSION, len(header)))
+        f.write(header)
+        data_start = _align(PREAMBLE.size + len(header))
+        f.write(bytes(data_start - PREAMBLE.size - len(header)))
+        position = 0
+        for (name, _, offset, _), column in zip(layout, columns.values()):
+            f.write(bytes(offset - position))
+            column.tofile(f)
+            position = offset + len(column) * column.itemsize
+
+
+def read_columns(filename, use_mmap=False):
+    # Returns the header and every column of a binary snapshot. With use_mmap the
+    # columns are views straight into the mapped file and nothing is copied.
+    with open(filename, 'rb') as f:
+        magic, version, header_length = PREAMBLE.unpack(f.read(PREAMBLE.size))
+        if magic != MAGIC:
+            raise ValueError(f"{filename} is not a binary snapshot")
+        if version > VERSION:
+            raise ValueError(f"{filename} uses snapshot format {version}, newer than {VERSION}")
+        header = json.loads(f.read(header_length))
+        if use_mmap:
+            buffer = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        else:
+            f.seek(0)
+            buffer = memoryview(f.read())
+
+    data_start = _align(PREAMBLE.size + header_length)
+    swap = header['byteorder'] != sys.byteorder
+    columns = {}
+    for name, typecode, offset, count in header['columns']:
+        start = data_start + offset
+        chunk = buffer[start:start + count * array(typecode).itemsize]
+        if swap:
+            column = array(typecode, chunk.tobytes())
+            column.byteswap()
+        else:
+            column = chunk.cast(typecode)
+        columns[name] = column
+    return header, columns
+
+
+def load_environment(filename, environment_class=Environment, use_mmap=False, restore_random=False):
+    # Binary snapshots are restored exactly, including cell ids and adhesion;
+    # anything else is read as a JSON export
+    with open(filename, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            return load_environment_json(filename, environment_class)
+    header, columns = read_columns(filename, use_mmap)
+
+    environment = environment_class(header['radius'])
+    environment.current_time = header['current_time']
+    environment.food_generation_rate = header['food_generation_rate']
+    environment.max_food = header['max_food']
+    if 'food_sources' in header:
+        environment.food_sources = food_sources.from_config(header['food_sources'])
+    environment.starvation_threshold = header['starvation_threshold']
+    environment.food.extend(zip(columns['food_x'].tolist(), columns['food_y'].tolist()))
+    if header.get('nutrients') is not None:
+        grid = environment.enable_nutrients(**header['nutrients']).grid
+        grid.ravel()[:] = columns['nutrients']
+
+    c = {name: column.tolist() for name, column in columns.items()}
+    gene_columns = {gene: c['gene_' + gene] for gene in NUMERIC_GENES}
+    gene_columns.update({gene: [bool(flag) for flag in c['gene_' + gene]] for gene in FLAG_GENES})
+    gene_columns['color'] = list(zip(c['gene_color_0'], c['gene_color_1'], c['gene_color_2']))
+    gene_rows = zip(*(gene_columns[gene] for gene in GENE_ORDER))
+
+    with _collector_paused():
+        _restore_cells(environment, header, c, gene_rows)
+
+    cells = environment.cells
+    pairs = c['adhesion']
+    for k in range(0, len(pairs), 2):
+        environment.colonies.join(cells[pairs[k]], cells[pairs[k + 1]])
+
+    if restore_random:
+        version, internal_state, gauss_next = header['random_state']
+        random.setstate((version, tuple(internal_state), gauss_next))
+    return environment
+
+
+def _restore_cells(environment, header, c, gene_rows):
+    classes = [CELL_CLASSES[name] for name in header['classes']]
+    types = header['types']
+    # The saved state is complete, so cells are rebuilt without running their
+    # constructors (which would draw random numbers and new ids)
+    # Identical traits are stored once, as they were before saving
+    shared_traits = {}
+    for (class_code, type_code, cell_id, x, y, energy, age, nitrogen_reserve, angle, last_eaten,
+         radiation_sensitivity, adhesin, alive, dna, never_consume, row) in zip(
+            c['class'], c['type'], _join('id', c), c['x'], c['y'], c['energy'], c['age'],
+            c['nitrogen_reserve'], c['angle'], c['last_eaten'], c['radiation_sensitivity'], c['adhesin'],
+            c['alive'], _join('dna', c), c['never_consume'], gene_rows):
+        genome = Genome.__new__(Genome)
+        genome.size = row[0]
+        traits = shared_traits.get(row[1:])
+        if traits is None:
+            traits = shared_traits[row[1:]] = Traits._make(row[1:])
+        genome.traits = traits
+        genome.never_consume = bool(never_consume)
+        cell = classes[class_code].__new__(classes[class_code])
+        cell.id = cell_id
+        cell.genome = genome
+        cell.position = (x, y)
+        cell.energy = energy
+        cell.age = age
+        cell.dna = dna
+        cell.angle = angle
+        cell.type = types[type_code]
+        cell.nitrogen_reserve = nitrogen_reserve
+        cell.adhesin = bool(adhesin)
+        cell.radiation_sensitivity = radiation_sensitivity
+        cell.last_eaten = last_eaten
+        cell.adhered_cells = {}
+        cell.colony = None
+        cell.alive = bool(alive)
+        environment.add_cell(cell)
+
+
+def save_environment_json(environment, filename):
+    # Human-readable export for debugging; save_environment is the exact format
     data = {
-        'width': environment.width,
-        'height': environment.height,
+        'radius': environment.radius,
+        'current_time': environment.current_time,
+        'food_generation_rate': environment.food_generation_rate,
+        'max_food': environment.max_food,
+        'food_sources': [source.config() for source in environment.food_sources],
+        'starvation_threshold': environment.starvation_threshold,
         'cells': [
             {
+                'class': cell.cell_class.__name__,
+                'type': cell.type,
                 'position': cell.position,
                 'energy': cell.energy,
                 'age': cell.age,
-                'genome': cell.genome.genes
+                'nitrogen_reserve': cell.nitrogen_reserve,
+                'angle': cell.angle,
+                'last_eaten': cell.last_eaten,
+                'dna': cell.dna,
+                'never_consume': cell.genome.never_consume,
+                'genome': dict(cell.genome.genes)
             }
             for cell in environment.cells
         ],
-        'food': environment.food
+        'food': list(environment.food),
+        'nutrients': {'settings': environment.nutrients.settings(), 'grid': environment.nutrients.grid.tolist()}
+        if environment.nutrients is not None else None,
     }
     with open(filename, 'w') as f:
         json.dump(data, f)
 
-def load_environment(filename):
+def load_environment_json(filename, environment_class=Environment):
     with open(filename, 'r') as f:
         data = json.load(f)
     
-    environment = Environment(data['width'], data['height'])
-    environment.food = data['food']
+    environment = environment_class(data['radius'])
+    environment.current_time = data.get('current_time', 0)
+    environment.food_generation_rate = data.get('food_generation_rate', environment.food_generation_rate)
+    environment.max_food = data.get('max_food', environment.max_food)
+    if 'food_sources' in data:
+        environment.food_sources = food_sources.from_config(data['food_sources'])
+    environment.starvation_threshold = data.get('starvation_threshold', environment.starvation_threshold)
+    environment.food.extend(data['food'])
+    if data.get('nutrients') is not None:
+        environment.enable_nutrients(**data['nutrients']['settings']).grid[:] = data['nutrients']['grid']
     
     for cell_data in data['cells']:
-        genome = Genome(cell_data['genome'])
-        cell = Cell(genome, cell_data['position'])
+        genes = dict(cell_data['genome'])
+        genes['color'] = tuple(genes['color'])
+        # Exports without a class name tell it by the type, which a plain Cell shares with Phagocyte
+        cell_class = CELL_CLASSES.get(cell_data.get('class', cell_data.get('type')), Cell)
+        cell = cell_class(Genome(dict(genes), cell_data.get('never_consume', False)),
+                          tuple(cell_data['position']), cell_data.get('dna'))
+        # Subclasses adjust their genome on creation, so put the saved genes back
+        cell.genome.genes.update(genes)
+        cell.type = cell_data.get('type', cell.type)
         cell.energy = cell_data['energy']
         cell.age = cell_data['age']
+        cell.nitrogen_reserve = cell_data.get('nitrogen_reserve', cell.nitrogen_reserve)
+        cell.angle = cell_data.get('angle', cell.angle)
+        cell.last_eaten = cell_data.get('last_eaten', cell.last_eaten)
         environment.add_cell(cell)
     
     return environment
 
 def save_genome(genome, filename):
     with open(filename, 'w') as f:
-        json.dump(genome.genes, f)
+        json.dump(dict(genome.genes), f)
 
 def load_genome(filename):
     with open(filename, 'r') as f:
         genes = json.load(f)
-    return Genome(genes)
\ No newline at end of file
+    genes['color'] = tuple(genes['color'])
+    return Genome(genes)
@@ -0,0 +1,199 @@
+# food_sources.py
+import math
+
+# Food appears as a Poisson process. Every tick each source draws how many
+# particles it adds, with a mean of rate * dt, and places all of them at once.
+# rng is the random module (or a random.Random) or a NumPy Generator such as
+# VectorizedEnvironment.rng; with NumPy a whole batch is drawn and placed as
+# array operations. Sources read the dish from the environment they are given:
+# center, radius, current_time and food_generation_rate.
+
+POISSON_CHUNK = 30  # Largest mean drawn by inversion in one go, far from exp(-mean) underflowing
+
+
+def _numpy(rng):
+    # The numpy module if rng is one of its Generators, else None
+    if hasattr(rng, 'bit_generator'):
+        import numpy
+        return numpy
+    return None
+
+
+def poisson(rng, mean):
+    if mean <= 0:
+        return 0
+    np = _numpy(rng)
+    if np is not None:
+        return int(rng.poisson(mean))
+    # Poisson counts add up, so a large mean is drawn in chunks of at most
+    # POISSON_CHUNK, each by inversion with a single draw
+    count = 0
+    while mean > 0:
+        chunk = min(mean, POISSON_CHUNK)
+        mean -= chunk
+        u = rng.random()
+        k = 0
+        p = total = math.exp(-chunk)
+        while u > total and p > 0:
+            k += 1
+            p *= chunk / k
+            total += p
+        count += k
+    return count
+
+
+def disc_points(rng, count, cx, cy, radius):
+    # count points spread evenly over the area of a disc: the square root
+    # keeps them from bunching up in the middle
+    np = _numpy(rng)
+    if np is not None:
+        distance = radius * np.sqrt(rng.random(count))
+        angle = 2 * math.pi * rng.random(count)
+        return cx + distance * np.cos(angle), cy + distance * np.sin(angle)
+    rand = rng.random
+    polar = [(radius * math.sqrt(rand()), 2 * math.pi * rand()) for _ in range(count)]
+    cos, sin = math.cos, math.sin
+    return [cx + d * cos(a) for d, a in polar], [cy + d * sin(a) for d, a in polar]
+
+
+def select(xs, ys, keep):
+    # The points whose keep flag is set; keep is a boolean array for NumPy points
+    if isinstance(xs, list):
+        return [x for x, k in zip(xs, keep) if k], [y for y, k in zip(ys, keep) if k]
+    return xs[keep], ys[keep]
+
+
+class FoodSource:
+    # rate is food per unit of time; None follows the environment's food_generation_rate
+    kind = None
+
+    def __init__(self, rate=None):
+        self.rate = rate
+
+    def rate_of(self, environment):
+        return environment.food_generation_rate if self.rate is None else self.rate
+
+    def mean(self, environment, dt):
+        return self.rate_of(environment) * dt
+
+    def place(self, rng, count, environment):
+        raise NotImplementedError
+
+    def config(self):
+        return dict(vars(self), kind=self.kind)
+
+
+class Dish(FoodSource):
+    # Evenly over the whole dish
+    kind = 'dish'
+
+    def place(self, rng, count, environment):
+        return disc_points(rng, count, environment.center[0], environment.center[1], environment.radius)
+
+
+class Patch(FoodSource):
+    # Evenly over a disc around (x, y); the part of it outside the dish gets nothing
+    kind = 'patch'
+
+    def __init__(self, x, y, radius, rate=None):
+        super().__init__(rate)
+        self.x = x
+        self.y = y
+        self.radius = radius
+
+    def place(self, rng, count, environment):
+        xs, ys = disc_points(rng, count, self.x, self.y, self.radius)
+        cx, cy = environment.center
+        limit = environment.radius * environment.radius
+        if isinstance(xs, list):
+            keep = [(x - cx) ** 2 + (y - cy) ** 2 <= limit for x, y in zip(xs, ys)]
+        else:
+            keep = (xs - cx) ** 2 + (ys - cy) ** 2 <= limit
+        return select(xs, ys, keep)
+
+
+class Gradient(FoodSource):
+    # Over the whole dish, denser towards angle: the density rises linearly
+    # across the dish from 1 - strength to 1 + strength times the mean.
+    # Points are drawn evenly at the peak density and thinned, which keeps the
+    # count a Poisson draw with the same mean as a Dish of the same rate.
+    kind = 'gradient'
+
+    def __init__(self, angle=0.0, strength=1.0, rate=None):
+        super().__init__(rate)
+        self.angle = angle
+        self.strength = max(0.0, min(1.0, strength))
+
+    def mean(self, environment, dt):
+        return super().mean(environment, dt) * (1 + self.strength)
+
+    def place(self, rng, count, environment):
+        cx, cy = environment.center
+        radius = environment.radius
+        xs, ys = disc_points(rng, count, cx, cy, radius)
+        ux = math.cos(self.angle) * self.strength / radius
+        uy = math.sin(self.angle) * self.strength / radius
+        peak = 1 + self.strength
+        np = _numpy(rng)
+        if np is not None:
+            keep = rng.random(count) * peak < 1 + (xs - cx) * ux + (ys - cy) * uy
+        else:
+            rand = rng.random
+            keep = [rand() * peak < 1 + (x - cx) * ux + (y - cy) * uy for x, y in zip(xs, ys)]
+        return select(xs, ys, keep)
+
+
+class Pulse(FoodSource):
+    # Another source, switched on for the first duration of every period
+    kind = 'pulse'
+
+    def __init__(self, source, period, duration):
+        super().__init__(source.rate)
+        self.source = source
+        self.period = period
+        self.duration = duration
+
+    def mean(self, environment, dt):
+        if environment.current_time % self.period >= self.duration:
+            return 0.0
+        return self.source.mean(environment, dt)
+
+    def place(self, rng, count, environment):
+        return self.source.place(rng, count, environment)
+
+    def config(self):
+        return {'kind': self.kind, 'source': self.source.config(), 'period': self.period,
+                'duration': self.duration}
+
+
+SOURCES = {source.kind: source for source in (Dish, Patch, Gradient, Pulse)}
+
+
+def from_config(configs):
+    # Sources from a list of config() dicts, e.g. {'kind': 'patch', 'x': 250, 'y': 250, 'radius': 40, 'rate': 2}
+    sources = []
+    for config in configs:
+        config = dict(config)
+        kind = config.pop('kind')
+        if kind == 'pulse':
+            config['source'] = from_config([config['source']])[0]
+        sources.append(SOURCES[kind](**config))
+    return sources
+
+
+def generate(sources, rng, environment, dt, room):
+    # Coordinate lists of the food all sources add in one tick, at most room of it
+    xs = []
+    ys = []
+    for source in sources:
+        if len(xs) >= room:
+            break
+        count = poisson(rng, source.mean(environment, dt))
+        if count:
+            new_xs, new_ys = source.place(rng, count, environment)
+            if not isinstance(new_xs, list):
+                new_xs, new_ys = new_xs.tolist(), new_ys.tolist()
+            xs += new_xs
+            ys += new_ys
+    del xs[room:], ys[room:]
+    return xs, ys
@@ -0,0 +1,154 @@
+import math
+
+
+class FoodStore:
+    # Food particles kept in flat coordinate lists and bucketed on a uniform
+    # grid. Removal swaps the last particle into the freed slot, so it is O(1).
+    def __init__(self, bucket_size=16.0):
+        self.bucket_size = bucket_size
+        self.xs = []
+        self.ys = []
+        self.buckets = {}
+        self._keys = []  # Bucket key of every particle
+        self._slots = []  # Position of every particle inside its bucket
+
+    def __len__(self):
+        return len(self.xs)
+
+    def __iter__(self):
+        return zip(self.xs, self.ys)
+
+    def __getitem__(self, index):
+        return self.xs[index], self.ys[index]
+
+    def _key(self, x, y):
+        return (math.floor(x / self.bucket_size), math.floor(y / self.bucket_size))
+
+    def add(self, x, y):
+        index = len(self.xs)
+        key = self._key(x, y)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = []
+        self.xs.append(x)
+        self.ys.append(y)
+        self._keys.append(key)
+        self._slots.append(len(bucket))
+        bucket.append(index)
+        return index
+
+    def add_many(self, xs, ys):
+        # A batch given as coordinate lists, e.g. from food_sources.generate
+        size = self.bucket_size
+        floor = math.floor
+        buckets = self.buckets
+        keys = self._keys
+        slots = self._slots
+        index = len(self.xs)
+        for x, y in zip(xs, ys):
+            key = (floor(x / size), floor(y / size))
+            bucket = buckets.get(key)
+            if bucket is None:
+                bucket = buckets[key] = []
+            keys.append(key)
+            slots.append(len(bucket))
+            bucket.append(index)
+            index += 1
+        self.xs.extend(xs)
+        self.ys.extend(ys)
+
+    def extend(self, positions):
+        positions = list(positions)
+        self.add_many([x for x, _ in positions], [y for _, y in positions])
+
+    def remove(self, index):
+        # Unlink the particle from its bucket
+        key = self._keys[index]
+        bucket = self.buckets[key]
+        slot = self._slots[index]
+        moved = bucket.pop()
+        if moved != index:
+            bucket[slot] = moved
+            self._slots[moved] = slot
+        elif not bucket:
+            del self.buckets[key]
+
+        # Move the last particle into the freed index
+        last = len(self.xs) - 1
+        if index != last:
+            self.xs[index] = self.xs[last]
+            self.ys[index] = self.ys[last]
+            self._keys[index] = self._keys[last]
+            self._slots[index] = self._slots[last]
+            last_bucket = self.buckets[self._keys[index]]
+            last_bucket[self._slots[index]] = index
+        self.xs.pop()
+        self.ys.pop()
+        self._keys.pop()
+        self._slots.pop()
+
+    def remove_many(self, indices):
+        # Highest index first, so the particles still to be removed never move
+        for index in sorted(indices, reverse=True):
+            self.remove(index)
+
+    def copy(self):
+        store = FoodStore(self.bucket_size)
+        store.xs = self.xs.copy()
+        store.ys = self.ys.copy()
+        store.buckets = {key: bucket.copy() for key, bucket in self.buckets.items()}
+        store._keys = self._keys.copy()
+        store._slots = self._slots.copy()
+        return store
+
+    def clear(self):
+        self.xs.clear()
+        self.ys.clear()
+        self.buckets.clear()
+        self._keys.clear()
+        self._slots.clear()
+
+    def query_radius(self, x, y, radius):
+        # Indices of particles strictly closer than radius to (x, y)
+        size = self.bucket_size
+        min_gx = math.floor((x - radius) / size)
+        max_gx = math.floor((x + radius) / size)
+        min_gy = math.floor((y - radius) / size)
+        max_gy = math.floor((y + radius) / size)
+        xs, ys = self.xs, self.ys
+        radius_sq = radius * radius
+        found = []
+        for gx in range(min_gx, max_gx + 1):
+            for gy in range(min_gy, max_gy + 1):
+                bucket = self.buckets.get((gx, gy))
+                if not bucket:
+                    continue
+                for index in bucket:
+                    dx = xs[index] - x
+                    dy = ys[index] - y
+                    if dx * dx + dy * dy < radius_sq:
+                        found.append(index)
+        return found
+
+    def query_rect(self, left, top, right, bottom):
+        # Indices of particles inside the rectangle
+        xs, ys = self.xs, self.ys
+        found = []
+        for key in self.buckets_in_rect(left, top, right, bottom):
+            for index in self.buckets[key]:
+                if left <= xs[index] <= right and top <= ys[index] <= bottom:
+                    found.append(index)
+        return found
+
+    def buckets_in_rect(self, left, top, right, bottom):
+        # Keys of the occupied buckets overlapping the rectangle
+        size = self.bucket_size
+        min_gx = math.floor(left / size)
+        max_gx = math.floor(right / size)
+        min_gy = math.floor(top / size)
+        max_gy = math.floor(bottom / size)
+        buckets = self.buckets
+        if (max_gx - min_gx + 1) * (max_gy - min_gy + 1) > len(buckets):
+            return [key for key in buckets if min_gx <= key[0] <= max_gx and min_gy <= key[1] <= max_gy]
+        return [(gx, gy) for gx in range(min_gx, max_gx + 1) for gy in range(min_gy, max_gy + 1)
+                if (gx, gy) in buckets]
@@ -0,0 +1,179 @@
+# headless.py
+import argparse
+import json
+import random
+import sys
+import time
+from cell import Cell, Genome, Bacteria, Phagocyte, Photocyte
+from environment import Environment
+from simulation import SimulationEngine
+from trajectory import TrajectoryRecorder
+import file_io
+import food_sources
+
+CELL_CLASSES = {'cell': Cell, 'bacteria': Bacteria, 'phagocyte': Phagocyte, 'photocyte': Photocyte}
+
+DEFAULT_CONFIG = {
+    'radius': 250,
+    'food_generation_rate': 5,
+    'max_food': 1000,
+    'food_sources': None,  # food_sources.from_config() list; None spreads food over the whole dish
+    'nutrients': None,  # NutrientField settings, e.g. {"supply": 0.01}; {} for the defaults, None for no field
+    'starvation_threshold': 1000,
+    'time_step': 0.1,
+    'cells': {'cell': 5, 'bacteria': 5},
+    'food': 20,
+    'generate_food': True,
+    'allow_merge': False,
+    'backend': 'object',
+    'sectors': 1,  # More than one splits the dish across worker processes (object backend only)
+}
+
+
+def environment_class(backend):
+    if backend == 'numpy':
+        from vectorized import VectorizedEnvironment
+        return VectorizedEnvironment
+    return Environment
+
+
+def build_environment(config, snapshot=None, restore_random=False):
+    # Random state must already be seeded: populating the dish draws from it.
+    # restore_random carries on with the random state saved in the snapshot.
+    cls = environment_class(config['backend'])
+    if snapshot:
+        return file_io.load_environment(snapshot, cls, restore_random=restore_random)
+
+    environment = cls(config['radius'])
+    environment.food_generation_rate = config['food_generation_rate']
+    environment.max_food = config['max_food']
+    if config['food_sources']:
+        environment.food_sources = food_sources.from_config(config['food_sources'])
+    if config['nutrients'] is not None:
+        environment.enable_nutrients(**config['nutrients'])
+    environment.starvation_threshold = config['starvation_threshold']
+    for cell_type, count in config['cells'].items():
+        cell_class = CELL_CLASSES[cell_type]
+        for _ in range(count):
+            environment.add_cell(cell_class(Genome(), environment.random_position()))
+    for _ in range(config['food']):
+        environment.food.add(*environment.random_position())
+    return environment
+
+
+def load_config(path=None, overrides=None):
+    config = dict(DEFAULT_CONFIG)
+    if path:
+        with open(path, 'r') as f:
+            config.update(json.load(f))
+    for key, value in (overrides or {}).items():
+        if value is not None:
+            config[key] = value
+    return config
+
+
+def run(config, ticks, seed=None, snapshot=None, report_every=0, stop_on_extinction=False, out=sys.stdout,
+        record=None, keyframe_interval=100, lineage=False, profile=False):
+    if seed is not None:
+        random.seed(seed)
+    if config['sectors'] > 1 and config['backend'] != 'object':
+        raise ValueError("sectors need the object backend")
+    if config['sectors'] > 1 and (record or lineage or profile):
+        raise ValueError("recording, lineage tracking and profiling need a single sector")
+    # Without a seed a snapshot resumes exactly where it was saved
+    environment = build_environment(config, snapshot, restore_random=seed is None)
+    if config['sectors'] > 1:
+        from domains import PartitionedSimulation
+        engine = PartitionedSimulation(environment, config['sectors'], seed or 0, config['time_step'])
+    else:
+        engine = SimulationEngine(environment)
+        engine.time_step = config['time_step']
+        if record:
+            engine.attach_recorder(TrajectoryRecorder(record, keyframe_interval))
+        if lineage:
+            engine.enable_lineage()
+        if profile:
+            engine.enable_profiling(keep_history=True)
+
+    start = time.perf_counter()
+
+    def progress(tick, cell_updates):
+        cells, food = engine.counts()
+        if report_every and tick % report_every == 0:
+            elapsed = time.perf_counter() - start
+            print(f"tick {tick:>8}  cells {cells:>7}  food {food:>6}  "
+                  f"{tick / elapsed:10.1f} ticks/s  {cell_updates / elapsed:12.0f} cell-updates/s", file=out)
+        return not (stop_on_extinction and not cells)
+
+    ticks_run, cell_updates = engine.run_ticks(ticks, config['generate_food'], config['allow_merge'], progress)
+    elapsed = time.perf_counter() - start
+    if config['sectors'] > 1:
+        environment = engine.gather()
+        engine.close()
+    else:
+        engine.detach_recorder()
+    return {
+        'ticks': ticks_run,
+        'seconds': elapsed,
+        'ticks_per_second': ticks_run / elapsed if elapsed else 0.0,
+        'cell_updates': cell_updates,
+        'cell_updates_per_second': cell_updates / elapsed if elapsed else 0.0,
+        'cells': len(environment.cells),
+        'food': len(environment.food),
+        'environment': environment,
+        'lineage': environment.lineage,
+        'profiler': environment.profiler,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the cell simulation without a display")
+    parser.add_argument('--config', help="JSON file overriding the default configuration")
+    parser.add_argument('--snapshot', help="start from an environment saved with file_io.save_environment")
+    parser.add_argument('--ticks', type=int, default=1000)
+    parser.add_argument('--seed', type=int, help="default 0, or the random state saved in --snapshot")
+    parser.add_argument('--backend', choices=['object', 'numpy'])
+    parser.add_argument('--radius', type=float)
+    parser.add_argument('--time-step', type=float)
+    parser.add_argument('--sectors', type=int, help="split the dish across this many worker processes")
+    parser.add_argument('--report-every', type=int, default=0, help="print progress every N ticks")
+    parser.add_argument('--stop-on-extinction', action='store_true')
+    parser.add_argument('--save', help="save the final environment to this file")
+    parser.add_argument('--export-json', help="also write the final environment as readable JSON")
+    parser.add_argument('--record', help="record every tick to this file for replay.py")
+    parser.add_argument('--keyframe-every', type=int, default=100, help="ticks between full keyframes in --record")
+    parser.add_argument('--lineage', action='store_true', help="track ancestry and report the surviving clades")
+    parser.add_argument('--profile', help="time every phase of every tick and write them to this .csv or .json file")
+    args = parser.parse_args(argv)
+
+    config = load_config(args.config, {'backend': args.backend, 'radius': args.radius, 'time_step': args.time_step,
+                                        'sectors': args.sectors})
+    seed = 0 if args.seed is None and not args.snapshot else args.seed
+    result = run(config, args.ticks, seed, args.snapshot, args.report_every, args.stop_on_extinction,
+                 record=args.record, keyframe_interval=args.keyframe_every, lineage=args.lineage,
+                 profile=bool(args.profile))
+
+    print(f"{result['ticks']} ticks in {result['seconds']:.2f}s: {result['ticks_per_second']:.1f} ticks/s, "
+          f"{result['cell_updates_per_second']:.0f} cell-updates/s, "
+          f"{result['cells']} cells, {result['food']} food")
+    if result['lineage']:
+        lineage = result['lineage']
+        lineage.prune()
+        clades = lineage.surviving_clades()
+        depth = int(lineage.view('generation').max()) if len(lineage) else 0
+        print(f"lineage: {len(lineage)} records, {len(clades)} surviving clades "
+              f"(largest {clades[0][1] if clades else 0} cells), deepest generation {depth}")
+
+    if args.profile:
+        result['profiler'].write(args.profile)
+        print("last tick and mean (ms), counts of the last tick:")
+        for line in result['profiler'].report():
+            print("  " + line)
+    if args.save:
+        file_io.save_environment(result['environment'], args.save)
+    if args.export_json:
+        file_io.save_environment_json(result['environment'], args.export_json)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,198 @@
+# lineage.py
+from array import array
+import numpy as np
+
+LOW_BITS = (1 << 64) - 1
+COLUMNS = {
+    'id_lo': 'Q',
+    'id_hi': 'Q',
+    'parent': 'q',  # Index of the parent record, -1 for a root
+    'birth': 'q',  # Tick of birth
+    'death': 'q',  # Tick of death, -1 while alive
+    'generation': 'i',  # Divisions since the first recorded ancestor
+    'dna_lo': 'Q',
+    'dna_hi': 'I',
+}
+
+
+class LineageTracker:
+    # Ancestry of every cell born by division (or merging, with the first cell
+    # as parent), one row per cell in typed arrays. A parent always has a lower
+    # index than its children. prune() drops dead branches without surviving
+    # descendants and splices out dead non-root ancestors with a single
+    # surviving child branch, so memory follows the living population rather
+    # than the number of births. Generations are stored, so depths survive the
+    # splicing, and a common ancestor of living cells is never spliced out.
+    def __init__(self, prune_every=10000):
+        self.columns = {name: array(typecode) for name, typecode in COLUMNS.items()}
+        self.living = {}  # Cell id -> row of a living cell
+        self.prune_every = prune_every  # Births between automatic prunes
+        self.births = 0
+        self.tick = 0
+
+    def __len__(self):
+        return len(self.columns['parent'])
+
+    def view(self, name):
+        # A NumPy view of one column; it must be dropped before the next append
+        return np.frombuffer(self.columns[name], self.columns[name].typecode)
+
+    def append(self, cell_id, parent, dna, generation):
+        columns = self.columns
+        columns['id_lo'].append(cell_id & LOW_BITS)
+        columns['id_hi'].append(cell_id >> 64)
+        columns['parent'].append(parent)
+        columns['birth'].append(self.tick)
+        columns['death'].append(-1)
+        columns['generation'].append(generation)
+        columns['dna_lo'].append(dna & LOW_BITS)
+        columns['dna_hi'].append(dna >> 64)
+        row = len(columns['parent']) - 1
+        self.living[cell_id] = row
+        return row
+
+    def add_root(self, cell):
+        if cell.id not in self.living:
+            self.append(cell.id, -1, cell.dna, 0)
+
+    def birth(self, parent, child):
+        row = self.living.get(parent.id)
+        if row is None:
+            # A cell added by hand (or before tracking started) becomes a root
+            row = self.append(parent.id, -1, parent.dna, 0)
+        self.append(child.id, row, child.dna, self.columns['generation'][row] + 1)
+        self.births += 1
+
+    def deaths(self, cell_ids):
+        death = self.columns['death']
+        for cell_id in cell_ids:
+            row = self.living.pop(cell_id, None)
+            if row is not None:
+                death[row] = self.tick
+
+    def end_tick(self):
+        if self.births >= self.prune_every:
+            self.prune()
+
+    def cell_id(self, row):
+        return self.columns['id_lo'][row] | self.columns['id_hi'][row] << 64
+
+    def record(self, cell_id):
+        columns = self.columns
+        row = self.row(cell_id)
+        return {
+            'id': self.cell_id(row),
+            'parent': self.cell_id(columns['parent'][row]) if columns['parent'][row] >= 0 else None,
+            'birth': columns['birth'][row],
+            'death': columns['death'][row] if columns['death'][row] >= 0 else None,
+            'generation': columns['generation'][row],
+            'dna': columns['dna_lo'][row] | columns['dna_hi'][row] << 64,
+        }
+
+    def prune(self):
+        self.births = 0
+        count = len(self)
+        if not count:
+            return
+        parent = self.view('parent')
+        alive = self.view('death') < 0
+
+        # Mark every ancestor of a living cell, one generation per step
+        keep = alive.copy()
+        frontier = np.flatnonzero(alive)
+        while len(frontier):
+            ancestors = parent[frontier]
+            ancestors = np.unique(ancestors[ancestors >= 0])
+            frontier = ancestors[~keep[ancestors]]
+            keep[frontier] = True
+
+        # Dead ancestors with one surviving child branch are spliced out, roots
+        # excepted; the -1 of a root is mapped to a sentinel row that points to itself
+        children = np.bincount(parent[keep & (parent >= 0)], minlength=count)
+        splice = keep & ~alive & (children == 1) & (parent >= 0)
+        rows = np.arange(count + 1)
+        above = np.append(np.where(parent >= 0, parent, count), count)
+        target = np.where(np.append(splice, False), above, rows)
+        while True:
+            jumped = target[target]
+            if np.array_equal(jumped, target):
+                break
+            target = jumped
+
+        keep &= ~splice
+        index = np.append(np.cumsum(keep) - 1, -1)
+        kept = {name: self.view(name)[keep] for name in COLUMNS}
+        kept['parent'] = index[target[above[:count]]][keep]
+        self.columns = {name: array(COLUMNS[name], kept[name].tobytes()) for name in COLUMNS}
+        live_rows = np.flatnonzero(kept['death'] < 0)
+        self.living = {self.cell_id(row): row for row in live_rows.tolist()}
+
+    def truncate(self, tick):
+        # Forget what happened after tick, e.g. after rewinding to a checkpoint.
+        # Rows born later form whole subtrees at the end of the arrays. Rows
+        # pruned since tick are not brought back; their cells start new roots.
+        birth = self.view('birth')
+        end = int(np.searchsorted(birth, tick, side='right'))
+        del birth
+        for column in self.columns.values():
+            del column[end:]
+        death = self.view('death')
+        reborn = np.flatnonzero(death > tick)
+        death[reborn] = -1
+        del death
+        self.living = {cell_id: row for cell_id, row in self.living.items() if row < end}
+        self.living.update((self.cell_id(row), row) for row in reborn.tolist())
+
+    # Queries take cell ids; they answer for pruned history too, as long as the
+    # cells themselves are still recorded
+
+    def row(self, cell_id):
+        row = self.living.get(cell_id)
+        if row is not None:
+            return row
+        matches = np.flatnonzero((self.view('id_lo') == (cell_id & LOW_BITS)) & (self.view('id_hi') == cell_id >> 64))
+        if not len(matches):
+            raise KeyError(cell_id)
+        return int(matches[0])
+
+    def depth(self, cell_id):
+        return self.columns['generation'][self.row(cell_id)]
+
+    def ancestors(self, cell_id):
+        # Recorded ancestors, nearest first
+        parent = self.columns['parent']
+        row = parent[self.row(cell_id)]
+        rows = []
+        while row >= 0:
+            rows.append(row)
+            row = parent[row]
+        return [self.cell_id(row) for row in rows]
+
+    def common_ancestor(self, cell_id, other_id):
+        # The most recent common ancestor (possibly one of the two cells), or None
+        parent = self.columns['parent']
+        a = self.row(cell_id)
+        b = self.row(other_id)
+        while a != b and a >= 0 and b >= 0:
+            if a > b:
+                a = parent[a]
+            else:
+                b = parent[b]
+        return self.cell_id(a) if a == b and a >= 0 else None
+
+    def surviving_clades(self):
+        # (root id, living descendants) for every root with living cells, largest first
+        count = len(self)
+        if not count:
+            return []
+        parent = self.view('parent')
+        root = np.where(parent >= 0, parent, np.arange(count))
+        while True:
+            jumped = root[root]
+            if np.array_equal(jumped, root):
+                break
+            root = jumped
+        sizes = np.bincount(root[self.view('death') < 0], minlength=count)
+        order = np.flatnonzero(sizes)
+        order = order[np.argsort(-sizes[order], kind='stable')]
+        return [(self.cell_id(row), int(sizes[row])) for row in order.tolist()]
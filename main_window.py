@@ -1,14 +1,18 @@
 from PyQt5.QtWidgets import QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QLabel, QCheckBox
-from PyQt5.QtCore import QTimer, Qt
+from PyQt5.QtCore import Qt, QTimer
 from PyQt5.QtGui import QFont
 from renderer import Renderer
-from simulation import SimulationEngine
+from simulation_worker import SimulationWorker
+import simulation_worker as commands
 from environment import Environment
-from cell import Cell, Genome, Bacteria, Phagocyte, Photocyte
 from cell_editor import CellEditor
 from dna_viewer import DNAViewer
-import random
-import math
+from stats_panel import StatsPanel
+
+CHECKPOINT_INTERVAL = 10  # Ticks between rewind checkpoints
+CHECKPOINT_BUDGET = 64 * 2 ** 20  # Bytes of checkpoints kept before older ones are thinned out
+REWIND_TICKS = 100
+STATS_REFRESH_MS = 250  # The stats panel updates a few times a second, not every frame
 
 class MainWindow(QMainWindow):
     def __init__(self):
@@ -26,7 +30,11 @@ class MainWindow(QMainWindow):
         self.environment = Environment(250)  # Radius of 250
         self.renderer = Renderer(self.environment)
         self.renderer.cell_selected.connect(self.on_cell_selected)
+        self.renderer.food_added.connect(lambda x, y, radius: self.worker.submit(commands.add_food, x, y, radius))
+        self.renderer.food_erased.connect(lambda x, y, radius: self.worker.submit(commands.erase_food, x, y, radius))
+        self.renderer.cell_moved.connect(lambda cell, x, y: self.worker.submit(commands.move_cell, cell.id, x, y))
         self.simulation_layout.addWidget(self.renderer)
+        self.selected_id = None
 
         self.control_layout = QVBoxLayout()
         self.simulation_layout.addLayout(self.control_layout)
@@ -44,11 +52,25 @@ class MainWindow(QMainWindow):
 
         self.top_left_control_layout.addWidget(self.renderer.draw_food_button)
         self.top_left_control_layout.addWidget(self.renderer.erase_food_button)
+        self.top_left_control_layout.addWidget(self.renderer.brush_radius_box)
 
         self.generate_food_checkbox = QCheckBox("Generate Food")
         self.generate_food_checkbox.setChecked(True)
+        self.generate_food_checkbox.toggled.connect(self.set_generate_food)
         self.top_left_control_layout.addWidget(self.generate_food_checkbox)
 
+        self.sprite_renderer_checkbox = QCheckBox("Sprite Renderer")
+        self.sprite_renderer_checkbox.toggled.connect(self.toggle_sprite_renderer)
+        self.top_left_control_layout.addWidget(self.sprite_renderer_checkbox)
+
+        self.profile_checkbox = QCheckBox("Profile")
+        self.profile_checkbox.toggled.connect(self.set_profiling)
+        self.top_left_control_layout.addWidget(self.profile_checkbox)
+
+        self.nutrients_checkbox = QCheckBox("Nutrient Field")
+        self.nutrients_checkbox.toggled.connect(self.set_nutrients)
+        self.top_left_control_layout.addWidget(self.nutrients_checkbox)
+
         # Zoom buttons
         self.zoom_in_button = QPushButton("Zoom In")
         self.zoom_in_button.clicked.connect(self.zoom_in)
@@ -66,6 +88,20 @@ class MainWindow(QMainWindow):
         self.start_button.setStyleSheet("background-color: green")
         self.main_control_layout.addWidget(self.start_button)
 
+        self.step_back_button = QPushButton("Step Back")
+        self.step_back_button.clicked.connect(lambda: self.worker.submit(commands.step_back, self.simulation))
+        self.main_control_layout.addWidget(self.step_back_button)
+
+        self.fast_forward_button = QPushButton("Fast Forward")
+        self.fast_forward_button.setCheckable(True)
+        self.fast_forward_button.toggled.connect(lambda checked: self.worker.set_fast_forward(checked))
+        self.main_control_layout.addWidget(self.fast_forward_button)
+
+        self.rewind_button = QPushButton("Rewind")
+        self.rewind_button.clicked.connect(
+            lambda: self.worker.submit(commands.rewind, self.simulation, REWIND_TICKS))
+        self.main_control_layout.addWidget(self.rewind_button)
+
         self.add_cell_button = QPushButton("Add Cell")
         self.add_cell_button.clicked.connect(lambda: self.add_random_cell("cell"))
         self.main_control_layout.addWidget(self.add_cell_button)
@@ -92,77 +128,95 @@ class MainWindow(QMainWindow):
 
         self.dna_viewer = DNAViewer()
         self.right_panel_layout.addWidget(self.dna_viewer)
-        self.right_panel_layout.addStretch()  # Add stretch to push DNAViewer to the bottom
 
-        self.simulation = SimulationEngine(self.environment)
+        self.stats_panel = StatsPanel()
+        self.right_panel_layout.addWidget(self.stats_panel)
+        self.stats_timer = QTimer(self)
+        self.stats_timer.timeout.connect(self.refresh_stats)
+        self.stats_timer.start(STATS_REFRESH_MS)
+        self.right_panel_layout.addStretch()  # Add stretch to push DNAViewer to the bottom
 
-        self.timer = QTimer(self)
-        self.timer.timeout.connect(self.update_simulation)
+        # The simulation ticks on its own thread; this window only shows the
+        # snapshots it publishes and queues edits back to it
+        self.worker = SimulationWorker(self.environment)
+        self.simulation = self.worker.engine
+        self.simulation.enable_checkpoints(CHECKPOINT_INTERVAL, CHECKPOINT_BUDGET)
+        self.worker.snapshot_ready.connect(self.show_snapshot)
+        self.worker.start()
 
     def toggle_simulation(self):
-        if self.timer.isActive():
-            self.timer.stop()
+        if self.worker.running:
+            self.worker.set_running(False)
             self.start_button.setText("Start")
             self.start_button.setStyleSheet("background-color: green")
         else:
-            self.timer.start(16)  # ~60 FPS
+            self.worker.set_running(True)
             self.start_button.setText("Stop")
             self.start_button.setStyleSheet("background-color: red")
 
-    def update_simulation(self):
-        self.simulation.update(
-            generate_food=self.generate_food_checkbox.isChecked(),
-            #allow_merge=self.merge_cells_checkbox.isChecked()
-        )
+    def set_generate_food(self, checked):
+        self.worker.generate_food = checked
+
+    def show_snapshot(self):
+        snapshot = self.worker.snapshots.acquire()
+        if snapshot is None:
+            return  # A later signal already delivered the newest snapshot
+
+        self.renderer.environment = snapshot
+        if self.selected_id is not None:
+            selected = snapshot.cell(self.selected_id)
+            if selected is None:
+                self.renderer.selected_cell = None
+                self.on_cell_selected(None)  # The selected cell has died
+            else:
+                self.renderer.selected_cell = selected
+                self.cell_editor.refresh(selected)
+                self.dna_viewer.set_cell(selected)
         self.renderer.render()
-        self.cell_count_label.setText(f"Cell Count: {len(self.environment.cells)}")
-
-    def add_random_cell(self, cell_type):
-        angle = random.uniform(0, 2 * math.pi)
-        distance = random.uniform(0, self.environment.radius)
-        x = self.environment.center[0] + math.cos(angle) * distance
-        y = self.environment.center[1] + math.sin(angle) * distance
-
-        if cell_type == "bacteria":
-            cell = Bacteria(Genome(), (x, y))
-        elif cell_type == "phagocyte":
-            cell = Phagocyte(Genome(), (x, y))
-        elif cell_type == "photocyte":
-            cell = Photocyte(Genome(), (x, y))
+        if snapshot.speedup is None:
+            self.cell_count_label.setText(f"Cell Count: {len(snapshot.cells)}")
         else:
-            cell = Cell(Genome(), (x, y))
+            self.cell_count_label.setText(f"Cell Count: {len(snapshot.cells)}   Speed: {snapshot.speedup:.1f}x")
 
-        self.environment.add_cell(cell)
-        self.renderer.render()
+    def refresh_stats(self):
+        # The newest snapshot this window has shown carries the stats of its tick
+        snapshot = self.worker.snapshots.front
+        if snapshot is not None and snapshot.stats is not None:
+            self.stats_panel.show_stats(snapshot.stats)
+
+    def add_random_cell(self, cell_type):
+        self.worker.submit(commands.add_random_cell, cell_type)
 
     def delete_selected_cell(self):
         if self.renderer.selected_cell:
-            self.environment.remove_cell(self.renderer.selected_cell)
+            self.worker.submit(commands.remove_cell, self.renderer.selected_cell.id)
             self.renderer.selected_cell = None
-            self.cell_editor.set_cell(None)
-            self.dna_viewer.set_cell(None)
-            self.delete_cell_button.setEnabled(False)
-            self.renderer.render()
+            self.on_cell_selected(None)
 
     def on_cell_selected(self, cell):
+        self.selected_id = cell.id if cell is not None else None
         self.cell_editor.set_cell(cell)
         self.dna_viewer.set_cell(cell)
         self.delete_cell_button.setEnabled(cell is not None)
 
-    def on_cell_updated(self, cell):
-        self.renderer.render()
+    def on_cell_updated(self, cell, genes, never_consume):
+        self.worker.submit(commands.edit_cell, cell.id, genes, never_consume)
 
     def populate_random(self):
         for _ in range(5):
             self.add_random_cell("cell")
             self.add_random_cell("bacteria")
-        for _ in range(20):
-            angle = random.uniform(0, 2 * math.pi)
-            distance = random.uniform(0, self.environment.radius)
-            x = self.environment.center[0] + math.cos(angle) * distance
-            y = self.environment.center[1] + math.sin(angle) * distance
-            self.environment.food.append((x, y))
-        self.renderer.render()
+        self.worker.submit(commands.add_random_food, 20)
+
+    def set_profiling(self, checked):
+        self.renderer.set_profiling(checked)
+        self.worker.submit(commands.set_profiling, self.simulation, checked)
+
+    def set_nutrients(self, checked):
+        self.worker.submit(commands.set_nutrients, checked)
+
+    def toggle_sprite_renderer(self, checked):
+        self.renderer.set_backend('painter' if checked else 'scene')
 
     def zoom_in(self):
         self.renderer.zoom_in()
@@ -170,6 +224,10 @@ class MainWindow(QMainWindow):
     def zoom_out(self):
         self.renderer.zoom_out()
 
+    def closeEvent(self, event):
+        self.worker.stop()
+        super().closeEvent(event)
+
     def keyPressEvent(self, event):
         if event.key() == Qt.Key_W:
             self.renderer.scroll(0, -10)
@@ -0,0 +1,101 @@
+# nutrients.py
+import copy
+import math
+import numpy as np
+
+DEATH_DEPOSIT = 5.0  # Nutrient a dead cell leaves behind, as much as the food particle it would drop
+IMAGE_SATURATION = 2.0  # Concentration drawn fully opaque
+IMAGE_COLOR = (120, 200, 60)
+
+
+class NutrientField:
+    # Nutrient concentration on a square grid laid over the dish, for media too
+    # rich to model as food particles. Every tick it diffuses between touching
+    # squares of the dish, decays and is topped up by supply; cells absorb from
+    # the square under their centre. Each step works on the whole grid at once,
+    # so it costs the same however much nutrient there is.
+    def __init__(self, radius, center, spacing=5.0, diffusion=20.0, decay=0.01, supply=0.005, uptake=1.0,
+                 initial=0.5):
+        self.radius = radius
+        self.center = center
+        self.spacing = spacing  # Width of a square in world units
+        self.diffusion = diffusion  # World units squared per unit of time
+        self.decay = decay  # Fraction lost per unit of time
+        self.supply = supply  # Added to every square per unit of time
+        self.uptake = uptake  # Most a cell absorbs per unit of its size per unit of time
+        self.initial = initial
+        size = math.ceil(2 * radius / spacing)
+        self.origin = (center[0] - radius, center[1] - radius)
+        # Squares touching the dish, so every point inside it falls in one; rows are y
+        offsets = (np.arange(size) + 0.5) * spacing - radius
+        reach = radius + spacing * math.sqrt(0.5)
+        self.inside = offsets[None, :] ** 2 + offsets[:, None] ** 2 <= reach * reach
+        self.open_x = self.inside[:, 1:] & self.inside[:, :-1]
+        self.open_y = self.inside[1:, :] & self.inside[:-1, :]
+        self.grid = np.where(self.inside, float(initial), 0.0)
+
+    def settings(self):
+        return {'spacing': self.spacing, 'diffusion': self.diffusion, 'decay': self.decay, 'supply': self.supply,
+                'uptake': self.uptake, 'initial': self.initial}
+
+    def copy(self):
+        # The masks never change after construction and are shared
+        field = copy.copy(self)
+        field.grid = self.grid.copy()
+        return field
+
+    def total(self):
+        return float(self.grid.sum())
+
+    def step(self, dt):
+        grid = self.grid
+        # Explicit diffusion is only stable up to a quarter per step; nothing
+        # flows across the edge of the dish
+        rate = min(0.25, self.diffusion * dt / self.spacing ** 2)
+        if rate > 0:
+            flow_x = (grid[:, 1:] - grid[:, :-1]) * self.open_x
+            flow_y = (grid[1:, :] - grid[:-1, :]) * self.open_y
+            flow_x *= rate
+            flow_y *= rate
+            grid[:, :-1] += flow_x
+            grid[:, 1:] -= flow_x
+            grid[:-1, :] += flow_y
+            grid[1:, :] -= flow_y
+        if self.decay:
+            grid *= max(0.0, 1 - self.decay * dt)
+        if self.supply:
+            grid += self.inside * (self.supply * dt)
+
+    def indices(self, xs, ys):
+        # Flat grid index of the square under every point
+        rows, cols = self.grid.shape
+        col = np.clip(((np.asarray(xs, dtype=float) - self.origin[0]) / self.spacing).astype(np.intp), 0, cols - 1)
+        row = np.clip(((np.asarray(ys, dtype=float) - self.origin[1]) / self.spacing).astype(np.intp), 0, rows - 1)
+        return row * cols + col
+
+    def absorb(self, xs, ys, sizes, dt):
+        # Takes what cells of the given sizes at (xs, ys) absorb and returns it
+        # per cell. Cells sharing a square that runs short split what is left
+        # in proportion to their demand.
+        index = self.indices(xs, ys)
+        demand = self.uptake * dt * np.asarray(sizes, dtype=float)
+        flat = self.grid.reshape(-1)
+        wanted = np.bincount(index, demand, minlength=flat.size)
+        share = np.ones(flat.size)
+        short = wanted > flat
+        share[short] = flat[short] / wanted[short]
+        taken = demand * share[index]
+        flat -= np.bincount(index, taken, minlength=flat.size)
+        np.maximum(flat, 0.0, out=flat)
+        return taken
+
+    def deposit(self, xs, ys, amount=DEATH_DEPOSIT):
+        np.add.at(self.grid.reshape(-1), self.indices(xs, ys), amount)
+
+    def image(self):
+        # RGBA bytes, one pixel per square, more opaque where there is more nutrient
+        rows, cols = self.grid.shape
+        pixels = np.empty((rows, cols, 4), dtype=np.uint8)
+        pixels[:, :, :3] = IMAGE_COLOR
+        pixels[:, :, 3] = np.clip(self.grid * (255 / IMAGE_SATURATION), 0, 255)
+        return pixels
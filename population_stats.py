@@ -0,0 +1,138 @@
+# population_stats.py
+import math
+
+# Genes summarised by PopulationStats: every trait, with color split into its
+# channels and flags counted as 0/1 so their mean is the share of carriers.
+# Size is left out because it follows energy every tick.
+GENE_STATS = ('speed', 'energy_efficiency', 'division_threshold', 'color_r', 'color_g', 'color_b', 'has_tail',
+              'can_consume', 'consumption_size_ratio', 'nitrogen_reserve', 'adhesin', 'radiation_sensitivity')
+ENERGY_BINS = 10
+MAX_ENERGY = 100  # Cells cap their energy here
+
+
+def trait_values(traits):
+    color = traits.color
+    return (traits.speed, traits.energy_efficiency, traits.division_threshold, color[0], color[1], color[2],
+            int(traits.has_tail), int(traits.can_consume), traits.consumption_size_ratio, traits.nitrogen_reserve,
+            int(traits.adhesin), traits.radiation_sensitivity)
+
+
+class PopulationStats:
+    # Population totals kept up to date as cells are added and removed, so
+    # reading them costs the same for ten cells or a million. Each cell's
+    # genes are counted as they were when it was added (mutation happens
+    # before that) and subtracted the same way when it goes, so later edits
+    # must go through refresh(). Energy changes for every cell every tick, so
+    # its histogram is a sample refreshed by sample_energy() instead.
+    def __init__(self):
+        self.counted = {}  # Cell id -> (type, traits) as counted
+        self.types = {}
+        self.predators = 0  # Cells with the can_consume gene
+        self.sums = [0.0] * len(GENE_STATS)
+        self.squares = [0.0] * len(GENE_STATS)
+        self.births = 0
+        self.deaths = 0
+        self.consumed = 0
+        self.merges = 0
+        self.energy_histogram = [0] * ENERGY_BINS
+        self.energy_sampled_at = None
+
+    def __len__(self):
+        return len(self.counted)
+
+    def add(self, cell):
+        if cell.id in self.counted:
+            return
+        traits = cell.genome.traits
+        self.counted[cell.id] = (cell.type, traits)
+        self.types[cell.type] = self.types.get(cell.type, 0) + 1
+        self.predators += bool(traits.can_consume)
+        sums = self.sums
+        squares = self.squares
+        for i, value in enumerate(trait_values(traits)):
+            sums[i] += value
+            squares[i] += value * value
+
+    def remove(self, cell_id):
+        counted = self.counted.pop(cell_id, None)
+        if counted is None:
+            return
+        cell_type, traits = counted
+        remaining = self.types[cell_type] - 1
+        if remaining:
+            self.types[cell_type] = remaining
+        else:
+            del self.types[cell_type]
+        self.predators -= bool(traits.can_consume)
+        sums = self.sums
+        squares = self.squares
+        for i, value in enumerate(trait_values(traits)):
+            sums[i] -= value
+            squares[i] -= value * value
+        if not self.counted:
+            # Start the next population from exact zeros
+            self.sums = [0.0] * len(GENE_STATS)
+            self.squares = [0.0] * len(GENE_STATS)
+
+    def refresh(self, cell):
+        # Recount a cell whose genes or type were changed in place
+        self.remove(cell.id)
+        self.add(cell)
+
+    def rebuild(self, cells):
+        # Recount from scratch, e.g. after restoring a checkpoint; event counters are kept
+        self.counted = {}
+        self.types = {}
+        self.predators = 0
+        self.sums = [0.0] * len(GENE_STATS)
+        self.squares = [0.0] * len(GENE_STATS)
+        for cell in cells:
+            self.add(cell)
+
+    def sample_energy(self, energies, tick=None):
+        histogram = [0] * ENERGY_BINS
+        scale = ENERGY_BINS / MAX_ENERGY
+        last = ENERGY_BINS - 1
+        for energy in energies:
+            histogram[min(last, max(0, int(energy * scale)))] += 1
+        self.energy_histogram = histogram
+        self.energy_sampled_at = tick
+
+    def mean(self, gene):
+        count = len(self.counted)
+        return self.sums[GENE_STATS.index(gene)] / count if count else 0.0
+
+    def variance(self, gene):
+        count = len(self.counted)
+        if not count:
+            return 0.0
+        i = GENE_STATS.index(gene)
+        mean = self.sums[i] / count
+        return max(0.0, self.squares[i] / count - mean * mean)
+
+    def predator_prey_ratio(self):
+        prey = len(self.counted) - self.predators
+        return self.predators / prey if prey else math.inf if self.predators else 0.0
+
+    def summary(self):
+        # A plain copy for other threads, e.g. attached to a published snapshot
+        count = len(self.counted)
+        genes = {}
+        for i, gene in enumerate(GENE_STATS):
+            mean = self.sums[i] / count if count else 0.0
+            variance = max(0.0, self.squares[i] / count - mean * mean) if count else 0.0
+            genes[gene] = (mean, variance)
+        return {
+            'cells': count,
+            'types': dict(self.types),
+            'predators': self.predators,
+            'prey': count - self.predators,
+            'predator_prey_ratio': self.predator_prey_ratio(),
+            'genes': genes,
+            'energy_histogram': list(self.energy_histogram),
+            'energy_sampled_at': self.energy_sampled_at,
+            'births': self.births,
+            'deaths': self.deaths,
+            'consumed': self.consumed,
+            'merges': self.merges,
+        }
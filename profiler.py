@@ -0,0 +1,108 @@
+# profiler.py
+import csv
+import json
+import time
+
+perf_counter = time.perf_counter
+
+
+def report(summary):
+    # Text lines for a PhaseProfiler.summary(): last frame and mean time of
+    # every phase in milliseconds, then the counts of the last frame
+    means = summary['mean_times']
+    lines = [f"{phase:<20} {seconds * 1000:7.2f} {means.get(phase, 0.0) * 1000:7.2f} ms"
+             for phase, seconds in summary['last_times'].items()]
+    lines += [f"{name:<20} {amount:7d}" for name, amount in summary['last_counts'].items()]
+    return lines
+
+
+class PhaseProfiler:
+    # Wall time per phase and event counts, collected for one frame (a tick or
+    # a rendered frame) at a time. Code being profiled holds None instead of a
+    # profiler when profiling is off, so the only cost then is that check:
+    #
+    #     start = perf_counter()
+    #     ...
+    #     start = profiler.lap('phase', start)
+    #     profiler.count('items', n)
+    #
+    # end_frame() closes a frame. Totals are kept for the whole run and, with
+    # keep_history, every frame as well for dumping to CSV or JSON.
+    def __init__(self, keep_history=False):
+        self.times = {}
+        self.counts = {}
+        self.last_times = {}
+        self.last_counts = {}
+        self.total_times = {}
+        self.total_counts = {}
+        self.frames = 0
+        self.history = [] if keep_history else None
+
+    def lap(self, phase, start):
+        # Adds the time since start to phase and returns now, the start of the next phase
+        now = perf_counter()
+        self.times[phase] = self.times.get(phase, 0.0) + now - start
+        return now
+
+    def count(self, name, amount=1):
+        self.counts[name] = self.counts.get(name, 0) + amount
+
+    def end_frame(self):
+        for phase, seconds in self.times.items():
+            self.total_times[phase] = self.total_times.get(phase, 0.0) + seconds
+        for name, amount in self.counts.items():
+            self.total_counts[name] = self.total_counts.get(name, 0) + amount
+        if self.history is not None:
+            self.history.append((self.times, self.counts))
+        self.last_times = self.times
+        self.last_counts = self.counts
+        self.times = {}
+        self.counts = {}
+        self.frames += 1
+
+    def mean_times(self):
+        return {phase: seconds / self.frames for phase, seconds in self.total_times.items()} if self.frames else {}
+
+    def summary(self):
+        # Plain data for other threads and for JSON
+        return {
+            'frames': self.frames,
+            'last_times': dict(self.last_times),
+            'last_counts': dict(self.last_counts),
+            'mean_times': self.mean_times(),
+            'total_counts': dict(self.total_counts),
+        }
+
+    def report(self):
+        return report(self.summary())
+
+    def columns(self):
+        phases = {}
+        counters = {}
+        for times, counts in self.history or ():
+            phases.update(dict.fromkeys(times))
+            counters.update(dict.fromkeys(counts))
+        return list(phases), list(counters)
+
+    def write_csv(self, filename):
+        # One row per frame; phase times in milliseconds
+        phases, counters = self.columns()
+        with open(filename, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['frame'] + [phase + '_ms' for phase in phases] + counters)
+            for frame, (times, counts) in enumerate(self.history or ()):
+                writer.writerow([frame + 1] + [f"{times.get(phase, 0.0) * 1000:.4f}" for phase in phases]
+                                + [counts.get(name, 0) for name in counters])
+
+    def write_json(self, filename):
+        data = self.summary()
+        if self.history is not None:
+            data['history'] = [{'times': times, 'counts': counts} for times, counts in self.history]
+        with open(filename, 'w') as f:
+            json.dump(data, f, indent=2)
+
+    def write(self, filename):
+        if filename.endswith('.json'):
+            self.write_json(filename)
+        else:
+            self.write_csv(filename)
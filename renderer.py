@@ -1,8 +1,13 @@
-from PyQt5.QtWidgets import QGraphicsScene, QGraphicsView, QGraphicsEllipseItem, QGraphicsPolygonItem, QToolButton, QVBoxLayout, QWidget, QLabel
-from PyQt5.QtGui import QColor, QPen, QPainter, QPolygonF
+from PyQt5.QtWidgets import QGraphicsScene, QGraphicsView, QGraphicsEllipseItem, QGraphicsPolygonItem, QToolButton, QVBoxLayout, QWidget, QLabel, QSpinBox
+from PyQt5.QtGui import QColor, QPen, QPainter, QPolygonF, QFont, QImage
 from PyQt5.QtCore import Qt, QRectF, QPointF, pyqtSignal
+from sprite_atlas import SpriteAtlas
+from profiler import PhaseProfiler, perf_counter, report
 import math
 
+DEFAULT_BRUSH_RADIUS = 10  # Scene units; the spin box under the food tools changes it
+LOD_ZOOM = 0.5  # Below this scale cells lose tails and halos, and food is drawn as density
+
 class CellItem(QGraphicsEllipseItem):
     def __init__(self, cell, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -10,8 +15,95 @@ class CellItem(QGraphicsEllipseItem):
         self.setFlag(QGraphicsEllipseItem.ItemIsSelectable, True)
         self.setFlag(QGraphicsEllipseItem.ItemIsMovable, True)
 
+class CellGraphics:
+    # The scene items that draw one cell, kept alive across frames
+    def __init__(self, cell, scene, pen):
+        self.body = CellItem(cell)
+        self.body.setPen(pen)
+        self.body.setZValue(1)
+        scene.addItem(self.body)
+        self.halo = None
+        self.tail = None
+        self.size = None
+        self.color = None
+        self.angle = None
+
+    def update(self, cell, scene, detailed=True):
+        self.body.cell = cell
+        x, y = cell.position
+        size = max(cell.genome.genes['size'], 15)
+        rgb = cell.genome.genes['color']
+        has_tail = detailed and cell.genome.genes['has_tail']
+        adhesin = detailed and cell.adhesin
+
+        # Halo and tail come and go with the adhesin/has_tail genes and the level
+        # of detail; new items need their full geometry and colour set below
+        if adhesin and self.halo is None:
+            self.halo = QGraphicsEllipseItem()
+            self.halo.setPen(QPen(Qt.NoPen))
+            scene.addItem(self.halo)
+            self.size = self.color = None
+        elif not adhesin and self.halo is not None:
+            scene.removeItem(self.halo)
+            self.halo = None
+        if has_tail and self.tail is None:
+            self.tail = QGraphicsPolygonItem()
+            self.tail.setZValue(2)
+            scene.addItem(self.tail)
+            self.size = self.color = None
+        elif not has_tail and self.tail is not None:
+            scene.removeItem(self.tail)
+            self.tail = None
+
+        resized = size != self.size
+        recoloured = rgb != self.color
+        color = QColor.fromRgbF(*rgb) if recoloured else None
+
+        self.body.setPos(x, y)
+        if resized:
+            self.body.setRect(-size / 2, -size / 2, size, size)
+        if recoloured:
+            self.body.setBrush(color)
+
+        if self.halo is not None:
+            self.halo.setPos(x, y)
+            if resized:
+                adhesin_size = size + 20
+                self.halo.setRect(-adhesin_size / 2, -adhesin_size / 2, adhesin_size, adhesin_size)
+            if recoloured:
+                adhesin_color = QColor(color)
+                adhesin_color.setAlpha(100)
+                self.halo.setBrush(adhesin_color)
+
+        if self.tail is not None:
+            self.tail.setPos(x, y)
+            if resized or cell.angle != self.angle:
+                tail_length = size * 1.5
+                self.tail.setPolygon(QPolygonF([
+                    QPointF(0, 0),
+                    QPointF(-size / 4, -size / 4),
+                    QPointF(math.cos(cell.angle) * tail_length, math.sin(cell.angle) * tail_length),
+                    QPointF(size / 4, -size / 4)
+                ]))
+                self.angle = cell.angle
+            if recoloured:
+                self.tail.setBrush(color)
+
+        self.size = size
+        self.color = rgb
+
+    def remove(self, scene):
+        for item in (self.body, self.halo, self.tail):
+            if item is not None:
+                scene.removeItem(item)
+
+
 class Renderer(QGraphicsView):
     cell_selected = pyqtSignal(object)
+    # Edits are only requested here; whoever owns the environment applies them
+    food_added = pyqtSignal(float, float, float)  # x, y, brush radius
+    food_erased = pyqtSignal(float, float, float)
+    cell_moved = pyqtSignal(object, float, float)
 
     def __init__(self, environment, parent=None):
         super().__init__(parent)
@@ -22,8 +114,24 @@ class Renderer(QGraphicsView):
         self.setViewportUpdateMode(QGraphicsView.FullViewportUpdate)
         self.setDragMode(QGraphicsView.ScrollHandDrag)
         self.selected_cell = None
+        self.cell_graphics = {}  # Cell id -> CellGraphics
+        self.food_items = []
+        self.visible_food = 0
+        self.highlighted = None
+        self.nutrient_image = None
+        self.nutrient_stamp = None
+        self.food_density_colors = [QColor(0, 255, 0, min(255, 40 + 30 * count)) for count in range(8)]
+        self.cell_pen = QPen(Qt.black, 0.5)
+        self.highlight_pen = QPen(Qt.red, 2)
+        self.food_pen = QPen(Qt.green, 2, Qt.SolidLine, Qt.RoundCap)
+        self.backend = 'scene'  # 'scene' keeps graphics items, 'painter' blits sprites in drawForeground
+        self.atlas = SpriteAtlas()
         self.draw_food_mode = False
         self.erase_food_mode = False
+        self.brush_radius = DEFAULT_BRUSH_RADIUS
+        self.profiler = None  # PhaseProfiler while the profiling overlay is on
+        self.profile_font = QFont('Monospace', 8)
+        self.profile_font.setStyleHint(QFont.TypeWriter)
 
         self.draw_food_button = QToolButton()
         self.draw_food_button.setText("Draw Food")
@@ -35,9 +143,16 @@ class Renderer(QGraphicsView):
         self.erase_food_button.setCheckable(True)
         self.erase_food_button.clicked.connect(self.toggle_erase_food_mode)
 
+        self.brush_radius_box = QSpinBox()
+        self.brush_radius_box.setRange(1, 100)
+        self.brush_radius_box.setValue(DEFAULT_BRUSH_RADIUS)
+        self.brush_radius_box.setPrefix("Brush ")
+        self.brush_radius_box.valueChanged.connect(self.set_brush_radius)
+
         self.tool_layout = QVBoxLayout()
         self.tool_layout.addWidget(self.draw_food_button)
         self.tool_layout.addWidget(self.erase_food_button)
+        self.tool_layout.addWidget(self.brush_radius_box)
 
         self.tool_widget = QWidget()
         self.tool_widget.setLayout(self.tool_layout)
@@ -49,103 +164,280 @@ class Renderer(QGraphicsView):
         self.setVerticalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
         self.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
 
+        self.boundary = QGraphicsEllipseItem(0, 0, self.environment.radius * 2, self.environment.radius * 2)
+        self.boundary.setPen(QPen(Qt.black, 2))
+        self.boundary.setZValue(-1)
+        self.scene.addItem(self.boundary)
+
+    def set_backend(self, backend):
+        if backend == self.backend:
+            return
+        if backend == 'painter':
+            # The painter draws everything itself, so drop the retained items
+            for graphics in self.cell_graphics.values():
+                graphics.remove(self.scene)
+            for item in self.food_items:
+                self.scene.removeItem(item)
+            self.cell_graphics.clear()
+            self.food_items.clear()
+            self.visible_food = 0
+            self.highlighted = None
+        self.backend = backend
+        self.render()
+        self.viewport().update()
+
+    def set_profiling(self, enabled):
+        # Times the phases of render and painting, and overlays them with the
+        # simulation's own timings when the environment shown carries them
+        self.profiler = PhaseProfiler() if enabled else None
+        self.viewport().update()
+
     def render(self):
+        profiler = self.profiler
+        if profiler is not None:
+            start = perf_counter()
+        if self.backend == 'painter':
+            if self.selected_cell:
+                self.energy_label.setText(f"Energy: {self.selected_cell.energy:.2f}")
+            self.viewport().update()
+            return
+
         # Store the current transformation
         current_transform = self.transform()
 
-        self.scene.clear()
+        # Only cells in view have items. They persist between frames: created
+        # when a cell comes into view, moved while it stays there and dropped
+        # once it dies or leaves
+        rect = self.visible_rect()
+        detailed = self.detailed()
+        previous = self.cell_graphics
+        current = {}
+        visible = self.visible_cells(rect)
+        if profiler is not None:
+            start = profiler.lap('render.cull', start)
+            profiler.count('visible_cells', len(visible))
+        created = 0
+        for cell in visible:
+            graphics = previous.pop(cell.id, None)
+            if graphics is None:
+                graphics = CellGraphics(cell, self.scene, self.cell_pen)
+                created += 1
+            graphics.update(cell, self.scene, detailed)
+            current[cell.id] = graphics
+        for graphics in previous.values():
+            graphics.remove(self.scene)
+            if graphics is self.highlighted:
+                self.highlighted = None
+        self.cell_graphics = current
+        if profiler is not None:
+            start = profiler.lap('render.cells', start)
+            profiler.count('items_created', created)
+            profiler.count('items_removed', len(previous))
 
-        boundary = QGraphicsEllipseItem(0, 0, self.environment.radius * 2, self.environment.radius * 2)
-        boundary.setPen(QPen(Qt.black, 2))
-        self.scene.addItem(boundary)
+        self.update_food_items(rect if detailed else None)
+        if profiler is not None:
+            profiler.lap('render.food', start)
+            profiler.count('food_items', self.visible_food)
 
-        for cell in self.environment.cells:
-            x, y = cell.position
-            size = max(cell.genome.genes['size'], 15)
-            color = QColor.fromRgbF(*cell.genome.genes['color'])
+        if self.selected_cell:
+            self.highlight_cell(self.selected_cell)
+            self.energy_label.setText(f"Energy: {self.selected_cell.energy:.2f}")
+        elif self.highlighted is not None:
+            self.highlighted.body.setPen(self.cell_pen)
+            self.highlighted = None
 
-            if cell.adhesin:
-                adhesin_size = size + 20
-                adhesin_color = QColor(color)
-                adhesin_color.setAlpha(100)
-                adhesin_item = QGraphicsEllipseItem(x - adhesin_size / 2, y - adhesin_size / 2, adhesin_size, adhesin_size)
-                adhesin_item.setBrush(adhesin_color)
-                adhesin_item.setPen(QPen(Qt.NoPen))
-                self.scene.addItem(adhesin_item)
+        # Restore the transformation
+        self.setTransform(current_transform)
 
-            cell_item = CellItem(cell, x - size / 2, y - size / 2, size, size)
-            cell_item.setBrush(color)
-            cell_item.setPen(QPen(Qt.black, 0.5))
-            self.scene.addItem(cell_item)
+    def visible_rect(self):
+        return self.mapToScene(self.viewport().rect()).boundingRect()
 
-            if cell.genome.genes['has_tail']:
-                tail_length = size * 1.5
-                tail_end_x = x + math.cos(cell.angle) * tail_length
-                tail_end_y = y + math.sin(cell.angle) * tail_length
-                tail = QGraphicsPolygonItem(QPolygonF([
-                    QPointF(x, y),
-                    QPointF(x - size / 4, y - size / 4),
-                    QPointF(tail_end_x, tail_end_y),
-                    QPointF(x + size / 4, y - size / 4)
-                ]))
-                tail.setBrush(color)
-                self.scene.addItem(tail)
+    def detailed(self):
+        return self.transform().m11() >= LOD_ZOOM
 
-        for food in self.environment.food:
-            x, y = food
-            food_item = QGraphicsEllipseItem(x - 1, y - 1, 2, 2)
-            food_item.setBrush(Qt.green)
-            self.scene.addItem(food_item)
+    def visible_cells(self, rect):
+        # Living cells that may overlap rect, in list order
+        grid = self.environment.spatial_grid()
+        # Nothing drawn reaches further than a tail (1.5 sizes) or a halo (10 past the body)
+        margin = max(grid.cell_size, 15) * 1.5 + 10
+        indices = grid.query_rect(rect.left() - margin, rect.top() - margin,
+                                  rect.right() + margin, rect.bottom() + margin)
+        indices.sort()
+        items = grid.items
+        return [items[index] for index in indices if items[index].alive]
 
-        if self.selected_cell:
-            self.highlight_cell(self.selected_cell)
-            self.energy_label.setText(f"Energy: {self.selected_cell.energy:.2f}")
+    def update_food_items(self, rect):
+        # Food dots are interchangeable, so a pool of items is reused for the
+        # particles in view. Without a rect they are left to the density overlay.
+        pool = self.food_items
+        food = self.environment.food
+        if rect is None:
+            indices = ()
+        else:
+            indices = food.query_rect(rect.left() - 1, rect.top() - 1, rect.right() + 1, rect.bottom() + 1)
+        count = 0
+        for index in indices:
+            x, y = food[index]
+            if count < len(pool):
+                item = pool[count]
+                if not item.isVisible():
+                    item.setVisible(True)
+            else:
+                item = QGraphicsEllipseItem(-1, -1, 2, 2)
+                item.setBrush(Qt.green)
+                item.setZValue(3)
+                self.scene.addItem(item)
+                pool.append(item)
+            item.setPos(x, y)
+            count += 1
+        for item in pool[count:self.visible_food]:
+            item.setVisible(False)
+        self.visible_food = count
 
-        # Resolve collisions
-        for i, cell1 in enumerate(self.environment.cells):
-            for cell2 in self.environment.cells[i+1:]:
-                if cell1.check_collision(cell2):
-                    cell1.resolve_collision(cell2)
+    def paintEvent(self, event):
+        if self.profiler is None:
+            super().paintEvent(event)
+            return
+        start = perf_counter()
+        super().paintEvent(event)
+        self.profiler.lap('paint', start)
+        self.profiler.end_frame()
 
-        # Resolve boundary collisions
-        for cell in self.environment.cells:
-            cell.resolve_boundary_collision(self.environment)
+    def drawBackground(self, painter, rect):
+        super().drawBackground(painter, rect)
+        nutrients = getattr(self.environment, 'nutrients', None)
+        if nutrients is not None:
+            self.draw_nutrients(painter, nutrients)
 
-        # Restore the transformation
-        self.setTransform(current_transform)
+    def draw_nutrients(self, painter, nutrients):
+        # The whole field as one image, smoothed as it is scaled up to the dish
+        stamp = (id(nutrients), self.environment.current_time)
+        if stamp != self.nutrient_stamp:
+            pixels = nutrients.image()
+            rows, cols = pixels.shape[:2]
+            self.nutrient_image = QImage(pixels.data, cols, rows, 4 * cols, QImage.Format_RGBA8888).copy()
+            self.nutrient_stamp = stamp
+        image = self.nutrient_image
+        painter.save()
+        painter.setRenderHint(QPainter.SmoothPixmapTransform)
+        painter.drawImage(QRectF(nutrients.origin[0], nutrients.origin[1], image.width() * nutrients.spacing,
+                                 image.height() * nutrients.spacing), image)
+        painter.restore()
+
+    def drawForeground(self, painter, rect):
+        self.draw_foreground(painter, rect)
+        if self.profiler is not None:
+            self.draw_profile(painter)
+
+    def draw_profile(self, painter):
+        # Timings of the last tick and frame (last and mean, ms) in the top left corner of the view
+        lines = []
+        simulation = getattr(self.environment, 'profile', None)
+        if simulation:
+            lines += ["simulation tick"] + report(simulation)
+        lines += ["renderer frame"] + self.profiler.report()
+        painter.save()
+        painter.resetTransform()
+        painter.setFont(self.profile_font)
+        line_height = painter.fontMetrics().height()
+        width = max(painter.fontMetrics().width(line) for line in lines) + 8
+        painter.fillRect(QRectF(4, 4, width, line_height * len(lines) + 6), QColor(255, 255, 255, 200))
+        painter.setPen(Qt.black)
+        for i, line in enumerate(lines):
+            painter.drawText(QPointF(8, 6 + line_height * (i + 1) - painter.fontMetrics().descent()), line)
+        painter.restore()
+
+    def draw_foreground(self, painter, rect):
+        detailed = self.detailed()
+        if self.backend != 'painter':
+            if not detailed:
+                self.draw_food_density(painter, rect)
+            return
+
+        # Sprites are rendered at a power-of-two resolution that follows the zoom
+        zoom = self.transform().m11()
+        resolution = 2 ** min(3, max(0, math.ceil(math.log2(max(zoom, 1e-6)))))
+        atlas = self.atlas
+        key = atlas.key
+        sprites = atlas.sprites
+        draw = painter.drawPixmap
+        for cell in self.visible_cells(rect):
+            genes = cell.genome.genes
+            x, y = cell.position
+            sprite_key = key(max(genes['size'], 15), genes['color'], detailed and genes['has_tail'], cell.angle,
+                             detailed and bool(cell.adhesin), resolution)
+            sprite = sprites.get(sprite_key) or atlas.sprite(sprite_key)
+            pixmap, source, extent = sprite
+            draw(QRectF(x - extent, y - extent, 2 * extent, 2 * extent), pixmap, source)
+
+        if self.selected_cell and self.selected_cell.alive:
+            x, y = self.selected_cell.position
+            size = max(self.selected_cell.genome.genes['size'], 15)
+            painter.setPen(self.highlight_pen)
+            painter.setBrush(Qt.NoBrush)
+            painter.drawEllipse(QRectF(x - size / 2, y - size / 2, size, size))
+
+        if not detailed:
+            self.draw_food_density(painter, rect)
+            return
+
+        # All visible food in a single call
+        food = self.environment.food
+        indices = food.query_rect(rect.left() - 1, rect.top() - 1, rect.right() + 1, rect.bottom() + 1)
+        painter.setPen(self.food_pen)
+        painter.drawPoints(QPolygonF([QPointF(*food[index]) for index in indices]))
+
+    def draw_food_density(self, painter, rect):
+        # One shaded square per occupied food bucket, more opaque where more food lies
+        food = self.environment.food
+        size = food.bucket_size
+        colors = self.food_density_colors
+        painter.setPen(Qt.NoPen)
+        for gx, gy in food.buckets_in_rect(rect.left(), rect.top(), rect.right(), rect.bottom()):
+            count = len(food.buckets[(gx, gy)])
+            painter.fillRect(QRectF(gx * size, gy * size, size, size), colors[min(count, len(colors)) - 1])
+
+    def cell_at(self, x, y):
+        # Topmost cell drawn under a scene position; bodies are drawn at least 15 across
+        grid = self.environment.spatial_grid()
+        for cell in reversed(self.environment.cells_in_radius(x, y, max(grid.cell_size, 15) / 2)):
+            size = max(cell.genome.genes['size'], 15)
+            dx = cell.position[0] - x
+            dy = cell.position[1] - y
+            if dx * dx + dy * dy <= size * size / 4:
+                return cell
+        return None
 
     def highlight_cell(self, cell):
-        for item in self.scene.items():
-            if isinstance(item, CellItem) and item.cell == cell:
-                item.setPen(QPen(Qt.red, 2))
-                break
+        graphics = self.cell_graphics.get(cell.id)
+        if self.highlighted is not None and self.highlighted is not graphics:
+            self.highlighted.body.setPen(self.cell_pen)
+        if graphics is not None:
+            graphics.body.setPen(self.highlight_pen)
+        self.highlighted = graphics
 
     def mousePressEvent(self, event):
         if event.button() == Qt.LeftButton:
-            item = self.itemAt(event.pos())
-            if isinstance(item, CellItem):
-                self.selected_cell = item.cell
-                self.cell_selected.emit(item.cell)
-                self.render()
-            else:
-                self.selected_cell = None
-                self.cell_selected.emit(None)
-                self.render()
-
-            if self.draw_food_mode:
-                pos = self.mapToScene(event.pos())
-                self.environment.food.append((pos.x(), pos.y()))
-                self.render()
-            elif self.erase_food_mode:
-                pos = self.mapToScene(event.pos())
-                for food in self.environment.food[:]:
-                    x, y = food
-                    if math.sqrt((pos.x() - x) ** 2 + (pos.y() - y) ** 2) < 5:
-                        self.environment.food.remove(food)
-                        self.render()
-                        break
+            pos = self.mapToScene(event.pos())
+            if self.draw_food_mode or self.erase_food_mode:
+                self.brush(pos.x(), pos.y())
+                return
+            picked = self.cell_at(pos.x(), pos.y())
+            self.selected_cell = picked
+            self.cell_selected.emit(picked)
+            self.render()
         super().mousePressEvent(event)
 
+    def brush(self, x, y):
+        # One stroke of the food brush; the owner applies it as a single batch
+        if self.draw_food_mode:
+            self.food_added.emit(x, y, self.brush_radius)
+        elif self.erase_food_mode:
+            self.food_erased.emit(x, y, self.brush_radius)
+
+    def set_brush_radius(self, radius):
+        self.brush_radius = radius
+
     def toggle_draw_food_mode(self):
         self.draw_food_mode = self.draw_food_button.isChecked()
         if self.draw_food_mode:
@@ -165,24 +457,39 @@ class Renderer(QGraphicsView):
             angle = math.atan2(self.environment.center[1] - pos.y(), self.environment.center[0] - pos.x())
             new_x = self.environment.center[0] + math.cos(angle) * self.environment.radius
             new_y = self.environment.center[1] + math.sin(angle) * self.environment.radius
-            item.setPos(new_x - item.cell.genome.genes['size'] / 2, new_y - item.cell.genome.genes['size'] / 2)
-            item.cell.position = (new_x, new_y)
+            item.setPos(new_x, new_y)
+            self.cell_moved.emit(item.cell, new_x, new_y)
         else:
-            item.cell.position = (pos.x(), pos.y())
-        self.render()
+            self.cell_moved.emit(item.cell, pos.x(), pos.y())
 
     def mouseMoveEvent(self, event):
+        if event.buttons() & Qt.LeftButton and (self.draw_food_mode or self.erase_food_mode):
+            pos = self.mapToScene(event.pos())
+            self.brush(pos.x(), pos.y())
+            return
         if self.selected_cell:
             pos = self.mapToScene(event.pos())
-            self.selected_cell.position = (pos.x(), pos.y())
-            self.render()
+            self.cell_moved.emit(self.selected_cell, pos.x(), pos.y())
         super().mouseMoveEvent(event)
 
+    def scrollContentsBy(self, dx, dy):
+        super().scrollContentsBy(dx, dy)
+        # Cells scrolled into view need items
+        if self.backend == 'scene':
+            self.render()
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        if self.backend == 'scene':
+            self.render()
+
     def zoom_in(self):
         self.scale(1.2, 1.2)
+        self.render()
 
     def zoom_out(self):
         self.scale(1 / 1.2, 1 / 1.2)
+        self.render()
 
     def scroll(self, dx, dy):
         self.horizontalScrollBar().setValue(self.horizontalScrollBar().value() + dx)
@@ -0,0 +1,127 @@
+# replay.py
+import argparse
+import sys
+from PyQt5.QtWidgets import QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QLabel, QSlider
+from PyQt5.QtCore import Qt, QTimer
+from PyQt5.QtGui import QFont
+from renderer import Renderer
+from dna_viewer import DNAViewer
+from trajectory import Trajectory
+
+
+class ReplayWindow(QMainWindow):
+    # Plays back a recording made with TrajectoryRecorder. Nothing is simulated:
+    # every frame is a Snapshot decoded from the log and handed to the Renderer.
+    def __init__(self, trajectory, frame_interval=16):
+        super().__init__()
+        self.trajectory = trajectory
+        self.setWindowTitle("Cells - Replay")
+        self.setGeometry(100, 100, 1200, 600)
+
+        self.central_widget = QWidget()
+        self.setCentralWidget(self.central_widget)
+        self.layout = QHBoxLayout(self.central_widget)
+
+        self.replay_layout = QVBoxLayout()
+        self.layout.addLayout(self.replay_layout, 2)
+
+        self.snapshot = trajectory.frame(trajectory.first_tick)
+        self.renderer = Renderer(self.snapshot)
+        self.renderer.cell_selected.connect(self.on_cell_selected)
+        self.replay_layout.addWidget(self.renderer)
+        self.selected_id = None
+
+        self.tick_label = QLabel()
+        font = QFont()
+        font.setPointSize(14)
+        self.tick_label.setFont(font)
+        self.replay_layout.addWidget(self.tick_label)
+
+        self.slider = QSlider(Qt.Horizontal)
+        self.slider.setRange(trajectory.first_tick, trajectory.last_tick)
+        self.slider.valueChanged.connect(self.seek)
+        self.replay_layout.addWidget(self.slider)
+
+        self.control_layout = QHBoxLayout()
+        self.replay_layout.addLayout(self.control_layout)
+
+        self.back_button = QPushButton("<")
+        self.back_button.clicked.connect(lambda: self.slider.setValue(self.slider.value() - 1))
+        self.control_layout.addWidget(self.back_button)
+
+        self.play_button = QPushButton("Play")
+        self.play_button.clicked.connect(self.toggle_playback)
+        self.play_button.setStyleSheet("background-color: green")
+        self.control_layout.addWidget(self.play_button)
+
+        self.forward_button = QPushButton(">")
+        self.forward_button.clicked.connect(lambda: self.slider.setValue(self.slider.value() + 1))
+        self.control_layout.addWidget(self.forward_button)
+
+        self.dna_viewer = DNAViewer()
+        self.layout.addWidget(self.dna_viewer, 1)
+
+        self.timer = QTimer()
+        self.timer.setInterval(frame_interval)
+        self.timer.timeout.connect(self.advance)
+        self.show_frame()
+
+    def toggle_playback(self):
+        if self.timer.isActive():
+            self.timer.stop()
+            self.play_button.setText("Play")
+            self.play_button.setStyleSheet("background-color: green")
+        else:
+            if self.slider.value() >= self.trajectory.last_tick:
+                self.slider.setValue(self.trajectory.first_tick)
+            self.timer.start()
+            self.play_button.setText("Pause")
+            self.play_button.setStyleSheet("background-color: red")
+
+    def advance(self):
+        if self.slider.value() >= self.trajectory.last_tick:
+            self.toggle_playback()
+            return
+        self.slider.setValue(self.slider.value() + 1)
+
+    def seek(self, tick):
+        self.snapshot = self.trajectory.frame(tick)
+        self.show_frame()
+
+    def show_frame(self):
+        snapshot = self.snapshot
+        self.renderer.environment = snapshot
+        if self.selected_id is not None:
+            selected = snapshot.cell(self.selected_id)
+            self.renderer.selected_cell = selected
+            self.dna_viewer.set_cell(selected)
+        self.renderer.render()
+        self.tick_label.setText(f"Tick {snapshot.tick} / {self.trajectory.last_tick}  "
+                                f"Time {snapshot.current_time:.1f}s  Cells {len(snapshot.cells)}  "
+                                f"Food {len(snapshot.food)}")
+
+    def on_cell_selected(self, cell):
+        self.selected_id = cell.id if cell is not None else None
+        self.dna_viewer.set_cell(cell)
+
+    def closeEvent(self, event):
+        self.timer.stop()
+        self.trajectory.close()
+        super().closeEvent(event)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play back a trajectory recorded with headless.py --record")
+    parser.add_argument('recording')
+    parser.add_argument('--tick', type=int, default=0, help="start at this tick")
+    args = parser.parse_args(argv)
+
+    app = QApplication(sys.argv[:1])
+    window = ReplayWindow(Trajectory(args.recording))
+    window.slider.setValue(args.tick)
+    window.show()
+    sys.exit(app.exec_())
+
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,144 @@
+import math
+import random
 import time
+from checkpoints import CheckpointRing
+from profiler import PhaseProfiler, perf_counter
 
 class SimulationEngine:
     def __init__(self, environment):
         self.environment = environment
         self.time_step = 0.1  # seconds
         self.simulation_speed = 1.0  # 1.0 is real-time
+        self.recorder = None  # Optional TrajectoryRecorder, fed after every tick
+        self.tick = 0
+        self.checkpoints = None  # Optional CheckpointRing for rewinding
+        self.lineage = None  # Optional LineageTracker
+        self.energy_sample_interval = 10  # Ticks between energy histograms in environment.stats
+        # A tick is split into sub-steps when a cell could otherwise move further
+        # than this fraction of the smallest cell in one step and slip past
+        # cells or food it should have touched
+        self.max_step_fraction = 0.5
+        self.max_substeps = 16
+
+    def enable_lineage(self, prune_every=10000):
+        # The cells already in the dish become the roots
+        from lineage import LineageTracker
+        self.lineage = LineageTracker(prune_every)
+        self.lineage.tick = self.tick
+        for cell in self.environment.cells:
+            self.lineage.add_root(cell)
+        self.environment.lineage = self.lineage
+
+    def enable_profiling(self, keep_history=False):
+        self.environment.profiler = PhaseProfiler(keep_history)
+        return self.environment.profiler
+
+    def disable_profiling(self):
+        self.environment.profiler = None
+
+    def enable_checkpoints(self, interval=10, budget=64 * 2 ** 20):
+        # budget is in bytes; the current state is the first checkpoint
+        self.checkpoints = CheckpointRing(interval, budget)
+        self.checkpoints.take(self.tick, self.environment)
+
+    def rewind_to(self, tick):
+        # Restores the newest checkpoint at or before tick and forgets the ones
+        # after it. Returns the tick restored, or None if there is none.
+        if self.checkpoints is None:
+            return None
+        checkpoint = self.checkpoints.latest(tick)
+        if checkpoint is None:
+            return None
+        self.checkpoints.discard_after(checkpoint.tick)
+        self.environment.restore(checkpoint.state)
+        self.environment.nutrients = checkpoint.nutrients.copy() if checkpoint.nutrients is not None else None
+        random.setstate(checkpoint.random_state)
+        self.tick = checkpoint.tick
+        if self.lineage is not None:
+            self.lineage.truncate(self.tick)
+            self.lineage.tick = self.tick
+        return self.tick
+
+    def step_back(self):
+        return self.rewind_to(self.tick - 1)
+
+    def attach_recorder(self, recorder):
+        # Records the current state as the first keyframe
+        self.recorder = recorder
+        recorder.record(self.environment)
+
+    def detach_recorder(self):
+        if self.recorder:
+            self.recorder.close()
+            self.recorder = None
+
+    def substeps(self):
+        # Jittering cells move up to their speed along both axes at once
+        speed, size = self.environment.motion_bounds()
+        reach = math.sqrt(2) * speed * self.time_step
+        limit = self.max_step_fraction * size
+        if reach <= limit:
+            return 1
+        if limit <= 0:
+            return self.max_substeps
+        return min(self.max_substeps, math.ceil(reach / limit))
 
     def update(self, generate_food=True, allow_merge=False):
-        self.environment.update(self.time_step, generate_food, allow_merge)
+        if self.lineage is not None:
+            self.lineage.tick = self.tick + 1
+        environment = self.environment
+        profiler = environment.profiler
+        steps = self.substeps()
+        dt = self.time_step / steps
+        for _ in range(steps):
+            environment.update(dt, generate_food, allow_merge)
+            if profiler is not None:
+                start = perf_counter()
+            environment.resolve_collisions()
+            if profiler is not None:
+                profiler.lap('resolve_collisions', start)
+        if profiler is not None:
+            profiler.count('substeps', steps)
+            profiler.end_frame()
+        self.tick += 1
+        if self.tick % self.energy_sample_interval == 0:
+            self.environment.stats.sample_energy(self.environment.energies(), self.tick)
+        if self.lineage is not None:
+            self.lineage.end_tick()
+        if self.checkpoints is not None and self.checkpoints.due(self.tick):
+            self.checkpoints.take(self.tick, self.environment)
+        if self.recorder:
+            self.recorder.record(self.environment)
+
+    def run_ticks(self, ticks, generate_food=True, allow_merge=False, callback=None):
+        # Run back to back without sleeping. Returns the ticks actually run and the
+        # number of cell updates; a callback returning False stops the run early.
+        cell_updates = 0
+        tick = 0
+        while tick < ticks:
+            cell_updates += len(self.environment.cells)
+            self.update(generate_food, allow_merge)
+            tick += 1
+            if callback and callback(tick, cell_updates) is False:
+                break
+        return tick, cell_updates
+
+    def run_frame(self, budget, generate_food=True, allow_merge=False):
+        # Runs as many ticks as fit in budget wall-clock seconds, at least one,
+        # and returns how many. A tick is not started if the mean so far says
+        # it would overrun.
+        start = perf_counter()
+        deadline = start + budget
+        ticks = 0
+        while True:
+            self.update(generate_food, allow_merge)
+            ticks += 1
+            now = perf_counter()
+            if now + (now - start) / ticks > deadline:
+                return ticks
+
+    def counts(self):
+        return len(self.environment.cells), len(self.environment.food)
 
     def run_for_duration(self, duration, generate_food=True, allow_merge=False):
         steps = int(duration / self.time_step)
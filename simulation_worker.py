@@ -0,0 +1,209 @@
+from PyQt5.QtCore import QThread, pyqtSignal
+from simulation import SimulationEngine
+from snapshot import Snapshot
+from cell import Cell, Genome, Bacteria, Phagocyte, Photocyte
+import food_sources
+import math
+import queue
+import random
+import threading
+import time
+
+BRUSH_AREA = 30  # Square scene units of brush per food particle drawn
+FAST_FORWARD_BUDGET = 0.012  # Seconds of ticks per published frame, leaving the rest of ~16 ms to the GUI
+
+
+class SnapshotBuffer:
+    # Triple buffering for immutable snapshots: the worker builds the next one on
+    # its own, publishes it into the back slot without waiting for the reader,
+    # and the reader swaps the newest published snapshot to the front. Ticks the
+    # reader was too slow to see are simply replaced.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.front = None
+        self.back = None
+
+    def publish(self, snapshot):
+        with self.lock:
+            self.back = snapshot
+
+    def acquire(self):
+        # The newest snapshot, or None if nothing was published since the last call
+        with self.lock:
+            snapshot, self.back = self.back, None
+        if snapshot is not None:
+            self.front = snapshot
+        return snapshot
+
+
+class SimulationWorker(QThread):
+    # Runs a SimulationEngine off the GUI thread at a fixed tick rate. The GUI
+    # never touches the environment: it reads snapshots, and its edits are
+    # queued as commands that run on this thread between ticks.
+    snapshot_ready = pyqtSignal()
+
+    def __init__(self, environment, tick_interval=0.016, parent=None):
+        super().__init__(parent)
+        self.engine = SimulationEngine(environment)
+        self.tick_interval = tick_interval  # Wall-clock seconds per tick at normal speed
+        self.snapshots = SnapshotBuffer()
+        self.commands = queue.Queue()
+        self.running = False
+        self.stopping = False
+        self.generate_food = True
+        self.allow_merge = False
+        self.fast_forward = False  # Run ticks back to back and publish only the last of every frame
+        self.speedup = None  # Ticks per second over those at normal speed, while fast-forwarding
+        self.frame_start = None
+
+    @property
+    def environment(self):
+        return self.engine.environment
+
+    @property
+    def tick(self):
+        return self.engine.tick
+
+    def submit(self, command, *args):
+        # command(environment, *args) runs on the worker before the next tick
+        self.commands.put((command, args))
+
+    def set_running(self, running):
+        self.running = running
+        self.commands.put(None)  # Wake a paused worker so it notices
+
+    def stop(self):
+        self.stopping = True
+        self.commands.put(None)
+        self.wait()
+
+    def run(self):
+        self.publish()
+        next_tick = time.perf_counter()
+        while not self.stopping:
+            # A paused worker sleeps until a command arrives
+            timeout = max(0.0, next_tick - time.perf_counter()) if self.running else None
+            edited = self.apply_commands(timeout)
+            if self.stopping:
+                break
+            now = time.perf_counter()
+            if not self.running:
+                next_tick = now
+                self.frame_start = None
+            elif self.fast_forward:
+                ticks = self.engine.run_frame(FAST_FORWARD_BUDGET, self.generate_food, self.allow_merge)
+                # Measured from frame to frame, so commands and publishing count too
+                now = time.perf_counter()
+                if self.frame_start is not None:
+                    self.speedup = ticks * self.tick_interval / (now - self.frame_start)
+                self.frame_start = now
+                next_tick = now
+                edited = True
+            elif now >= next_tick:
+                self.engine.update(self.generate_food, self.allow_merge)
+                # A slow tick delays the next one instead of causing a burst of catch-up ticks
+                next_tick = max(next_tick + self.tick_interval / self.engine.simulation_speed, now)
+                self.speedup = None
+                self.frame_start = None
+                edited = True
+            if edited:
+                self.publish()
+
+    def apply_commands(self, timeout):
+        # Waits up to timeout (forever if None) for a command, then drains the queue.
+        # Returns True if any command ran.
+        applied = False
+        try:
+            item = self.commands.get(timeout=timeout)
+            while True:
+                if item is not None:
+                    command, args = item
+                    command(self.environment, *args)
+                    applied = True
+                item = self.commands.get_nowait()
+        except queue.Empty:
+            pass
+        return applied
+
+    def set_fast_forward(self, enabled):
+        self.fast_forward = enabled
+        self.commands.put(None)  # Wake the worker so it notices
+
+    def publish(self):
+        state = self.environment.get_state()
+        state['speedup'] = self.speedup
+        self.snapshots.publish(Snapshot(state, self.tick))
+        self.snapshot_ready.emit()
+
+
+# Commands. These run on the worker thread with the live environment.
+
+CELL_TYPES = {'cell': Cell, 'bacteria': Bacteria, 'phagocyte': Phagocyte, 'photocyte': Photocyte}
+
+
+def add_random_cell(environment, cell_type):
+    position = environment.random_position()
+    environment.add_cell(CELL_TYPES.get(cell_type, Cell)(Genome(), position))
+
+
+def add_random_food(environment, count):
+    for _ in range(count):
+        environment.food.add(*environment.random_position())
+
+
+def add_food(environment, x, y, radius=0):
+    # A brush stroke: food spread evenly over a disc, a particle per BRUSH_AREA of it
+    if radius <= 0:
+        environment.food.add(x, y)
+        return
+    count = max(1, round(math.pi * radius * radius / BRUSH_AREA))
+    environment.food.add_many(*food_sources.Patch(x, y, radius).place(random, count, environment))
+
+
+def erase_food(environment, x, y, radius=5):
+    environment.food.remove_many(environment.food_in_radius(x, y, radius))
+
+
+def remove_cell(environment, cell_id):
+    cell = environment.find_cell(cell_id)
+    if cell is not None:
+        environment.remove_cell(cell)
+
+
+def move_cell(environment, cell_id, x, y):
+    cell = environment.find_cell(cell_id)
+    if cell is not None:
+        cell.position = (x, y)
+        environment.grid_stamp = None
+
+
+def edit_cell(environment, cell_id, genes, never_consume=None):
+    cell = environment.find_cell(cell_id)
+    if cell is None:
+        return
+    cell.genome.genes.update(genes)
+    if never_consume is not None:
+        cell.genome.never_consume = never_consume
+    environment.stats.refresh(cell)
+
+
+def set_profiling(environment, engine, enabled):
+    if enabled:
+        engine.enable_profiling()
+    else:
+        engine.disable_profiling()
+
+
+def set_nutrients(environment, enabled):
+    if enabled:
+        environment.enable_nutrients()
+    else:
+        environment.nutrients = None
+
+
+def step_back(environment, engine):
+    engine.step_back()
+
+
+def rewind(environment, engine, ticks):
+    engine.rewind_to(engine.tick - ticks)
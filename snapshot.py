@@ -0,0 +1,65 @@
+from spatial_grid import SpatialGrid, SpatialQueries
+
+
+class GenomeState:
+    __slots__ = ('genes', 'never_consume')
+
+    def __init__(self, genes, never_consume):
+        self.genes = genes
+        self.never_consume = never_consume
+
+    @property
+    def size(self):
+        return self.genes['size']
+
+
+class CellState:
+    # Read-only copy of one cell at the end of a tick. It has the attributes the
+    # renderer, cell editor and DNA viewer read from a live Cell.
+    __slots__ = ('id', 'type', 'position', 'angle', 'energy', 'age', 'nitrogen_reserve', 'adhesin', 'dna',
+                 'genome')
+    alive = True
+
+    def __init__(self, id, type, position, angle, energy, age, nitrogen_reserve, adhesin, dna, genome):
+        self.id = id
+        self.type = type
+        self.position = position
+        self.angle = angle
+        self.energy = energy
+        self.age = age
+        self.nitrogen_reserve = nitrogen_reserve
+        self.adhesin = adhesin
+        self.dna = dna
+        self.genome = genome
+
+    @classmethod
+    def from_cell(cls, cell):
+        genome = cell.genome
+        return cls(cell.id, cell.type, cell.position, cell.angle, cell.energy, cell.age, cell.nitrogen_reserve,
+                   cell.adhesin, cell.dna, GenomeState(genome.genes.copy(), genome.never_consume))
+
+
+class Snapshot(SpatialQueries):
+    # One published tick, built from Environment.get_state. It stands in for the
+    # environment wherever the UI only reads: cells, food, time and dish geometry.
+    def __init__(self, state, tick=0):
+        self.tick = tick
+        self.cells = state['cells']
+        self.food = state['food']
+        self.current_time = state['current_time']
+        self.radius = state['radius']
+        self.center = state['center']
+        self.stats = state.get('stats')  # PopulationStats.summary() of the tick, if any
+        self.profile = state.get('profile')  # PhaseProfiler.summary() while profiling
+        self.nutrients = state.get('nutrients')  # Copy of the NutrientField, if there is one
+        self.speedup = state.get('speedup')  # Set by SimulationWorker while fast-forwarding
+        self.grid = SpatialGrid()
+        self.cells_by_id = None
+
+    def cell(self, cell_id):
+        if self.cells_by_id is None:
+            self.cells_by_id = {cell.id: cell for cell in self.cells}
+        return self.cells_by_id.get(cell_id)
+
+    def rebuild_grid(self):
+        self.grid.rebuild(self.cells)
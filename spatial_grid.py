@@ -0,0 +1,195 @@
+import math
+
+# Neighbouring buckets visited from each bucket when enumerating pairs. Only the
+# "forward" half of the 3x3 neighbourhood is used so every pair is seen once.
+FORWARD_NEIGHBOURS = ((1, -1), (1, 0), (1, 1), (0, 1))
+
+
+class SpatialGrid:
+    def __init__(self, min_cell_size=1.0):
+        self.min_cell_size = min_cell_size
+        self.cell_size = min_cell_size
+        self.buckets = {}
+        self.items = []
+        self.xs = []
+        self.ys = []
+        self.sizes = []
+
+    def rebuild(self, cells):
+        # Keep a private copy so callers may add or remove cells while walking pairs
+        cells = list(cells)
+        self.build(
+            [cell.position[0] for cell in cells],
+            [cell.position[1] for cell in cells],
+            [cell.genome.size for cell in cells],
+            cells
+        )
+
+    def build(self, xs, ys, sizes, items=None):
+        # Buckets are as wide as the largest cell, so any two touching cells are
+        # always in the same or in adjacent buckets
+        self.xs = xs
+        self.ys = ys
+        self.sizes = sizes
+        self.items = items if items is not None else range(len(xs))
+        self.cell_size = max(self.min_cell_size, max(sizes, default=0))
+
+        inv = 1.0 / self.cell_size
+        buckets = {}
+        for index, (x, y) in enumerate(zip(xs, ys)):
+            key = (math.floor(x * inv), math.floor(y * inv))
+            bucket = buckets.get(key)
+            if bucket is None:
+                buckets[key] = [index]
+            else:
+                bucket.append(index)
+        self.buckets = buckets
+
+    def candidate_pairs(self):
+        buckets = self.buckets
+        for (gx, gy), members in buckets.items():
+            count = len(members)
+            for a in range(count):
+                i = members[a]
+                for b in range(a + 1, count):
+                    yield i, members[b]
+            for dx, dy in FORWARD_NEIGHBOURS:
+                others = buckets.get((gx + dx, gy + dy))
+                if others:
+                    for i in members:
+                        for j in others:
+                            yield (i, j) if i < j else (j, i)
+
+    def pair_count(self):
+        # How many pairs candidate_pairs() yields, counted from the bucket sizes
+        buckets = self.buckets
+        total = 0
+        for (gx, gy), members in buckets.items():
+            count = len(members)
+            total += count * (count - 1) // 2
+            for dx, dy in FORWARD_NEIGHBOURS:
+                others = buckets.get((gx + dx, gy + dy))
+                if others:
+                    total += count * len(others)
+        return total
+
+    def contact_pairs(self):
+        # Index pairs (i < j) whose circles overlap, in the same order as the
+        # original all-pairs scan
+        xs, ys, sizes = self.xs, self.ys, self.sizes
+        contacts = []
+        for i, j in self.candidate_pairs():
+            dx = xs[i] - xs[j]
+            dy = ys[i] - ys[j]
+            reach = (sizes[i] + sizes[j]) / 2
+            if dx * dx + dy * dy < reach * reach:
+                contacts.append((i, j))
+        contacts.sort()
+        return contacts
+
+    def query(self, x, y, radius):
+        # Indices of every entry whose centre lies within radius of (x, y)
+        inv = 1.0 / self.cell_size
+        min_gx = math.floor((x - radius) * inv)
+        max_gx = math.floor((x + radius) * inv)
+        min_gy = math.floor((y - radius) * inv)
+        max_gy = math.floor((y + radius) * inv)
+        xs, ys = self.xs, self.ys
+        radius_sq = radius * radius
+        found = []
+        for gx in range(min_gx, max_gx + 1):
+            for gy in range(min_gy, max_gy + 1):
+                bucket = self.buckets.get((gx, gy))
+                if not bucket:
+                    continue
+                for index in bucket:
+                    dx = xs[index] - x
+                    dy = ys[index] - y
+                    if dx * dx + dy * dy < radius_sq:
+                        found.append(index)
+        return found
+
+    def query_rect(self, left, top, right, bottom):
+        # Indices of every entry whose centre lies inside the rectangle
+        inv = 1.0 / self.cell_size
+        min_gx = math.floor(left * inv)
+        max_gx = math.floor(right * inv)
+        min_gy = math.floor(top * inv)
+        max_gy = math.floor(bottom * inv)
+        if (max_gx - min_gx + 1) * (max_gy - min_gy + 1) > len(self.buckets):
+            # Cheaper to walk the occupied buckets than every key in a huge rectangle
+            keys = [key for key in self.buckets if min_gx <= key[0] <= max_gx and min_gy <= key[1] <= max_gy]
+        else:
+            keys = [(gx, gy) for gx in range(min_gx, max_gx + 1) for gy in range(min_gy, max_gy + 1)]
+        xs, ys = self.xs, self.ys
+        found = []
+        for key in keys:
+            bucket = self.buckets.get(key)
+            if not bucket:
+                continue
+            for index in bucket:
+                if left <= xs[index] <= right and top <= ys[index] <= bottom:
+                    found.append(index)
+        return found
+
+    def neighbours(self, index, radius):
+        return [other for other in self.query(self.xs[index], self.ys[index], radius) if other != index]
+
+
+class SpatialQueries:
+    # Lookups for picking and editor tools, shared by Environment and Snapshot.
+    # Cells are found through the SpatialGrid, rebuilt whenever time has moved
+    # on or the number of cells changed since it was built (set grid_stamp to
+    # None after moving cells by hand), and food through the FoodStore buckets.
+    # Food is returned as indices into self.food.
+    grid_stamp = None
+
+    def spatial_grid(self):
+        stamp = (self.current_time, len(self.cells))
+        if stamp != self.grid_stamp:
+            self.rebuild_grid()
+            self.grid_stamp = stamp
+        return self.grid
+
+    def search_limit(self, x, y):
+        # No cell or food is further from (x, y) than this
+        return math.hypot(x - self.center[0], y - self.center[1]) + self.radius + 1
+
+    def cells_in_radius(self, x, y, radius):
+        # Living cells whose centre lies within radius of (x, y), in list order
+        grid = self.spatial_grid()
+        items = grid.items
+        return [items[index] for index in sorted(grid.query(x, y, radius)) if items[index].alive]
+
+    def nearest_cell(self, x, y, max_distance=math.inf):
+        # The living cell whose centre is nearest (x, y), or None. The search
+        # radius doubles from one grid bucket until something is found.
+        grid = self.spatial_grid()
+        limit = min(max_distance, self.search_limit(x, y))
+        radius = min(grid.cell_size, limit)
+        while True:
+            cells = self.cells_in_radius(x, y, radius)
+            if cells:
+                return min(cells, key=lambda cell: (cell.position[0] - x) ** 2 + (cell.position[1] - y) ** 2)
+            if radius >= limit:
+                return None
+            radius = min(2 * radius, limit)
+
+    def food_in_radius(self, x, y, radius):
+        return self.food.query_radius(x, y, radius)
+
+    def food_in_rect(self, left, top, right, bottom):
+        return self.food.query_rect(left, top, right, bottom)
+
+    def nearest_food(self, x, y, max_distance=math.inf):
+        # Index of the food particle nearest (x, y), or None
+        food = self.food
+        limit = min(max_distance, self.search_limit(x, y))
+        radius = min(food.bucket_size, limit)
+        while True:
+            indices = food.query_radius(x, y, radius)
+            if indices:
+                return min(indices, key=lambda index: (food.xs[index] - x) ** 2 + (food.ys[index] - y) ** 2)
+            if radius >= limit:
+                return None
+            radius = min(2 * radius, limit)
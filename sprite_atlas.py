@@ -0,0 +1,73 @@
+from PyQt5.QtGui import QColor, QPen, QPainter, QPixmap, QPolygonF
+from PyQt5.QtCore import Qt, QPointF, QRectF
+import math
+
+COLOR_LEVELS = 7  # Colour channels are quantized to 3 bits
+ANGLE_STEPS = 16  # Tail headings are quantized to 16 directions
+MAX_SPRITES = 16384  # The cache is dropped and rebuilt past this many sprites
+
+
+class SpriteAtlas:
+    # Pre-rendered cell sprites keyed by quantized size, colour, tail heading and
+    # adhesin halo, so a frame only blits cached pixmaps
+    def __init__(self):
+        self.sprites = {}
+
+    def key(self, size, rgb, has_tail, angle, adhesin, resolution):
+        # Kept free of function calls: it runs once per cell per frame
+        heading = int(angle * ANGLE_STEPS / (2 * math.pi) + 0.5) % ANGLE_STEPS if has_tail else -1
+        r, g, b = rgb
+        return (int(size + 0.5), int(r * COLOR_LEVELS + 0.5), int(g * COLOR_LEVELS + 0.5),
+                int(b * COLOR_LEVELS + 0.5), heading, adhesin, resolution)
+
+    def sprite(self, key):
+        # Returns (pixmap, source rect, half extent in scene units)
+        sprite = self.sprites.get(key)
+        if sprite is None:
+            if len(self.sprites) >= MAX_SPRITES:
+                self.sprites.clear()
+            sprite = self.sprites[key] = self.render_sprite(*key)
+        return sprite
+
+    def render_sprite(self, size, r, g, b, heading, adhesin, resolution):
+        extent = size / 2
+        if adhesin:
+            extent = max(extent, (size + 20) / 2)
+        if heading >= 0:
+            extent = max(extent, size * 1.5)
+        extent += 1
+
+        pixels = max(1, math.ceil(2 * extent * resolution))
+        pixmap = QPixmap(pixels, pixels)
+        pixmap.fill(Qt.transparent)
+        color = QColor.fromRgbF(r / COLOR_LEVELS, g / COLOR_LEVELS, b / COLOR_LEVELS)
+
+        painter = QPainter(pixmap)
+        painter.setRenderHint(QPainter.Antialiasing)
+        painter.scale(pixels / (2 * extent), pixels / (2 * extent))
+        painter.translate(extent, extent)
+
+        # Same layering as the scene items: halo, body, then tail
+        if adhesin:
+            adhesin_size = size + 20
+            adhesin_color = QColor(color)
+            adhesin_color.setAlpha(100)
+            painter.setPen(QPen(Qt.NoPen))
+            painter.setBrush(adhesin_color)
+            painter.drawEllipse(QRectF(-adhesin_size / 2, -adhesin_size / 2, adhesin_size, adhesin_size))
+
+        painter.setPen(QPen(Qt.black, 0.5))
+        painter.setBrush(color)
+        painter.drawEllipse(QRectF(-size / 2, -size / 2, size, size))
+
+        if heading >= 0:
+            angle = heading * 2 * math.pi / ANGLE_STEPS
+            tail_length = size * 1.5
+            painter.drawPolygon(QPolygonF([
+                QPointF(0, 0),
+                QPointF(-size / 4, -size / 4),
+                QPointF(math.cos(angle) * tail_length, math.sin(angle) * tail_length),
+                QPointF(size / 4, -size / 4)
+            ]))
+        painter.end()
+        return pixmap, QRectF(pixmap.rect()), extent
@@ -0,0 +1,72 @@
+from PyQt5.QtWidgets import QWidget, QVBoxLayout, QFormLayout, QLabel
+from PyQt5.QtGui import QPainter
+from PyQt5.QtCore import Qt, QRectF
+from population_stats import MAX_ENERGY
+
+PANEL_GENES = ('speed', 'energy_efficiency', 'division_threshold', 'consumption_size_ratio', 'nitrogen_reserve',
+               'radiation_sensitivity', 'has_tail', 'can_consume', 'adhesin')
+
+
+class EnergyHistogram(QWidget):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setFixedHeight(72)
+        self.counts = []
+
+    def set_counts(self, counts):
+        self.counts = counts
+        self.update()
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if not self.counts:
+            return
+        painter = QPainter(self)
+        tallest = max(self.counts) or 1
+        bar_width = self.width() / len(self.counts)
+        for i, count in enumerate(self.counts):
+            bar_height = (self.height() - 14) * count / tallest
+            painter.fillRect(QRectF(i * bar_width + 1, self.height() - 14 - bar_height, bar_width - 2, bar_height),
+                             Qt.darkGreen)
+        painter.setPen(Qt.gray)
+        painter.drawText(QRectF(0, self.height() - 14, self.width(), 14), Qt.AlignLeft, "0")
+        painter.drawText(QRectF(0, self.height() - 14, self.width(), 14), Qt.AlignRight, str(MAX_ENERGY))
+
+
+class StatsPanel(QWidget):
+    # Shows a PopulationStats.summary(); the window decides how often
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.layout = QVBoxLayout(self)
+        self.form_layout = QFormLayout()
+        self.layout.addLayout(self.form_layout)
+
+        self.types_label = QLabel()
+        self.form_layout.addRow("Types", self.types_label)
+        self.predator_label = QLabel()
+        self.form_layout.addRow("Predators/Prey", self.predator_label)
+        self.events_label = QLabel()
+        self.form_layout.addRow("Events", self.events_label)
+        self.colonies_label = QLabel()
+        self.form_layout.addRow("Colonies", self.colonies_label)
+
+        self.gene_labels = {}
+        for gene in PANEL_GENES:
+            self.gene_labels[gene] = QLabel()
+            self.form_layout.addRow(gene.replace('_', ' ').title(), self.gene_labels[gene])
+
+        self.layout.addWidget(QLabel("Energy"))
+        self.energy_histogram = EnergyHistogram()
+        self.layout.addWidget(self.energy_histogram)
+
+    def show_stats(self, stats):
+        self.types_label.setText(", ".join(f"{name} {count}" for name, count in sorted(stats['types'].items())) or "-")
+        self.predator_label.setText(f"{stats['predators']} / {stats['prey']} ({stats['predator_prey_ratio']:.2f})")
+        self.events_label.setText(f"{stats['births']} births, {stats['deaths']} deaths, "
+                                  f"{stats['consumed']} eaten")
+        self.colonies_label.setText(f"{stats['colonies']} ({stats['colonised_cells']} cells, "
+                                    f"largest {stats['largest_colony']})")
+        for gene, label in self.gene_labels.items():
+            mean, variance = stats['genes'][gene]
+            label.setText(f"{mean:.2f} +/- {variance ** 0.5:.2f}")
+        self.energy_histogram.set_counts(stats['energy_histogram'])
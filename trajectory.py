@@ -0,0 +1,287 @@
+# trajectory.py
+import bisect
+import json
+import struct
+import zlib
+from array import array
+from collections import Counter
+from food_store import FoodStore
+from snapshot import CellState, GenomeState, Snapshot
+
+# A recording is a stream of chunks, each a CHUNK header followed by a zlib
+# compressed payload. The first chunk describes the dish; after that every tick
+# is either a keyframe with the full state or a delta against the tick before.
+# A payload is a JSON part (structure, births, deaths, food changes) followed by
+# typed arrays for the per-cell values that change every tick. Delta arrays are
+# float32, XORed with the cell's value on the tick before so that the bits which
+# did not change become zeros, and have their bytes shuffled by significance;
+# zlib packs that far better than raw doubles. Keyframes keep full precision.
+CHUNK = struct.Struct('<4sqI')  # Kind, tick, payload length
+PART = struct.Struct('<I')  # Length of the JSON part of a payload
+HEADER = b'HEAD'
+KEYFRAME = b'KEYF'
+DELTA = b'DELT'
+
+STATIC_GENES = ('speed', 'energy_efficiency', 'division_threshold', 'color', 'has_tail', 'can_consume',
+                'consumption_size_ratio', 'nitrogen_reserve', 'adhesin', 'radiation_sensitivity')
+DYNAMIC = ('x', 'y', 'energy', 'size', 'age', 'nitrogen_reserve')
+
+
+def static_record(cell):
+    # Everything about a cell that rarely changes between ticks
+    genome = cell.genome
+    genes = genome.genes
+    return (cell.id, cell.type, cell.angle, bool(cell.adhesin), cell.dna, bool(genome.never_consume),
+            tuple(genes[gene] for gene in STATIC_GENES))
+
+
+def _shuffle(column):
+    raw = column.tobytes()
+    size = column.itemsize
+    return b''.join(raw[byte::size] for byte in range(size))
+
+
+def _unshuffle(raw, typecode, count):
+    size = array(typecode).itemsize
+    unshuffled = bytearray(len(raw))
+    for byte in range(size):
+        unshuffled[byte::size] = raw[byte * count:(byte + 1) * count]
+    return array(typecode, bytes(unshuffled))
+
+
+def _xor(column, base):
+    # Bitwise XOR of two equally long float32 arrays; it is its own inverse
+    raw = column.tobytes()
+    mixed = int.from_bytes(raw, 'little') ^ int.from_bytes(base.tobytes(), 'little')
+    return array('f', mixed.to_bytes(len(raw), 'little'))
+
+
+def _align(columns, dead, count):
+    # The previous tick's columns with the dead removed and zeros for the newborn
+    aligned = {}
+    for name, column in columns.items():
+        if dead:
+            column = array('f', [value for index, value in enumerate(column) if index not in dead])
+        aligned[name] = column + array('f', bytes(4 * (count - len(column))))
+    return aligned
+
+
+def _encode(data, columns=(), shuffled=False):
+    # columns: (name, array) pairs stored after the JSON part
+    data['arrays'] = [(name, column.typecode, len(column)) for name, column in columns]
+    data['shuffled'] = shuffled
+    part = json.dumps(data).encode()
+    raw = [PART.pack(len(part)), part]
+    raw.extend(_shuffle(column) if shuffled else column.tobytes() for _, column in columns)
+    return b''.join(raw)
+
+
+def _decode(payload):
+    length, = PART.unpack_from(payload)
+    start = PART.size + length
+    data = json.loads(payload[PART.size:start])
+    arrays = {}
+    for name, typecode, count in data['arrays']:
+        end = start + count * array(typecode).itemsize
+        if data['shuffled']:
+            arrays[name] = _unshuffle(payload[start:end], typecode, count)
+        else:
+            arrays[name] = array(typecode, payload[start:end])
+        start = end
+    return data, arrays
+
+
+class TrajectoryRecorder:
+    # Opt-in log of a run, fed by SimulationEngine after every tick. A keyframe
+    # is written every keyframe_interval ticks, deltas in between.
+    def __init__(self, filename, keyframe_interval=100, compression=6):
+        self.file = open(filename, 'wb')
+        self.keyframe_interval = keyframe_interval
+        self.compression = compression
+        self.tick = -1
+        self.statics = None
+        self.food = None
+        self.columns = None  # float32 values of the last tick, the base for the next delta
+
+    def write_chunk(self, kind, payload):
+        payload = zlib.compress(payload, self.compression)
+        self.file.write(CHUNK.pack(kind, self.tick, len(payload)))
+        self.file.write(payload)
+
+    def record(self, environment):
+        self.tick += 1
+        if self.tick == 0:
+            self.write_chunk(HEADER, json.dumps({
+                'radius': environment.radius,
+                'center': environment.center,
+                'keyframe_interval': self.keyframe_interval,
+            }).encode())
+
+        # Plain copies are much cheaper to read than the numpy backend's cell views
+        cells = environment.cell_states()
+        statics = [static_record(cell) for cell in cells]
+        food = list(environment.food)
+        delta = None
+        if self.tick % self.keyframe_interval:
+            delta = self.delta(statics, food)
+        if delta is None:
+            columns = self.dynamic_columns(cells, 'd')
+            self.columns = {name: array('f', column) for name, column in columns}
+            columns.append(('food_x', array('d', environment.food.xs)))
+            columns.append(('food_y', array('d', environment.food.ys)))
+            self.write_chunk(KEYFRAME, _encode({'time': environment.current_time, 'cells': statics}, columns))
+        else:
+            delta['time'] = environment.current_time
+            base = _align(self.columns, set(delta['dead']), len(cells))
+            columns = self.dynamic_columns(cells, 'f')
+            self.columns = dict(columns)
+            self.write_chunk(DELTA, _encode(delta, [(name, _xor(column, base[name])) for name, column in columns],
+                                            shuffled=True))
+        self.statics = statics
+        self.food = food
+
+    def delta(self, statics, food):
+        # None when the tick cannot be expressed as a delta (the cell list was
+        # reordered); the caller writes a keyframe instead
+        previous = self.statics
+        current_ids = {record[0] for record in statics}
+        dead = [index for index, record in enumerate(previous) if record[0] not in current_ids]
+        kept = len(previous) - len(dead)
+        if dead:
+            dead_set = set(dead)
+            survivors = [record for index, record in enumerate(previous) if index not in dead_set]
+        else:
+            survivors = previous
+        # Survivors keep their order and newcomers are appended, as sweep and add_cell do
+        if any(old[0] != new[0] for old, new in zip(survivors, statics[:kept])) or len(statics) < kept:
+            return None
+        previous_ids = {record[0] for record in survivors}
+        if any(record[0] in previous_ids for record in statics[kept:]):
+            return None
+
+        before = Counter(self.food)
+        after = Counter(food)
+        return {
+            'dead': dead,
+            'born': statics[kept:],
+            'changed': [(index, statics[index]) for index in range(kept) if statics[index] != survivors[index]],
+            'food_added': list((after - before).elements()),
+            'food_removed': list((before - after).elements()),
+        }
+
+    def dynamic_columns(self, cells, typecode):
+        positions = [cell.position for cell in cells]
+        return [
+            ('x', array(typecode, [position[0] for position in positions])),
+            ('y', array(typecode, [position[1] for position in positions])),
+            ('energy', array(typecode, [cell.energy for cell in cells])),
+            ('size', array(typecode, [cell.genome.genes['size'] for cell in cells])),
+            ('age', array(typecode, [cell.age for cell in cells])),
+            ('nitrogen_reserve', array(typecode, [cell.nitrogen_reserve for cell in cells])),
+        ]
+
+    def close(self):
+        self.file.close()
+
+
+class Trajectory:
+    # Random access to a recording. frame(tick) decodes the nearest keyframe at
+    # or before tick and replays the deltas after it; stepping forward from the
+    # last frame only applies the new deltas.
+    def __init__(self, filename):
+        self.file = open(filename, 'rb')
+        self.chunks = {}  # Tick -> (kind, offset, length)
+        self.keyframes = []
+        header = None
+        end = self.file.seek(0, 2)
+        offset = 0
+        while offset + CHUNK.size <= end:
+            self.file.seek(offset)
+            kind, tick, length = CHUNK.unpack(self.file.read(CHUNK.size))
+            offset += CHUNK.size
+            if offset + length > end:
+                break  # The recorder was stopped mid-chunk
+            if kind == HEADER:
+                header = (offset, length)
+            else:
+                self.chunks[tick] = (kind, offset, length)
+                if kind == KEYFRAME:
+                    self.keyframes.append(tick)
+            offset += length
+        if header is None or not self.keyframes:
+            raise ValueError(f"{filename} is not a trajectory recording")
+        settings = json.loads(self.read(*header))
+        self.radius = settings['radius']
+        self.center = tuple(settings['center'])
+        self.keyframe_interval = settings['keyframe_interval']
+        self.first_tick = self.keyframes[0]
+        self.last_tick = max(self.chunks)
+        self.tick = None  # Tick of the decoded state below
+        self.time = 0
+        self.statics = []
+        self.dynamics = {}
+        self.columns = {}
+        self.food = Counter()
+
+    def read(self, offset, length):
+        self.file.seek(offset)
+        return zlib.decompress(self.file.read(length))
+
+    def frame(self, tick):
+        tick = max(self.first_tick, min(self.last_tick, tick))
+        keyframe = self.keyframes[bisect.bisect_right(self.keyframes, tick) - 1]
+        if self.tick is None or not keyframe <= self.tick <= tick:
+            self.load_keyframe(keyframe)
+        while self.tick < tick:
+            self.apply_delta(self.tick + 1)
+        return self.snapshot()
+
+    def load_keyframe(self, tick):
+        kind, offset, length = self.chunks[tick]
+        data, arrays = _decode(self.read(offset, length))
+        self.statics = [tuple(record) for record in data['cells']]
+        self.dynamics = {name: arrays[name].tolist() for name in DYNAMIC}
+        self.columns = {name: array('f', arrays[name]) for name in DYNAMIC}
+        self.food = Counter(zip(arrays['food_x'].tolist(), arrays['food_y'].tolist()))
+        self.time = data['time']
+        self.tick = tick
+
+    def apply_delta(self, tick):
+        kind, offset, length = self.chunks[tick]
+        if kind == KEYFRAME:
+            self.load_keyframe(tick)
+            return
+        data, arrays = _decode(self.read(offset, length))
+        dead = set(data['dead'])
+        if dead:
+            self.statics = [record for index, record in enumerate(self.statics) if index not in dead]
+        self.statics.extend(tuple(record) for record in data['born'])
+        for index, record in data['changed']:
+            self.statics[index] = tuple(record)
+        base = _align(self.columns, dead, len(self.statics))
+        self.columns = {name: _xor(arrays[name], base[name]) for name in DYNAMIC}
+        self.dynamics = {name: column.tolist() for name, column in self.columns.items()}
+        self.food.update(tuple(position) for position in data['food_added'])
+        self.food.subtract(tuple(position) for position in data['food_removed'])
+        self.food = +self.food
+        self.time = data['time']
+        self.tick = tick
+
+    def snapshot(self):
+        cells = []
+        dynamics = self.dynamics
+        for (cell_id, cell_type, angle, adhesin, dna, never_consume, static_genes), x, y, energy, size, age, \
+                nitrogen_reserve in zip(self.statics, dynamics['x'], dynamics['y'], dynamics['energy'],
+                                        dynamics['size'], dynamics['age'], dynamics['nitrogen_reserve']):
+            genes = dict(zip(STATIC_GENES, static_genes))
+            genes['size'] = size
+            genes['color'] = tuple(genes['color'])
+            cells.append(CellState(cell_id, cell_type, (x, y), angle, energy, age, nitrogen_reserve, adhesin, dna,
+                                   GenomeState(genes, never_consume)))
+        food = FoodStore()
+        food.extend(self.food.elements())
+        return Snapshot({'cells': cells, 'food': food, 'current_time': self.time, 'radius': self.radius,
+                         'center': self.center}, self.tick)
+
+    def close(self):
+        self.file.close()
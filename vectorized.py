@@ -0,0 +1,481 @@
+# vectorized.py
+import random
+from collections.abc import MutableMapping
+import numpy as np
+from cell import Cell, Genome, Bacteria, Traits
+from environment import Environment
+from snapshot import CellState, GenomeState
+from checkpoints import FOOD_BYTES, VIEW_BYTES
+
+NUMERIC_GENES = ('size', 'speed', 'energy_efficiency', 'division_threshold',
+                 'consumption_size_ratio', 'nitrogen_reserve', 'radiation_sensitivity')
+FLAG_GENES = ('has_tail', 'can_consume', 'adhesin')
+GENE_ORDER = ('size', 'speed', 'energy_efficiency', 'division_threshold', 'color', 'has_tail',
+              'can_consume', 'consumption_size_ratio', 'nitrogen_reserve', 'adhesin',
+              'radiation_sensitivity')
+
+# Column name -> (dtype, trailing shape). Genes are prefixed with "gene_" so they
+# never clash with the per-cell state of the same name (e.g. nitrogen_reserve).
+FIELDS = {
+    'x': (np.float64, ()),
+    'y': (np.float64, ()),
+    'energy': (np.float64, ()),
+    'age': (np.float64, ()),
+    'nitrogen': (np.float64, ()),
+    'angle': (np.float64, ()),
+    'last_eaten': (np.float64, ()),
+    'radiation': (np.float64, ()),
+    'adhesin': (np.bool_, ()),
+    'bacteria': (np.bool_, ()),
+    'never_consume': (np.bool_, ()),
+    'alive': (np.bool_, ()),
+    'gene_color': (np.float64, (3,)),
+}
+FIELDS.update({'gene_' + gene: (np.float64, ()) for gene in NUMERIC_GENES})
+FIELDS.update({'gene_' + gene: (np.bool_, ()) for gene in FLAG_GENES})
+
+
+class CellArrays:
+    # Structure-of-arrays storage for every cell of a VectorizedEnvironment.
+    # Slots [0, count) are in use and stay in the same order as environment.cells.
+    def __init__(self, capacity=256):
+        self.count = 0
+        self.capacity = capacity
+        self.columns = {name: np.zeros((capacity,) + shape, dtype) for name, (dtype, shape) in FIELDS.items()}
+
+    def __getattr__(self, name):
+        try:
+            return self.__dict__['columns'][name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def _grow(self, needed):
+        capacity = self.capacity
+        while capacity < needed:
+            capacity *= 2
+        for name, column in self.columns.items():
+            grown = np.zeros((capacity,) + column.shape[1:], column.dtype)
+            grown[:self.count] = column[:self.count]
+            self.columns[name] = grown
+        self.capacity = capacity
+
+    def append(self, cell):
+        if self.count == self.capacity:
+            self._grow(self.count + 1)
+        slot = self.count
+        self.count += 1
+
+        columns = self.columns
+        genes = cell.genome.genes
+        columns['x'][slot], columns['y'][slot] = cell.position
+        columns['energy'][slot] = cell.energy
+        columns['age'][slot] = cell.age
+        columns['nitrogen'][slot] = cell.nitrogen_reserve
+        columns['angle'][slot] = cell.angle
+        columns['last_eaten'][slot] = cell.last_eaten
+        columns['radiation'][slot] = cell.radiation_sensitivity
+        columns['adhesin'][slot] = bool(cell.adhesin)
+        columns['bacteria'][slot] = isinstance(cell, Bacteria)
+        columns['never_consume'][slot] = cell.genome.never_consume
+        columns['alive'][slot] = True
+        columns['gene_color'][slot] = genes['color']
+        for gene in NUMERIC_GENES:
+            columns['gene_' + gene][slot] = genes[gene]
+        for gene in FLAG_GENES:
+            columns['gene_' + gene][slot] = bool(genes[gene])
+        return slot
+
+    def compact(self):
+        # Drop dead slots while keeping the survivors in their original order
+        keep = self.columns['alive'][:self.count].copy()
+        survivors = int(keep.sum())
+        if survivors == self.count:
+            return False
+        for column in self.columns.values():
+            column[:survivors] = column[:self.count][keep]
+        self.count = survivors
+        return True
+
+    def view(self, name):
+        return self.columns[name][:self.count]
+
+
+class GenesView(MutableMapping):
+    # dict-like access to one cell's genes, reading and writing the arrays
+    def __init__(self, cell):
+        self._cell = cell
+
+    def __getitem__(self, gene):
+        columns = self._cell._store.columns
+        slot = self._cell._slot
+        if gene == 'color':
+            return tuple(columns['gene_color'][slot].tolist())
+        if gene in FLAG_GENES:
+            return bool(columns['gene_' + gene][slot])
+        if gene in NUMERIC_GENES:
+            return float(columns['gene_' + gene][slot])
+        raise KeyError(gene)
+
+    def __setitem__(self, gene, value):
+        if gene not in GENE_ORDER:
+            raise KeyError(gene)
+        self._cell._store.columns['gene_' + gene][self._cell._slot] = value
+
+    def __delitem__(self, gene):
+        raise TypeError("genes of a vectorized cell cannot be deleted")
+
+    def __iter__(self):
+        return iter(GENE_ORDER)
+
+    def __len__(self):
+        return len(GENE_ORDER)
+
+    def copy(self):
+        return {gene: self[gene] for gene in GENE_ORDER}
+
+
+class GenomeView(Genome):
+    def __init__(self, cell):
+        self._cell = cell
+        self._genes = GenesView(cell)
+
+    @property
+    def genes(self):
+        return self._genes
+
+    @property
+    def size(self):
+        return float(self._cell._store.columns['gene_size'][self._cell._slot])
+
+    @size.setter
+    def size(self, value):
+        self._cell._store.columns['gene_size'][self._cell._slot] = value
+
+    @property
+    def traits(self):
+        return Traits(*(self._genes[gene] for gene in Traits._fields))
+
+    @property
+    def never_consume(self):
+        return bool(self._cell._store.columns['never_consume'][self._cell._slot])
+
+    @never_consume.setter
+    def never_consume(self, value):
+        self._cell._store.columns['never_consume'][self._cell._slot] = value
+
+    @property
+    def dna(self):
+        return self.encode_genes()
+
+    def copy(self):
+        return Genome(self._genes.copy(), self.never_consume)
+
+
+def _column_property(name, convert=float):
+    def getter(self):
+        return convert(self._store.columns[name][self._slot])
+
+    def setter(self, value):
+        self._store.columns[name][self._slot] = value
+
+    return property(getter, setter)
+
+
+class CellView(Cell):
+    # Lightweight handle on one slot of a CellArrays store. It behaves like a
+    # Cell for the editor, renderer and the object-level interaction code.
+    energy = _column_property('energy')
+    age = _column_property('age')
+    nitrogen_reserve = _column_property('nitrogen')
+    angle = _column_property('angle')
+    last_eaten = _column_property('last_eaten')
+    radiation_sensitivity = _column_property('radiation')
+    adhesin = _column_property('adhesin', bool)
+    alive = _column_property('alive', bool)
+
+    def __init__(self, store, slot, cell):
+        self._store = store
+        self._slot = slot
+        self.id = cell.id
+        self.genome = GenomeView(self)
+        self.dna = cell.dna
+        self.type = cell.type
+        self.adhered_cells = {}  # Linked views, relinked by VectorizedEnvironment.add_cell
+        self.colony = None
+
+    @property
+    def position(self):
+        columns = self._store.columns
+        return (float(columns['x'][self._slot]), float(columns['y'][self._slot]))
+
+    @position.setter
+    def position(self, value):
+        columns = self._store.columns
+        columns['x'][self._slot], columns['y'][self._slot] = value
+
+    @property
+    def cell_class(self):
+        # The update only tells bacteria apart from other cells
+        return Bacteria if self._store.columns['bacteria'][self._slot] else Cell
+
+    def update(self, environment, dt):
+        raise TypeError("vectorized cells are updated by VectorizedEnvironment.update_cells")
+
+
+class VectorizedEnvironment(Environment):
+    # Environment whose per-cell update runs as NumPy array operations. Random
+    # draws come from the `random` module in the same order as the per-object
+    # path, so both backends follow the same trajectory under a fixed seed.
+    # With match_random=False they come from a NumPy generator instead, which is
+    # faster but no longer reproduces the per-object path.
+    def __init__(self, radius, match_random=True):
+        super().__init__(radius)
+        self.store = CellArrays()
+        self.match_random = match_random
+        self.rng = None if match_random else np.random.default_rng(random.getrandbits(64))
+
+    def add_cell(self, cell):
+        if isinstance(cell, CellView) and cell._store is self.store:
+            return cell
+        view = CellView(self.store, self.store.append(cell), cell)
+        self.cells.append(view)
+        self.stats.add(cell)
+        if cell.adhered_cells:
+            # Links to cells that are already here; the others link up when they arrive
+            views = {other.id: other for other in self.cells}
+            for other_cell in cell.adhered_cells:
+                other = views.get(other_cell.id)
+                if other is not None and other is not view:
+                    self.colonies.join(view, other)
+        self.colonies.register(view)
+        return view
+
+    def sweep(self):
+        # environment.cells and the store share one order, so the alive column
+        # filters both in a single pass
+        if self.pending_removals:
+            alive = self.store.view('alive').tolist()
+            if self.lineage is not None:
+                self.lineage.deaths(view.id for view, keep in zip(self.cells, alive) if not keep)
+            self.cells = [view for view, keep in zip(self.cells, alive) if keep]
+            self.store.compact()
+            for slot, view in enumerate(self.cells):
+                view._slot = slot
+            self.pending_removals = 0
+
+    def update_cells(self, dt):
+        store = self.store
+        count = store.count
+        if count == 0:
+            return
+        v = store.view
+
+        x, y = v('x'), v('y')
+        size = v('gene_size')
+        speed = v('gene_speed')
+        has_tail = v('gene_has_tail')
+        bacteria = v('bacteria')
+
+        # Draw the random numbers in the order Cell.update/Bacteria.update would
+        draws_per_cell = np.where(has_tail, 0, 2) + bacteria
+        offsets = np.cumsum(draws_per_cell) - draws_per_cell
+        draw_count = int(draws_per_cell.sum())
+        if self.match_random:
+            rand = random.random
+            draws = np.array([rand() for _ in range(draw_count)])
+        else:
+            draws = self.rng.random(draw_count)
+
+        # Metabolism
+        age = v('age')
+        age += dt
+        energy = v('energy') + v('gene_energy_efficiency') * dt
+        energy -= size * 0.01 * dt
+        nitrogen = v('nitrogen')
+        nitrogen += 0.01 * dt
+        energy -= v('radiation') * dt
+
+        # Movement: tailed cells swim along their heading, the rest jitter
+        angle = v('angle')
+        dx = np.cos(angle) * speed * dt
+        dy = np.sin(angle) * speed * dt
+        jitter = ~has_tail
+        if jitter.any():
+            dx[jitter] = (-1 + 2 * draws[offsets[jitter]]) * speed[jitter] * dt
+            dy[jitter] = (-1 + 2 * draws[offsets[jitter] + 1]) * speed[jitter] * dt
+        x += dx
+        y += dy
+        energy -= np.sqrt(dx ** 2 + dy ** 2) * 0.1
+
+        # Boundary clamping, same rule as Cell.resolve_boundary_collision
+        self._clamp_to_boundary(x, y, size)
+
+        # Starvation and death masks
+        starved_out = energy <= 0
+        starving = (self.current_time - v('last_eaten')) > self.starvation_threshold
+        color = v('gene_color')
+        color[starved_out] = 0.5
+
+        size[:] = np.maximum(5, np.minimum(128, energy * 0.5))
+        energy = np.minimum(100, energy)
+        store.energy[:count] = energy
+
+        if bacteria.any():
+            boosted = np.zeros(count, dtype=bool)
+            boosted[bacteria] = draws[offsets[bacteria] + np.where(has_tail[bacteria], 0, 2)] < 0.001
+            energy = v('energy')
+            energy[boosted] = v('gene_division_threshold')[boosted]
+            np.minimum(energy, 100, out=energy)
+        energy = v('energy')
+
+        # Colonies pool their energy once everything else has run, without the
+        # cells that starved (Cell.update removes those straight away)
+        if len(self.colonies):
+            for slot in np.flatnonzero(starved_out | starving).tolist():
+                self.colonies.detach(self.cells[slot])
+            self.colonies.pool_column(energy)
+
+        dead = starved_out | starving
+        dead |= (energy <= 0.72) | (nitrogen <= 0.1) | (age >= 240)
+        dividing = (~dead & (age >= 20) & (energy > v('gene_division_threshold')) & (nitrogen >= 0.2))
+
+        # Each death drops a food particle (or nutrient) where the cell was, if it is inside the dish
+        dying = np.flatnonzero(dead)
+        if len(dying):
+            distance = np.sqrt((x[dying] - self.center[0]) ** 2 + (y[dying] - self.center[1]) ** 2)
+            inside = dying[distance <= self.radius]
+            if self.nutrients is not None:
+                self.nutrients.deposit(x[inside], y[inside])
+            else:
+                self.food.add_many(x[inside].tolist(), y[inside].tolist())
+            store.alive[dying] = False
+            for slot in dying.tolist():
+                self.colonies.detach(self.cells[slot])
+                self.stats.remove(self.cells[slot].id)
+            self.stats.deaths += len(dying)
+            self.pending_removals += len(dying)
+            if not self.updating:
+                self.sweep()
+
+        views = self.cells[:count]
+        for slot in np.flatnonzero(dividing).tolist():
+            self.add_offspring(views[slot], views[slot].divide())
+
+    def _clamp_to_boundary(self, x, y, size):
+        cx, cy = self.center
+        distance = np.sqrt((x - cx) ** 2 + (y - cy) ** 2)
+        outside = distance > self.radius - size / 2
+        if outside.any():
+            angle = np.arctan2(cy - y[outside], cx - x[outside])
+            reach = self.radius - size[outside] / 2
+            x[outside] = cx + np.cos(angle) * reach
+            y[outside] = cy + np.sin(angle) * reach
+
+    def resolve_boundary_collisions(self):
+        store = self.store
+        self._clamp_to_boundary(store.view('x'), store.view('y'), store.view('gene_size'))
+
+    def rebuild_grid(self):
+        # Dead slots stay in the grid until the sweep; callers skip them
+        store = self.store
+        self.grid.build(store.view('x').tolist(), store.view('y').tolist(),
+                        store.view('gene_size').tolist(), list(self.cells))
+
+    def feed_cells(self):
+        if not len(self.food):
+            return
+        store = self.store
+        xs = store.view('x').tolist()
+        ys = store.view('y').tolist()
+        sizes = store.view('gene_size').tolist()
+        alive = store.view('alive').tolist()
+        fed = []
+        portions = []
+        for slot in range(store.count):
+            if not alive[slot]:
+                continue
+            eaten = self.food.query_radius(xs[slot], ys[slot], sizes[slot])
+            if eaten:
+                fed.append(slot)
+                portions.append(5 * len(eaten))
+                self.food.remove_many(eaten)
+        if fed:
+            store.energy[fed] += portions
+            store.last_eaten[fed] = self.current_time
+
+    def absorb_nutrients(self, dt):
+        store = self.store
+        alive = np.flatnonzero(store.view('alive'))
+        if not len(alive):
+            return
+        taken = self.nutrients.absorb(store.x[alive], store.y[alive], store.gene_size[alive], dt)
+        store.energy[alive] += taken
+        store.last_eaten[alive[taken > 0]] = self.current_time
+
+    def energies(self):
+        return self.store.view('energy').tolist()
+
+    def motion_bounds(self):
+        if not self.store.count:
+            return 0.0, 0.0
+        return float(self.store.view('gene_speed').max()), float(self.store.view('gene_size').min())
+
+    def cell_states(self):
+        # Read the columns in bulk instead of going through every view's properties
+        v = self.store.view
+        genes = {gene: v('gene_' + gene).tolist() for gene in NUMERIC_GENES + FLAG_GENES}
+        genes['color'] = [tuple(color) for color in v('gene_color').tolist()]
+        gene_rows = zip(*(genes[gene] for gene in GENE_ORDER))
+        return [
+            CellState(view.id, view.type, position, angle, energy, age, nitrogen, adhesin, view.dna,
+                      GenomeState(dict(zip(GENE_ORDER, row)), never_consume))
+            for view, position, angle, energy, age, nitrogen, adhesin, never_consume, row in zip(
+                self.cells, zip(v('x').tolist(), v('y').tolist()), v('angle').tolist(), v('energy').tolist(),
+                v('age').tolist(), v('nitrogen').tolist(), v('adhesin').tolist(), v('never_consume').tolist(),
+                gene_rows)
+        ]
+
+    def checkpoint(self):
+        # Copies of the used part of every column plus what the views hold
+        store = self.store
+        index = {id(view): i for i, view in enumerate(self.cells)}
+        views = [(view.id, view.dna, view.type,
+                  [index[id(other)] for other in view.adhered_cells if id(other) in index]) for view in self.cells]
+        columns = {name: store.view(name).copy() for name in store.columns}
+        rng_state = None if self.rng is None else self.rng.bit_generator.state
+        return columns, views, self.food.copy(), self.current_time, rng_state
+
+    def checkpoint_size(self, state):
+        columns, views, food, _, _ = state
+        return sum(column.nbytes for column in columns.values()) + len(views) * VIEW_BYTES + len(food) * FOOD_BYTES
+
+    def restore(self, state):
+        columns, views, food, current_time, rng_state = state
+        store = self.store
+        count = len(views)
+        if count > store.capacity:
+            store._grow(count)
+        for name, column in columns.items():
+            store.columns[name][:count] = column
+        store.count = count
+
+        restored = []
+        for slot, (cell_id, dna, cell_type, _) in enumerate(views):
+            view = CellView.__new__(CellView)
+            view._store = store
+            view._slot = slot
+            view.id = cell_id
+            view.genome = GenomeView(view)
+            view.dna = dna
+            view.type = cell_type
+            restored.append(view)
+        for view, (_, _, _, adhered) in zip(restored, views):
+            view.adhered_cells = {restored[i]: None for i in adhered}
+        self.colonies.rebuild(restored)
+        self.cells = restored
+        self.food = food.copy()
+        self.current_time = current_time
+        self.pending_removals = 0
+        self.stats.rebuild(restored)
+        if rng_state is not None:
+            self.rng.bit_generator.state = rng_state